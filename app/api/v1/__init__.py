@@ -14,6 +14,8 @@ from app.api.v1.routes.submission import router as submission_router
 from app.api.v1.routes.retake import router as retake_router
 from app.api.v1.routes.verify import router as verify_router
 from app.api.v1.routes.shortener import router as shortener_router
+from app.api.v1.routes.leaderboard import router as leaderboard_router
+from app.api.v1.routes.analytics import router as analytics_router
 from app.core.security import (
     is_authenticated,
     is_aio,
@@ -54,6 +56,11 @@ router.include_router(whitelist_router,
                       prefix="/whitelist",
                       tags=["Whitelist"])
 
+router.include_router(analytics_router,
+                      dependencies=[Depends(is_admin)],
+                      prefix="/analytics",
+                      tags=["Analytics"])
+
 
 # Dev (admin only) Routes
 if settings.ENV_TYPE == "development":
@@ -96,6 +103,11 @@ router.include_router(submission_router,
                       prefix="/submission",
                       tags=["Submission"])
 
+router.include_router(leaderboard_router,
+                      dependencies=AIO_DEPENDENCIES,
+                      prefix="/leaderboard",
+                      tags=["Leaderboard"])
+
 router.include_router(meeting_router,
                       dependencies=AIO_DEPENDENCIES,
                       prefix="/meeting",
@@ -0,0 +1,216 @@
+import traceback
+from datetime import datetime, UTC
+import numpy as np
+from app.utils import MessageException, Logger
+from fastapi import status
+from app.core.database import mongo_db
+from app.core.cache import ReadThroughCache, cache_backend, get_exam_doc
+from bson.objectid import ObjectId
+
+logger = Logger("controllers/analytics", log_file="analytics.log")
+
+submission_collection = mongo_db["submissions"]
+timer_collection = mongo_db["timer"]
+exam_collection = mongo_db["exams"]
+contest_collection = mongo_db["contests"]
+
+HISTOGRAM_BINS = 10
+PERCENTILES = [25, 50, 75, 90]
+# Safety net for changes that do not go through update_submission
+ANALYTICS_CACHE_TTL = 300
+ANALYTICS_CACHE_SIZE = 256
+
+# exam_id / contest_id -> analytics, invalidated in every worker on new submissions
+exam_analytics_cache = ReadThroughCache("exam_analytics",
+                                        maxsize=ANALYTICS_CACHE_SIZE,
+                                        ttl=ANALYTICS_CACHE_TTL,
+                                        backend=cache_backend)
+contest_analytics_cache = ReadThroughCache("contest_analytics",
+                                           maxsize=ANALYTICS_CACHE_SIZE,
+                                           ttl=ANALYTICS_CACHE_TTL,
+                                           backend=cache_backend)
+
+
+async def invalidate_analytics(exam_id: str | ObjectId) -> None:
+    """
+    Drop the cached analytics of the exam and of its contest
+    :param exam_id: str | ObjectId
+    """
+    exam_analytics_cache.invalidate(str(exam_id))
+    try:
+        exam = await get_exam_doc(exam_id)
+    except:
+        logger.error(f"{traceback.format_exc()}")
+        exam = None
+    if exam and exam.get("contest_id"):
+        contest_analytics_cache.invalidate(str(exam["contest_id"]))
+    else:
+        contest_analytics_cache.clear()
+
+
+# helper
+def parse_start_time(start_time: str) -> datetime | None:
+    try:
+        start_time = datetime.fromisoformat(start_time)
+    except (TypeError, ValueError):
+        return None
+    if start_time.tzinfo is None:
+        start_time = start_time.replace(tzinfo=UTC)
+    return start_time
+
+
+def percentiles_helper(values: np.ndarray) -> dict:
+    if values.size == 0:
+        return {f"p{q}": None for q in PERCENTILES}
+    return {
+        f"p{q}": round(float(value), 2)
+        for q, value in zip(PERCENTILES, np.percentile(values, PERCENTILES))
+    }
+
+
+def summary_helper(values: np.ndarray) -> dict:
+    return {
+        "mean": round(float(values.mean()), 2) if values.size else None,
+        "min": round(float(values.min()), 2) if values.size else None,
+        "max": round(float(values.max()), 2) if values.size else None,
+        **percentiles_helper(values)
+    }
+
+
+async def compute_analytics(exam_ids: list) -> dict:
+    """
+    Compute the analytics of the submissions of the given exams.
+    Only the fields needed are projected, no $lookup is done.
+    :param exam_ids: list of ObjectId
+    :return: dict
+    """
+    scores = []
+    attempts = {}
+    submit_times = {}
+    problems = {}
+    cursor = submission_collection.find(
+        {"exam_id": {"$in": exam_ids}, "submitted_problems": {"$ne": None}},
+        {
+            "_id": 0,
+            "exam_id": 1,
+            "clerk_user_id": 1,
+            "retake_id": 1,
+            "total_score": 1,
+            "max_score": 1,
+            "created_at": 1,
+            "submitted_problems.problem_id": 1,
+            "submitted_problems.title": 1,
+            "submitted_problems.is_pass_problem": 1
+        }
+    )
+    async for submission in cursor:
+        max_score = submission.get("max_score") or 0
+        scores.append(
+            submission.get("total_score", 0) / max_score * 100 if max_score > 0 else 0
+        )
+        attempts[submission["clerk_user_id"]] = attempts.get(submission["clerk_user_id"], 0) + 1
+        timer_key = (submission["exam_id"], submission["clerk_user_id"], submission.get("retake_id"))
+        submit_times[timer_key] = submission["created_at"]
+
+        for problem in submission["submitted_problems"]:
+            problem_stats = problems.setdefault(problem["problem_id"], {
+                "problem_id": problem["problem_id"],
+                "title": problem.get("title"),
+                "passed": 0,
+                "total": 0
+            })
+            problem_stats["total"] += 1
+            problem_stats["passed"] += int(bool(problem.get("is_pass_problem")))
+
+    durations = []
+    if submit_times:
+        async for timer in timer_collection.find(
+            {"exam_id": {"$in": exam_ids}},
+            {"_id": 0, "exam_id": 1, "clerk_user_id": 1, "retake_id": 1, "start_time": 1}
+        ):
+            timer_key = (timer["exam_id"], timer["clerk_user_id"], timer.get("retake_id"))
+            start_time = parse_start_time(timer["start_time"])
+            if timer_key not in submit_times or start_time is None:
+                continue
+            created_at = submit_times[timer_key]
+            if created_at.tzinfo is None:
+                created_at = created_at.replace(tzinfo=UTC)
+            durations.append((created_at - start_time).total_seconds())
+
+    scores = np.asarray(scores, dtype=float)
+    attempts = np.asarray(list(attempts.values()), dtype=float)
+    durations = np.asarray(durations, dtype=float)
+    durations = durations[durations >= 0]
+
+    counts, edges = np.histogram(scores, bins=HISTOGRAM_BINS, range=(0, 100))
+    histogram = [
+        {"from": float(edges[i]), "to": float(edges[i + 1]), "count": int(counts[i])}
+        for i in range(HISTOGRAM_BINS)
+    ]
+    problem_stats = []
+    for problem in problems.values():
+        problem["pass_rate"] = round(problem["passed"] / problem["total"], 4)
+        problem_stats.append(problem)
+
+    return {
+        "total_submissions": int(scores.size),
+        "total_users": int(attempts.size),
+        "score_percent": summary_helper(scores),
+        "score_histogram": histogram,
+        "average_attempts": round(float(attempts.mean()), 2) if attempts.size else None,
+        "time_to_submit_seconds": summary_helper(durations),
+        "problems": sorted(problem_stats, key=lambda problem: problem["pass_rate"]),
+    }
+
+
+async def load_analytics(kind: str, id: str) -> dict | None:
+    """
+    :param kind: str, "exam" | "contest"
+    :param id: str
+    :return: dict, None when the exam or the contest does not exist
+    """
+    if kind == "exam":
+        exam = await exam_collection.find_one({"_id": ObjectId(id)}, {"_id": 1})
+        if not exam:
+            return None
+        exam_ids = [exam["_id"]]
+    else:
+        contest = await contest_collection.find_one({"_id": ObjectId(id)}, {"_id": 1})
+        if not contest:
+            return None
+        exam_ids = [exam["_id"] async for exam in
+                    exam_collection.find({"contest_id": ObjectId(id)}, {"_id": 1})]
+
+    analytics = await compute_analytics(exam_ids)
+    return {
+        f"{kind}_id": id,
+        "exam_ids": [str(exam_id) for exam_id in exam_ids],
+        **analytics,
+        "computed_at": datetime.now(UTC).isoformat()
+    }
+
+
+async def retrieve_analytics(kind: str, id: str, refresh: bool = False) -> dict | MessageException:
+    """
+    Retrieve the analytics of an exam or a contest (all its exams)
+    :param kind: str, "exam" | "contest"
+    :param id: str
+    :param refresh: bool, ignore the cached analytics
+    :return: dict
+    """
+    try:
+        not_found = MessageException(f"{kind.capitalize()} not found",
+                                     status.HTTP_404_NOT_FOUND)
+        if not ObjectId.is_valid(id):
+            return not_found
+        cache = exam_analytics_cache if kind == "exam" else contest_analytics_cache
+        if refresh:
+            cache.invalidate(id)
+        analytics = await cache.get(id, lambda: load_analytics(kind, id))
+        if analytics is None:
+            return not_found
+        return analytics
+    except:
+        logger.error(f"{traceback.format_exc()}")
+        return MessageException("Error when retrieve analytics",
+                                status.HTTP_500_INTERNAL_SERVER_ERROR)
@@ -1,19 +1,17 @@
 import traceback
 from datetime import datetime, UTC
 from fastapi import status
-from app.utils import utc_to_local, MessageException, Logger
-from app.core.database import mongo_client, mongo_db
+from app.utils import utc_to_local, MessageException, Logger, is_duplicate_key
+from app.core.database import mongo_db
+from app.core.transactions import run_transaction
 from bson.objectid import ObjectId
+from pymongo.errors import BulkWriteError
 from app.schemas.attendee import AttendeeSchemaDB
 from app.api.v1.controllers.user import user_helper
 
 logger = Logger("controllers/attendee", log_file="attendee.log")
-try:
-    attendee_collection = mongo_db["attendees"]
-    user_collection = mongo_db["users"]
-except Exception as e:
-    logger.error(f"Error when connect to collection: {e}")
-    exit(1)
+attendee_collection = mongo_db["attendees"]
+user_collection = mongo_db["users"]
 
 
 # helper
@@ -48,15 +46,11 @@ async def add_attendees(meeting_id, attendee_ids, attendee_emails) -> list[str]:
             ).to_list(length=None)
             attendee_ids.extend([user["attend_id"] for user in user_info])
 
-        current_attendees = await retrieve_attendees_by_meeting_id(meeting_id)
-        current_attendees = [attendee["attend_id"] for attendee in current_attendees]
-        new_attendees = [attendee_id for attendee_id in attendee_ids if attendee_id not in current_attendees]
-       
         attendee_data = []
-        for attendee_ids in new_attendees:
+        for attend_id in dict.fromkeys(attendee_ids):
             attendee_db = AttendeeSchemaDB(
                 meeting_id=meeting_id,
-                attend_id=attendee_ids,
+                attend_id=attend_id,
                 created_at=datetime.now(UTC),
                 updated_at=datetime.now(UTC)
             ).model_dump()
@@ -65,8 +59,18 @@ async def add_attendees(meeting_id, attendee_ids, attendee_emails) -> list[str]:
 
         if len(attendee_data) == 0:
             return []
-        new_attendees = await attendee_collection.insert_many(attendee_data)
-        return [str(attendee) for attendee in new_attendees.inserted_ids]
+        # The current attendees of the meeting are skipped by the unique
+        # index (meeting_id, attend_id), the others are still inserted
+        try:
+            new_attendees = await attendee_collection.insert_many(attendee_data, ordered=False)
+            return [str(attendee) for attendee in new_attendees.inserted_ids]
+        except BulkWriteError as e:
+            write_errors = e.details["writeErrors"]
+            if not all(is_duplicate_key(error) for error in write_errors):
+                raise
+            skipped = {error["index"] for error in write_errors}
+            return [str(attendee["_id"]) for index, attendee in enumerate(attendee_data)
+                    if index not in skipped]
     except:
         logger.error(f"{traceback.format_exc()}")
         return MessageException("Add attendees failed",
@@ -123,34 +127,36 @@ async def delete_attendees_by_emails(meeting_id: str, emails: list[str]) -> bool
 
     :return: bool
     """
-    async with await mongo_client.start_session() as session:
-        try:
-            async with session.start_transaction():
-                user_info = await user_collection.find(
-                    {"email": {"$in": emails}},
-                    {"attend_id": 1}
-                ).to_list(length=None)
-                attendee_ids = [user["attend_id"] for user in user_info]
-
-                if len(emails) != len(attendee_ids):
-                    raise MessageException("Some emails not found", 
-                                           status.HTTP_404_NOT_FOUND)
-
-                result = await attendee_collection.delete_many(
-                    {
-                        "meeting_id": ObjectId(meeting_id),
-                        "attend_id": {"$in": attendee_ids}
-                    }
-                )
-                if result.deleted_count != len(attendee_ids):
-                    raise MessageException("Delete attendees failed",
-                                           status.HTTP_500_INTERNAL_SERVER_ERROR)
-        except MessageException as e:
-            return e
-        except:
-            logger.error(f"{traceback.format_exc()}")
-            return MessageException("Error when delete attendees", 
-                                    status.HTTP_500_INTERNAL_SERVER_ERROR)
-        else: 
-            logger.info(f"Deleted attendees by emails: {emails}")
-            return True
\ No newline at end of file
+    try:
+        user_info = await user_collection.find(
+            {"email": {"$in": emails}},
+            {"attend_id": 1}
+        ).to_list(length=None)
+        attendee_ids = [user["attend_id"] for user in user_info]
+
+        if len(emails) != len(attendee_ids):
+            raise MessageException("Some emails not found", 
+                                   status.HTTP_404_NOT_FOUND)
+
+        # A single delete_many, no transaction needed
+        async def delete(session):
+            return await attendee_collection.delete_many(
+                {
+                    "meeting_id": ObjectId(meeting_id),
+                    "attend_id": {"$in": attendee_ids}
+                },
+                session=session
+            )
+
+        result = await run_transaction("delete_attendees", delete, atomic=False)
+        if result.deleted_count != len(attendee_ids):
+            raise MessageException("Delete attendees failed",
+                                   status.HTTP_500_INTERNAL_SERVER_ERROR)
+    except MessageException as e:
+        return e
+    except:
+        logger.error(f"{traceback.format_exc()}")
+        return MessageException("Error when delete attendees", 
+                                status.HTTP_500_INTERNAL_SERVER_ERROR)
+    logger.info(f"Deleted attendees by emails: {emails}")
+    return True
\ No newline at end of file
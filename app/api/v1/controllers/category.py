@@ -3,14 +3,11 @@ from app.utils import utc_to_local, MessageException, Logger
 from fastapi import status
 from bson.objectid import ObjectId
 from app.core.database import mongo_db
+from app.core.persistence import insert_document
 
 logger = Logger("controllers/category", log_file="category.log")
 
-try:
-    category_collection = mongo_db["categories"]
-except Exception as e:
-    logger.error(f"Error when connect to collection: {e}")
-    exit(1)
+category_collection = mongo_db["categories"]
 
 # category helper
 def category_helper(category) -> dict:
@@ -28,10 +25,7 @@ async def add_category(category_data: dict) -> dict:
     :return: dict
     """
     try:
-        category = await category_collection.insert_one(category_data)
-        new_category = await category_collection.find_one(
-            {"_id": category.inserted_id}
-        )
+        new_category = await insert_document(category_collection, category_data)
         return category_helper(new_category)
     except:
         logger.error(f"{traceback.format_exc()}")
@@ -55,6 +49,32 @@ async def retrieve_categories() -> list:
                                 status.HTTP_500_INTERNAL_SERVER_ERROR)
 
 
+async def retrieve_categories_version() -> dict | MessageException:
+    """
+    Version of the categories: count and latest updated_at,
+    changed by every insert, update and delete
+    :return: dict
+    """
+    try:
+        pipeline = [
+            {
+                "$group": {
+                    "_id": None,
+                    "count": {"$sum": 1},
+                    "updated_at": {"$max": "$updated_at"}
+                }
+            }
+        ]
+        result = await category_collection.aggregate(pipeline).to_list(length=None)
+        if not result:
+            return {"count": 0, "updated_at": None}
+        return {"count": result[0]["count"], "updated_at": result[0]["updated_at"]}
+    except:
+        logger.error(f"{traceback.format_exc()}")
+        return MessageException("Error when retrieve categories version",
+                                status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+
 async def retrieve_category(id: str) -> dict:
     """
     Retrieve a category with a matching ID
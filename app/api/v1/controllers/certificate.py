@@ -1,17 +1,18 @@
 import traceback
-from app.utils import utc_to_local, MessageException, Logger
+from app.utils import utc_to_local, MessageException, Logger, is_duplicate_key, generate_id
 from fastapi import status
 from app.core.database import mongo_db
+from app.core.persistence import insert_document
 from bson.objectid import ObjectId
+from pymongo.errors import DuplicateKeyError
 
 
 logger = Logger("controllers/certificate", log_file="certificate.log")
 
-try:
-    certificate_collection = mongo_db["certificate"]
-except Exception as e:
-    logger.error(f"Error when connect to collection: {e}")
-    exit(1)
+certificate_collection = mongo_db["certificate"]
+
+# Inserts tried with a new validation_id when the previous one is taken
+VALIDATION_ID_ATTEMPTS = 5
 
 
 # helper
@@ -34,17 +35,31 @@ async def add_certificate(certificate_data: dict, error_dict=False) -> dict:
     :return: dict
     """
     try:
-        # Check the certificate is exist
-        certificate = await certificate_collection.find_one({
-            "submission_id": certificate_data["submission_id"],
-            "clerk_user_id": certificate_data["clerk_user_id"]
-        })
-        if certificate:
-            return certificate_helper(certificate)
-        
-        certificate = await certificate_collection.insert_one(certificate_data)
-        new_certificate = await certificate_collection.find_one({"_id": certificate.inserted_id})
-        return certificate_helper(new_certificate)
+        for _ in range(VALIDATION_ID_ATTEMPTS):
+            try:
+                new_certificate = await insert_document(certificate_collection, certificate_data)
+                return certificate_helper(new_certificate)
+            except DuplicateKeyError as e:
+                if is_duplicate_key(e, "validation_id"):
+                    certificate_data["validation_id"] = generate_id()
+                    continue
+                if not is_duplicate_key(e, "submission_id"):
+                    raise
+                # One certificate per submission, the existing one is returned
+                certificate = await certificate_collection.find_one({
+                    "submission_id": certificate_data["submission_id"]
+                })
+                return certificate_helper(certificate)
+        raise MessageException("No free validation_id",
+                               status.HTTP_500_INTERNAL_SERVER_ERROR)
+    except MessageException as e:
+        logger.error(f"{e.message}")
+        if error_dict:
+            return {
+                "message": e.message,
+                "status_code": e.status_code
+            }
+        return e
     except:
         logger.error(f"{traceback.format_exc()}")
         msg = "Error when add certificate"
@@ -57,6 +72,30 @@ async def add_certificate(certificate_data: dict, error_dict=False) -> dict:
         return MessageException(msg, status_code)
     
 
+async def allocate_validation_ids(count: int) -> list[str]:
+    """
+    Validation ids used by no certificate, for a batch of certificates:
+    one query per round of candidates instead of one per id. The ids are
+    not reserved, add_certificate still retries on the unique index.
+    :param count: int
+    :return: list[str]
+    """
+    try:
+        validation_ids = set()
+        while len(validation_ids) < count:
+            candidates = {generate_id() for _ in range(count - len(validation_ids))}
+            candidates -= validation_ids
+            taken = await certificate_collection.distinct(
+                "validation_id", {"validation_id": {"$in": list(candidates)}}
+            )
+            validation_ids |= candidates - set(taken)
+        return list(validation_ids)
+    except:
+        logger.error(f"{traceback.format_exc()}")
+        return MessageException("Error when allocate validation ids",
+                                status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+
 async def retrieve_certificates() -> list[dict]:
     """
     Retrieve all certificates in database
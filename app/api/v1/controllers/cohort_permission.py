@@ -1,6 +1,8 @@
 import traceback
 from fastapi import status
 from app.core.database import mongo_db
+from app.core.cache import get_contest_doc
+from app.core.cohort_index import contest_index, meeting_index
 from bson.objectid import ObjectId
 from app.utils.logger import Logger
 from app.utils import (
@@ -9,36 +11,49 @@ from app.utils import (
 )
 
 logger = Logger("controllers/cohort_permission", log_file="cohort_permission.log")
-try:
-    user_collection = mongo_db["users"]
-    meeting_collection = mongo_db["meetings"]
-    contest_collection = mongo_db["contests"]
-except Exception as e:
-    logger.error(f"Error when connect to collection: {e}")
-    exit(1)
+user_collection = mongo_db["users"]
+meeting_collection = mongo_db["meetings"]
+contest_collection = mongo_db["contests"]
+
+
+async def resolve_user(user: str | dict) -> dict:
+    """
+    Return the user document of a principal, the user dict loaded by
+    the security dependency is used as is (no database lookup)
+    :param user: str (clerk_user_id) | dict (user info)
+    :return: dict
+    """
+    if isinstance(user, dict):
+        return user
+    user_info = await user_collection.find_one({"clerk_user_id": user})
+    if not user_info:
+        raise MessageException("User not found",
+                               status.HTTP_404_NOT_FOUND)
+    return user_info
 
 
 async def is_contest_permission(id: str | ObjectId, 
-                                clerk_user_id: str,
+                                user: str | dict,
                                 return_item: bool = False
                                 ) -> bool | tuple | MessageException:
     """
-    Check if the user has permission to access the contest
+    Check if the user has permission to access the contest, from the
+    cohort index unless the contest itself is returned
     :param id: str | ObjectId
-    :param clerk_user_id: str
+    :param user: str (clerk_user_id) | dict (user info)
     :return: bool
     """
     try:
         permission = False
-        user_info = await user_collection.find_one({"clerk_user_id": clerk_user_id})
-        if not user_info:
-            raise MessageException("User not found",
-                                   status.HTTP_404_NOT_FOUND)
+        user_info = await resolve_user(user)
         user_cohort = user_info["cohort"]
+        if not return_item:
+            # limit permission by the main cohort of the user
+            visible = await contest_index.is_visible(id, user_cohort, [user_cohort])
+            if visible is not None:
+                return visible
 
-        if not isinstance(id, ObjectId):
-            id = ObjectId(id)
-        contest = await contest_collection.find_one({"_id": id})
+        contest = await get_contest_doc(id)
         if not contest:
             raise MessageException("Contest not found",
                                    status.HTTP_404_NOT_FOUND)
@@ -57,23 +72,27 @@ async def is_contest_permission(id: str | ObjectId,
 
 
 async def is_meeting_permission(query_params: dict,
-                                clerk_user_id: str,
+                                user: str | dict,
                                 return_item: bool = False
                                 ) -> bool | tuple | MessageException:
     """
-    Check if the user has permission to access the meeting
-    :param id: str | ObjectId
-    :param clerk_user_id: str
+    Check if the user has permission to access the meeting, from the
+    cohort index for a query by _id when the meeting is not returned
+    :param query_params: dict
+    :param user: str (clerk_user_id) | dict (user info)
     :return: bool
     """
     try:
         permission = False
-        user_info = await user_collection.find_one({"clerk_user_id": clerk_user_id})
-        if not user_info:
-            raise MessageException("User not found",
-                                   status.HTTP_404_NOT_FOUND)
+        user_info = await resolve_user(user)
         user_cohort = user_info["cohort"]
         feasible_cohort = user_info["feasible_cohort"]
+        if not return_item and list(query_params) == ["_id"]:
+            visible = await meeting_index.is_visible(query_params["_id"],
+                                                     user_cohort,
+                                                     feasible_cohort)
+            if visible is not None:
+                return visible
 
         meeting = await meeting_collection.find_one(query_params)
         if not meeting:
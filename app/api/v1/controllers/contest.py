@@ -1,4 +1,5 @@
 from typing import List
+import asyncio
 import traceback
 from app.utils import (
     MessageException,
@@ -7,18 +8,25 @@ from app.utils import (
     is_cohort_permission
 )
 from fastapi import status
+from app.core.config import settings
 from app.core.database import mongo_db
+from app.core.persistence import insert_document
+from app.core.cascade import cascade_delete, on_delete
 from bson.objectid import ObjectId
-from app.api.v1.controllers.cohort_permission import is_contest_permission
+from pymongo.errors import DuplicateKeyError
+from app.api.v1.controllers.cohort_permission import (
+    is_contest_permission,
+    resolve_user
+)
 from app.api.v1.controllers.exam import (
     retrieve_exams_by_contest,
-    delete_all_by_contest_id
+    retrieve_exams_by_contests
 )
 from app.api.v1.controllers.exam_problem import (
-    retrieve_by_exam_id
+    retrieve_by_exam_ids
 )
 from app.api.v1.controllers.retake import (
-    retrieve_retakes_by_user_exam_id
+    retrieve_retakes_by_user_exam_ids
 )
 from app.api.v1.controllers.run_code import (
     run_testcases
@@ -26,6 +34,8 @@ from app.api.v1.controllers.run_code import (
 from app.api.v1.controllers.problem import (
     retrieve_problem
 )
+from app.core.cache import invalidate_contest
+from app.core.cohort_index import contest_index
 from app.schemas.submission import (
     SubmittedProblem,
     SubmittedResult,
@@ -33,22 +43,36 @@ from app.schemas.submission import (
 
 logger = Logger("controllers/contest", log_file="contest.log")
 
-try:
-    contest_collection = mongo_db["contests"]
-    exam_collection = mongo_db["exams"]
-    user_collection = mongo_db["users"]
-except Exception as e:
-    logger.error(f"Error when connect to collection: {e}")
-    exit(1)
+contest_collection = mongo_db["contests"]
+exam_collection = mongo_db["exams"]
+user_collection = mongo_db["users"]
+
+
+def invalidate_deleted_contests(ids: list) -> None:
+    for id in ids:
+        invalidate_contest(id)
+        contest_index.invalidate(id)
+
+on_delete("contests", invalidate_deleted_contests)
+
+
+# Contests embedded in the lists, read without their texts
+CONTEST_SUMMARY_PROJECTION = {"description": 0, "instruction": 0}
 
 
 # helper
 def contest_helper(contest) -> dict:
     return {
-        "id": str(contest["_id"]),
-        "title": contest["title"],
+        **contest_summary_helper(contest),
         "description": contest["description"],
         "instruction": contest["instruction"],
+    }
+
+# helper of the contests read with CONTEST_SUMMARY_PROJECTION
+def contest_summary_helper(contest) -> dict:
+    return {
+        "id": str(contest["_id"]),
+        "title": contest["title"],
         "is_active": contest["is_active"],
         "cohorts": contest["cohorts"],
         "certificate_template": contest["certificate_template"],
@@ -59,6 +83,58 @@ def contest_helper(contest) -> dict:
     }
 
 
+def contest_detail_helper(contest: dict,
+                          exams: list,
+                          exam_problems: dict,
+                          retakes: list) -> dict:
+    """
+    Attach the exams (with their problems) to a contest, and the exam
+    available for the user: the exam of the newest retake, else the first exam
+    :param contest: dict, contest_helper(contest)
+    :param exams: list, exam_helper(exam) of the contest
+    :param exam_problems: dict, exam_id -> list of exam_problem_helper(exam_problem)
+    :param retakes: list, retake_helper(retake) of the user for these exams
+    :return: dict
+    """
+    for exam in exams:
+        exam["problems"] = exam_problems.get(exam["id"], [])
+    contest["exams"] = exams
+
+    if not exams:
+        contest["available_exam"] = None
+        contest["retake_id"] = None
+    # Exist retake
+    elif retakes:
+        newest_retake = max(retakes, key=lambda x: x["created_at"])
+        newest_exam_id = newest_retake["exam_id"]
+        contest["available_exam"] = next((exam for exam in exams if exam["id"] == newest_exam_id), None)
+        contest["retake_id"] = newest_retake["id"]
+    # No retake
+    else:
+        contest["retake_id"] = None
+        contest["available_exam"] = exams[0]
+    return contest
+
+
+async def retrieve_exam_details(clerk_user_id: str, exam_ids: list) -> tuple:
+    """
+    Retrieve the problems and the user retakes of many exams, one query each
+    :param clerk_user_id: str
+    :param exam_ids: list of str
+    :return: tuple, (exam_id -> list of exam_problems, list of retakes)
+    """
+    if not exam_ids:
+        return {}, []
+    exam_problems, retakes = await asyncio.gather(
+        retrieve_by_exam_ids(exam_ids),
+        retrieve_retakes_by_user_exam_ids(clerk_user_id, exam_ids)
+    )
+    for result in [exam_problems, retakes]:
+        if isinstance(result, MessageException):
+            raise result
+    return exam_problems, retakes
+
+
 async def add_contest(contest_data: dict) -> dict:
     """
     Create a new contest
@@ -66,9 +142,12 @@ async def add_contest(contest_data: dict) -> dict:
     :return: dict
     """
     try:
-        contest = await contest_collection.insert_one(contest_data)
-        new_contest = await contest_collection.find_one({"_id": contest.inserted_id})
+        new_contest = await insert_document(contest_collection, contest_data)
+        contest_index.invalidate(new_contest["_id"])
         return contest_helper(new_contest)
+    except DuplicateKeyError:
+        return MessageException("The title already exists.",
+                                status.HTTP_400_BAD_REQUEST)
     except:
         logger.error(f"{traceback.format_exc()}")
         return MessageException("Error when add contest",
@@ -93,50 +172,66 @@ async def retrieve_contests() -> list[dict]:
                                 status.HTTP_500_INTERNAL_SERVER_ERROR)
 
 
-async def retrieve_available_contests(clerk_user_id: str) -> list | MessageException:
+async def retrieve_available_contests(user: str | dict) -> list | MessageException:
     """
     Retrieve all available contests
+    :param user: str (clerk_user_id) | dict (user info)
     :return: list[dict]
     """
     try:
-        user_info = await user_collection.find_one({"clerk_user_id": clerk_user_id})
-        feasible_cohort = user_info["feasible_cohort"]
-        cohort_matchs = [
-            { "cohorts": { "$exists": False } },
-            { "cohorts": None },
-            { "cohorts": { "$in": feasible_cohort } }
-        ]
-        pipeline = [
-            {
-                "$match": {
-                    "is_active": True,
-                    "$or": cohort_matchs
-                }
-            }
-        ]
-        result = await contest_collection.aggregate(pipeline).to_list(length=None)
+        user_info = await resolve_user(user)
+        user_cohort = user_info["cohort"]
+        if user_cohort is None:
+            return []
+        feasible_cohort = user_info["feasible_cohort"] or []
+        contest_ids = await contest_index.visible_ids(feasible_cohort)
+        # limit permission by the main cohort of the user
+        if user_cohort != settings.ADMIN_COHORT:
+            contest_ids &= await contest_index.visible_ids([user_cohort])
+        if not contest_ids:
+            return []
+        result = await contest_collection.find(
+            {"_id": {"$in": list(contest_ids)}, "is_active": True}
+        ).to_list(length=None)
+        if not result:
+            return []
+
+        # The exams, problems and retakes of all contests are read at once
+        all_exam = await retrieve_exams_by_contests([contest["_id"] for contest in result])
+        if isinstance(all_exam, MessageException):
+            return all_exam
+        exam_ids = [exam["id"] for exams in all_exam.values() for exam in exams]
+        exam_problems, retakes = await retrieve_exam_details(user_info["clerk_user_id"], exam_ids)
+
+        retakes_by_exam = {}
+        for retake in retakes:
+            retakes_by_exam.setdefault(retake["exam_id"], []).append(retake)
 
         contests = []
         for contest in result:
-            contest_detail = await retrieve_contest_detail(contest["_id"], clerk_user_id)
-            if isinstance(contest_detail, MessageException):
-                continue
-            contests.append(contest_detail)
+            exams = all_exam.get(str(contest["_id"]), [])
+            contest_retakes = [retake for exam in exams
+                               for retake in retakes_by_exam.get(exam["id"], [])]
+            contests.append(
+                contest_detail_helper(contest_helper(contest), exams, exam_problems, contest_retakes)
+            )
         return contests
+    except MessageException as e:
+        return e
     except:
         logger.error(f"{traceback.format_exc()}")
         return MessageException("Error when retrieve contests",
                                 status.HTTP_500_INTERNAL_SERVER_ERROR)
 
 
-async def retrieve_contest(id: str, clerk_user_id: str) -> dict:
+async def retrieve_contest(id: str, user: str | dict) -> dict:
     """
     Retrieve a contest with a matching ID
     :param contest_id: str
     :return: dict
     """
     try:
-        contest_permission = await is_contest_permission(id, clerk_user_id, return_item=True)
+        contest_permission = await is_contest_permission(id, user, return_item=True)
         if isinstance(contest_permission, MessageException):
             return contest_permission
         contest, permission = contest_permission
@@ -153,7 +248,7 @@ async def retrieve_contest(id: str, clerk_user_id: str) -> dict:
 
 
 async def retrieve_contest_by_slug(slug: str, 
-                                   clerk_user_id: str
+                                   user: str | dict
                                    ) -> dict | MessageException:
     """
     Retrieve a contest with a matching slug
@@ -161,10 +256,7 @@ async def retrieve_contest_by_slug(slug: str,
     :return: dict
     """
     try:
-        user_info = await user_collection.find_one({"clerk_user_id": clerk_user_id})
-        if not user_info:
-            raise MessageException("User not found", 
-                                   status.HTTP_404_NOT_FOUND)
+        user_info = await resolve_user(user)
         contest = await contest_collection.find_one({"slug": slug})
         if not contest:
              raise MessageException("Contest not found", 
@@ -184,74 +276,31 @@ async def retrieve_contest_by_slug(slug: str,
                                 status.HTTP_500_INTERNAL_SERVER_ERROR)
 
 
-async def contest_slug_is_unique(slug: str, is_update = False) -> bool | MessageException:
-    """
-    Check if the slug is unique
-    :param slug: str
-    :return: bool
-    """
-    try:
-        contest = await contest_collection.find_one({"slug": slug})
-        if contest and not is_update:
-            return MessageException("The title already exists.",
-                                    status.HTTP_400_BAD_REQUEST)
-        return True
-    except MessageException as e:
-        return e
-    except:
-        logger.error(f"{traceback.format_exc()}")
-        return MessageException("Error when check slug",
-                                status.HTTP_500_INTERNAL_SERVER_ERROR)
-
-
-async def retrieve_contest_detail(id: str, clerk_user_id: str) -> dict | MessageException:
+async def retrieve_contest_detail(id: str, user: str | dict) -> dict | MessageException:
     """
     Retrieve a contest with a matching contest_id (id),
-    including exams with available for clerk_user_id.
+    including exams with available for the user.
     :param id: str
     :return: list
     """
     try:
-        contest = await retrieve_contest(id, clerk_user_id)
+        clerk_user_id = user["clerk_user_id"] if isinstance(user, dict) else user
+        contest = await retrieve_contest(id, user)
         if isinstance(contest, MessageException):
             return contest
         
         all_exam = await retrieve_exams_by_contest(contest["id"])
         if isinstance(all_exam, MessageException):
             return all_exam
-        
-        if not all_exam:
-            contest["available_exam"] = None
-            contest["retake_id"] = None
-            contest["exams"] = []
-            return contest
-            
-        all_exam_detail = []
-        retake_info = []
-        for exam in all_exam:
-
-            exam_id = exam["id"]
-            exam_problems = await retrieve_by_exam_id(exam_id)
-
-            exam["problems"] = exam_problems
-            all_exam_detail.append(exam)
-
-            retakes = await retrieve_retakes_by_user_exam_id(clerk_user_id, exam_id)
-            retake_info.extend(retakes)
-
-        contest["exams"] = all_exam_detail
-        # Exist retake
-        if retake_info: 
-            newest_retake = max(retake_info, key=lambda x: x["created_at"])
-            newest_exam_id = newest_retake["exam_id"]
-            contest["available_exam"] = next((exam for exam in all_exam_detail if exam["id"] == newest_exam_id), None)
-            contest["retake_id"] = newest_retake["id"]
-        # No retake
-        else: 
-            contest["retake_id"] = None
-            contest["available_exam"] = all_exam_detail[0]
 
+        exam_problems, retakes = await retrieve_exam_details(
+            clerk_user_id,
+            [exam["id"] for exam in all_exam]
+        )
+        contest = contest_detail_helper(contest, all_exam, exam_problems, retakes)
         return contest
+    except MessageException as e:
+        return e
     except:
         logger.error(f"{traceback.format_exc()}")
         return MessageException("Error when retrieve contest detail",
@@ -276,12 +325,19 @@ async def update_contest(id: str, data: dict) -> bool:
         updated_contest = await contest_collection.update_one(
             {"_id": ObjectId(id)}, {"$set": data}
         )
+        invalidate_contest(id)
+        if "cohorts" in data:
+            contest_index.invalidate(id)
         if updated_contest.modified_count == 0:
             raise MessageException("Update contest failed", 
                                    status.HTTP_400_BAD_REQUEST)
         return True
     except MessageException as e:
         return e
+    except DuplicateKeyError:
+        # Another contest has the slug of the new title
+        return MessageException("The title already exists.",
+                                status.HTTP_409_CONFLICT)
     except:
         logger.error(f"{traceback.format_exc()}")
         return MessageException("Error when update contest",
@@ -290,25 +346,18 @@ async def update_contest(id: str, data: dict) -> bool:
 
 async def delete_contest(id: str) -> bool:
     """
-    Delete a contest with a matching ID
+    Delete a contest with a matching ID, its exams (and everything
+    depending on them) and its leaderboard
     :param id: str
-    :return: bool
+    :return: bool, False when the deletion continues in the background
     """
     try:
-        contest = await contest_collection.find_one({"_id": ObjectId(id)})
+        contest = await contest_collection.find_one({"_id": ObjectId(id)}, {"_id": 1})
         if not contest:
             raise MessageException("Contest not found", 
                                    status.HTTP_404_NOT_FOUND)
-        
-        all_exam = await exam_collection.find({"contest_id": ObjectId(id)}).to_list(length=None)
-        if len(all_exam) > 0:
-            await delete_all_by_contest_id(id)
-
-        deleted_contest = await contest_collection.delete_one({"_id": ObjectId(id)})
-        if deleted_contest.deleted_count == 0:
-            raise MessageException("Delete contest failed", 
-                                   status.HTTP_400_BAD_REQUEST)
-        return True
+        # Exams (and their submissions, ...) and leaderboard
+        return await cascade_delete("contests", [contest["_id"]])
     except MessageException as e:
         return e
     except:
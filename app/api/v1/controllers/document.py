@@ -2,17 +2,14 @@ import traceback
 from app.utils import utc_to_local, MessageException, Logger
 from fastapi import status
 from app.core.database import mongo_db
+from app.core.persistence import insert_document, update_document as update_one_document
 from bson.objectid import ObjectId
 from pymongo import DeleteOne, InsertOne
 from app.api.v1.controllers.cohort_permission import is_meeting_permission
 
 logger = Logger("controllers/document", log_file="document.log")
-try:
-    document_collection = mongo_db["documents"]
-    meeting_collection = mongo_db["meetings"]
-except Exception as e:
-    logger.error(f"Error when connect to collection: {e}")
-    exit(1)
+document_collection = mongo_db["documents"]
+meeting_collection = mongo_db["meetings"]
 
 
 # helper
@@ -38,8 +35,7 @@ async def add_document(document_data: dict) -> dict:
     """
     try:
         document_data["meeting_id"] = ObjectId(document_data["meeting_id"])
-        document = await document_collection.insert_one(document_data)
-        new_document = await document_collection.find_one({"_id": document.inserted_id})
+        new_document = await insert_document(document_collection, document_data)
         return document_helper(new_document)
     except:
         logger.error(f"{traceback.format_exc()}")
@@ -108,7 +104,7 @@ async def retrieve_documents() -> list[dict]:
                                 status.HTTP_500_INTERNAL_SERVER_ERROR)
 
 
-async def retrieve_document_by_id(id: str, clerk_user_id: str) -> dict:
+async def retrieve_document_by_id(id: str, user: str | dict) -> dict:
     """
     Retrieve a document with a matching ID
 
@@ -124,7 +120,7 @@ async def retrieve_document_by_id(id: str, clerk_user_id: str) -> dict:
         query_params = {
             "_id": document["meeting_id"],
         }
-        permission = await is_meeting_permission(query_params, clerk_user_id)
+        permission = await is_meeting_permission(query_params, user)
         if isinstance(permission, MessageException):
             raise permission
         if not permission:
@@ -168,21 +164,13 @@ async def update_document(id: str, data: dict) -> dict:
     :return: dict
     """
     try:
-        document = await document_collection.find_one({"_id": ObjectId(id)})
+        data["meeting_id"] = ObjectId(data["meeting_id"])
+        document = await update_one_document(document_collection,
+                                             {"_id": ObjectId(id)},
+                                             {"$set": data})
         if not document:
             raise MessageException("Document not found", 
                                    status.HTTP_404_NOT_FOUND)
-        
-        data["meeting_id"] = ObjectId(data["meeting_id"])
-        updated_document = await document_collection.update_one(
-            {"_id": ObjectId(id)}, {"$set": data}
-        )
-
-        if updated_document.modified_count == 0:
-            raise MessageException("Update document failed", 
-                                   status.HTTP_400_BAD_REQUEST)
-
-        document = await document_collection.find_one({"_id": ObjectId(id)})
         return document_helper(document)
 
     except MessageException as e:
@@ -0,0 +1,250 @@
+import asyncio
+import traceback
+from collections import OrderedDict
+from datetime import datetime, UTC
+from app.utils import Logger
+from app.core.config import settings
+from app.core.database import mongo_db
+from app.core.cache import cache_backend
+from bson.objectid import ObjectId
+from pymongo import ReturnDocument
+from pymongo.errors import DuplicateKeyError
+from app.utils.cache import MISSING
+
+logger = Logger("controllers/draft_buffer", log_file="submission.log")
+
+draft_submission_collection = mongo_db["draft_submissions"]
+
+
+def draft_key(exam_id: str | ObjectId,
+              retake_id: str | ObjectId | None,
+              clerk_user_id: str) -> tuple:
+    return (str(exam_id), str(retake_id) if retake_id else None, clerk_user_id)
+
+
+def shared_key(key: tuple) -> str:
+    return ":".join(part or "" for part in key)
+
+
+def draft_filter(key: tuple) -> dict:
+    exam_id, retake_id, clerk_user_id = key
+    return {
+        "exam_id": ObjectId(exam_id),
+        "retake_id": ObjectId(retake_id) if retake_id else None,
+        "clerk_user_id": clerk_user_id
+    }
+
+
+class DraftBuffer:
+    """
+    Coalesce the autosaves of draft submissions in memory.
+
+    Only the latest save of each (exam, retake, user) is kept and written
+    every `flush_interval` seconds. The last written version of a draft is
+    remembered, so a flush only $set the problems that changed
+    (submitted_problems.<i>). The `draft_version` field guards these
+    partial writes: when another worker wrote the draft in between, the
+    version does not match and the whole draft is rewritten instead.
+
+    Every write is guarded by `updated_at`, a save never overwrites a newer
+    one written by another worker. Only the first save of a draft in this
+    worker may create it, and it is written through; the buffered saves
+    never do, so a late flush cannot bring back a deleted draft.
+
+    The saves are only coalesced with a shared cache backend, where the
+    buffered saves are also kept: `flush(key, shared=True)`, used before
+    the draft is graded, writes the latest save of the draft whichever
+    worker buffered it (or whether it is still alive). Without one, every
+    save is written through.
+    """
+    namespace = "draft"
+
+    def __init__(self,
+                 flush_interval: float,
+                 max_snapshots: int = 10000,
+                 lock_stripes: int = 64,
+                 shared_ttl: float = 60
+                 ) -> None:
+        self.flush_interval = flush_interval
+        self.shared_ttl = shared_ttl
+        self.max_snapshots = max_snapshots
+        self.pending = {}
+        self.snapshots = OrderedDict()
+        # Flushes of the same key never overlap, different keys run concurrently
+        self.locks = [asyncio.Lock() for _ in range(lock_stripes)]
+        self._task = None
+
+    @property
+    def is_running(self) -> bool:
+        return self._task is not None and not self._task.done()
+
+    def start(self) -> None:
+        if self.flush_interval <= 0 or self.is_running:
+            return
+        if not cache_backend.shared:
+            # A save buffered in this worker only would be lost with it
+            logger.info("Draft saves written through, coalescing needs a shared cache backend")
+            return
+        self._task = asyncio.create_task(self._flush_loop())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        await self.flush_all()
+
+    def _lock(self, key: tuple) -> asyncio.Lock:
+        return self.locks[hash(key) % len(self.locks)]
+
+    async def save(self, draft_data: dict) -> bool:
+        """
+        Buffer a draft, written right away when the flush loop is not running
+        or on the first save of the draft in this worker
+        :param draft_data: dict, exam_id, retake_id, clerk_user_id, submitted_problems, updated_at
+        :return: bool, True when the draft was created
+        """
+        key = draft_key(draft_data["exam_id"],
+                        draft_data.get("retake_id"),
+                        draft_data["clerk_user_id"])
+        draft = {
+            "submitted_problems": draft_data["submitted_problems"],
+            "updated_at": draft_data.get("updated_at") or datetime.now(UTC)
+        }
+        if not self.is_running or key not in self.snapshots:
+            async with self._lock(key):
+                # Older than this save
+                self.pending.pop(key, None)
+                return await self._replace(key, draft, upsert=True) is True
+        self.pending[key] = draft
+        if cache_backend.shared:
+            await cache_backend.set(self.namespace, shared_key(key), draft, self.shared_ttl)
+        return False
+
+    async def flush(self, key: tuple, forget: bool = False, shared: bool = False) -> None:
+        """
+        Write the pending draft of a key (if any)
+        :param key: tuple, see draft_key
+        :param forget: bool, also drop the remembered version of the draft
+        :param shared: bool, also write the save buffered by another worker
+            (shared cache backend), used before the draft is graded
+        """
+        async with self._lock(key):
+            draft = self.pending.pop(key, None)
+            try:
+                if shared and cache_backend.shared:
+                    shared_draft = await cache_backend.get(self.namespace, shared_key(key))
+                    if shared_draft is not MISSING:
+                        shared_draft["updated_at"] = shared_draft["updated_at"].replace(tzinfo=UTC)
+                        if draft is None or shared_draft["updated_at"] > draft["updated_at"]:
+                            draft = shared_draft
+                if draft is not None:
+                    await self._write(key, draft)
+                if shared and cache_backend.shared:
+                    await cache_backend.delete(self.namespace, shared_key(key))
+            except:
+                # Keep the draft for the next flush unless a newer one arrived
+                if draft is not None:
+                    self.pending.setdefault(key, draft)
+                raise
+            finally:
+                if forget:
+                    self.snapshots.pop(key, None)
+
+    async def discard(self, key: tuple) -> None:
+        """
+        Drop everything buffered for a key, used when the draft is deleted
+        :param key: tuple, see draft_key
+        """
+        self.pending.pop(key, None)
+        self.snapshots.pop(key, None)
+        if cache_backend.shared:
+            await cache_backend.delete(self.namespace, shared_key(key))
+
+    async def flush_all(self) -> None:
+        keys = list(self.pending)
+        results = await asyncio.gather(*[self.flush(key) for key in keys],
+                                       return_exceptions=True)
+        for key, result in zip(keys, results):
+            if isinstance(result, Exception):
+                logger.error(f"Error when flush draft {key}: "
+                             f"{''.join(traceback.format_exception(result))}")
+
+    async def _flush_loop(self) -> None:
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            await self.flush_all()
+
+    async def _write(self, key: tuple, draft: dict) -> None:
+        submitted_problems = draft["submitted_problems"]
+        snapshot = self.snapshots.get(key)
+        if (snapshot is not None
+        and len(snapshot["submitted_problems"]) == len(submitted_problems)):
+            changed_problems = {
+                f"submitted_problems.{index}": problem
+                for index, problem in enumerate(submitted_problems)
+                if problem != snapshot["submitted_problems"][index]
+            }
+            if not changed_problems:
+                return
+            partial_update = await draft_submission_collection.update_one(
+                {
+                    **draft_filter(key),
+                    "draft_version": snapshot["version"],
+                    "updated_at": {"$lt": draft["updated_at"]}
+                },
+                {
+                    "$set": {**changed_problems, "updated_at": draft["updated_at"]},
+                    "$inc": {"draft_version": 1}
+                }
+            )
+            if partial_update.matched_count == 1:
+                self._remember(key, snapshot["version"] + 1, submitted_problems)
+                return
+
+        await self._replace(key, draft)
+
+    async def _replace(self, key: tuple, draft: dict, upsert: bool = False) -> bool | None:
+        """
+        Write the whole draft, unless a newer save of it is written
+        :param upsert: bool, create the draft when it does not exist
+        :return: bool, True when the draft was created, None when not written
+            (deleted, or saved again since)
+        """
+        try:
+            previous = await draft_submission_collection.find_one_and_update(
+                {**draft_filter(key), "updated_at": {"$lt": draft["updated_at"]}},
+                {
+                    "$set": {
+                        "submitted_problems": draft["submitted_problems"],
+                        "updated_at": draft["updated_at"]
+                    },
+                    "$inc": {"draft_version": 1},
+                    "$setOnInsert": {"created_at": datetime.now(UTC)}
+                },
+                projection={"draft_version": 1},
+                upsert=upsert,
+                return_document=ReturnDocument.BEFORE
+            )
+        except DuplicateKeyError:
+            # The draft exists with a newer save, or was created concurrently
+            return await self._replace(key, draft)
+        if previous is None and not upsert:
+            logger.info(f"Draft {key} not written: deleted or saved again since")
+            self.snapshots.pop(key, None)
+            return None
+        version = previous.get("draft_version", 0) + 1 if previous else 1
+        self._remember(key, version, draft["submitted_problems"])
+        return previous is None
+
+    def _remember(self, key: tuple, version: int, submitted_problems: list) -> None:
+        self.snapshots[key] = {"version": version, "submitted_problems": submitted_problems}
+        self.snapshots.move_to_end(key)
+        while len(self.snapshots) > self.max_snapshots:
+            self.snapshots.popitem(last=False)
+
+
+draft_buffer = DraftBuffer(flush_interval=settings.DRAFT_FLUSH_INTERVAL)
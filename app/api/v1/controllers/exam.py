@@ -5,7 +5,9 @@ from app.utils import (
     utc_to_local
 )
 from fastapi import status
-from app.core.database import mongo_client, mongo_db
+from app.core.database import mongo_db
+from app.core.persistence import insert_document
+from app.core.cascade import cascade_delete, on_delete
 from bson.objectid import ObjectId
 from app.api.v1.controllers.exam_problem import (
     retrieve_by_exam_id,
@@ -14,31 +16,41 @@ from app.api.v1.controllers.problem import (
     retrieve_problems_by_ids
 )
 from app.api.v1.controllers.cohort_permission import is_contest_permission
+from app.core.cache import (
+    get_exam_doc,
+    get_contest_exam_docs,
+    get_contests_exam_docs,
+    invalidate_exam
+)
 
 
 logger = Logger("controllers/exam", log_file="exam.log")
 
-try:
-    user_collection = mongo_db["users"]
-    contest_collection = mongo_db["contests"]
-    exam_collection = mongo_db["exams"]
-    exam_problem_collection = mongo_db["exam_problem"]
-    submission_collection = mongo_db["submissions"]
-    retake_collection = mongo_db["retake"]
-    timer_collection = mongo_db["timer"]
-    certificate_collection = mongo_db["certificate"]
-except Exception as e:
-    logger.error(f"Error when connect to collection: {e}")
-    exit(1)
+user_collection = mongo_db["users"]
+contest_collection = mongo_db["contests"]
+exam_collection = mongo_db["exams"]
+
+# Exams deleted by a cascade (the contest of the exams is not read)
+on_delete("exams", lambda ids: [invalidate_exam(id) for id in ids])
+
+
+# Exams embedded in the lists, read without their description
+EXAM_SUMMARY_PROJECTION = {"description": 0}
 
 
 #helper
 def exam_helper(exam: dict) -> dict:
+    return {
+        **exam_summary_helper(exam),
+        "description": exam["description"],
+    }
+
+# helper of the exams read with EXAM_SUMMARY_PROJECTION
+def exam_summary_helper(exam: dict) -> dict:
     return {
         "id": str(exam["_id"]),
         "contest_id": str(exam["contest_id"]),
         "title": exam["title"],
-        "description": exam["description"],
         "is_active": exam["is_active"],
         "creator_id": exam["creator_id"],
         "duration": exam["duration"],
@@ -60,8 +72,8 @@ async def add_exam(exam_data: dict) -> dict:
     """
     try:
         exam_data["contest_id"] = ObjectId(exam_data["contest_id"])
-        exam = await exam_collection.insert_one(exam_data)
-        new_exam = await exam_collection.find_one({"_id": exam.inserted_id})
+        new_exam = await insert_document(exam_collection, exam_data)
+        invalidate_exam(new_exam["_id"], exam_data["contest_id"])
         return exam_helper(new_exam)
     except:
         logger.error(f"{traceback.format_exc()}")
@@ -85,18 +97,18 @@ async def retrieve_exams() -> list:
                                 status.HTTP_500_INTERNAL_SERVER_ERROR)
 
 
-async def retrieve_exam(id: str, clerk_user_id: str) -> dict | MessageException:
+async def retrieve_exam(id: str, user: str | dict) -> dict | MessageException:
     """
     Retrieve a exam with a matching ID
     :param id: str
     :return: dict
     """
     try:
-        exam = await exam_collection.find_one({"_id": ObjectId(id)})
+        exam = await get_exam_doc(id)
         if not exam:
             raise MessageException("Exam not found", 
                                    status.HTTP_404_NOT_FOUND)
-        permission = await is_contest_permission(exam["contest_id"], clerk_user_id)
+        permission = await is_contest_permission(exam["contest_id"], user)
         if isinstance(permission, MessageException):
             return permission
         if not permission:
@@ -111,14 +123,14 @@ async def retrieve_exam(id: str, clerk_user_id: str) -> dict | MessageException:
                                 status.HTTP_500_INTERNAL_SERVER_ERROR)
 
 
-async def retrieve_exam_detail(id: str, clerk_user_id: str) -> dict | MessageException:
+async def retrieve_exam_detail(id: str, user: str | dict) -> dict | MessageException:
     """
     Retrieve a exam with a matching ID
     :param id: str
     :return: dict
     """
     try:
-        exam = await retrieve_exam(id, clerk_user_id)
+        exam = await retrieve_exam(id, user)
         if isinstance(exam, MessageException):
             return exam
         
@@ -151,16 +163,32 @@ async def retrieve_exams_by_contest(contest_id: str) -> list:
     :return: list
     """
     try:
-        exams = []
-        async for exam in exam_collection.find({"contest_id": ObjectId(contest_id)}):
-            exams.append(exam_helper(exam))
-        return exams
+        exams = await get_contest_exam_docs(contest_id)
+        return [exam_helper(exam) for exam in exams]
     except:
         logger.error(f"{traceback.format_exc()}")
         return MessageException("Error when retrieve all exams",
                                 status.HTTP_500_INTERNAL_SERVER_ERROR)
     
 
+async def retrieve_exams_by_contests(contest_ids: list) -> dict | MessageException:
+    """
+    Retrieve all exams of many contests
+    :param contest_ids: list of str
+    :return: dict, contest_id -> list
+    """
+    try:
+        exams = await get_contests_exam_docs(contest_ids)
+        return {
+            contest_id: [exam_helper(exam) for exam in contest_exams]
+            for contest_id, contest_exams in exams.items()
+        }
+    except:
+        logger.error(f"{traceback.format_exc()}")
+        return MessageException("Error when retrieve all exams",
+                                status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+
 async def retrieve_active_exams_by_contest(contest_id: str) -> list:
     """
     Retrieve all active exams with a matching contest ID
@@ -197,6 +225,9 @@ async def update_exam(id: str, data: dict) -> bool | MessageException:
         updated_exam = await exam_collection.update_one(
             {"_id": ObjectId(id)}, {"$set": update_data}
         )
+        invalidate_exam(id, exam["contest_id"])
+        if update_data.get("contest_id") not in [None, exam["contest_id"]]:
+            invalidate_exam(id, update_data["contest_id"])
         if updated_exam.modified_count == 0:
             raise MessageException("Error when update exam",
                                    status.HTTP_400_BAD_REQUEST)
@@ -211,69 +242,23 @@ async def update_exam(id: str, data: dict) -> bool | MessageException:
 
 async def delete_exam(id: str) -> bool | MessageException:
     """
-    Delete a exam from database
+    Delete a exam and everything depending on it (problems of the exam,
+    retakes, timers, submissions, certificates, ...)
     :param id: str
-    :return: bool
+    :return: bool, False when the deletion continues in the background
     """
     try:
-        exam = await exam_collection.find_one({"_id": ObjectId(id)})
+        exam = await exam_collection.find_one({"_id": ObjectId(id)}, {"contest_id": 1})
         if not exam:
             raise MessageException("Exam not found",
                                    status.HTTP_404_NOT_FOUND)
+        done = await cascade_delete("exams", [exam["_id"]])
+        logger.info(f"Deleted exam with ID: {id}" if done else
+                    f"Deleting exam with ID: {id} in the background")
+        return done
+    except MessageException as e:
+        return e
     except:
         logger.error(f"{traceback.format_exc()}")
         return MessageException("Error when delete exam",
                                 status.HTTP_500_INTERNAL_SERVER_ERROR)
-
-    async with await mongo_client.start_session() as session:
-        try:
-            async with session.start_transaction():
-                # Delete all exam_problem in exam_problem collection
-                await exam_problem_collection.delete_many({"exam_id": ObjectId(id)}, session=session)
-                logger.info(f"Deleted all exam_problems")
-
-                # Del all retakes by exam_id
-                await retake_collection.delete_many({"exam_id": ObjectId(id)}, session=session)
-                logger.info(f"Deleted all retakes")
-
-                # Del all timer by exam_id
-                await timer_collection.delete_many({"exam_id": ObjectId(id)}, session=session)
-
-                # Del all certificates by 
-                submission_ids = []
-                async for submission in submission_collection.find({"exam_id": ObjectId(id)}):
-                    submission_ids.append(submission["_id"])
-                await certificate_collection.delete_many({"submission_id": {"$in": submission_ids}}, session=session)
-
-                # Del submissions by exam_id
-                await submission_collection.delete_many({"exam_id": ObjectId(id)}, session=session)
-                logger.info(f"Deleted all submissions")
-
-                # Delete exam in exam collection
-                await exam_collection.delete_one({"_id": ObjectId(id)}, session=session) 
-                logger.info(f"Deleted exam with ID: {id}")
-        
-        except:
-            logger.error(f"{traceback.format_exc()}")
-            return MessageException("Error when delete exam",
-                                    status.HTTP_500_INTERNAL_SERVER_ERROR)
-        else:
-            return True
-
-
-async def delete_all_by_contest_id(contest_id: str) -> bool:
-    """
-    Delete all exams with a matching contest ID
-    :param contest_id: str
-    :return: bool
-    """
-    try:
-        exams = await retrieve_exams_by_contest(contest_id)
-        for exam in exams:
-            await delete_exam(exam["id"])
-        return True
-    except:
-        logger.error(f"{traceback.format_exc()}")
-        return MessageException("Error when delete all exams",
-                                status.HTTP_500_INTERNAL_SERVER_ERROR)
-
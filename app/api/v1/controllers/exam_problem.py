@@ -2,15 +2,17 @@ import traceback
 from app.utils import utc_to_local, MessageException, Logger
 from fastapi import status
 from app.core.database import mongo_db
+from app.core.persistence import insert_document
 from bson.objectid import ObjectId
+from app.core.cache import (
+    get_exam_problem_docs,
+    get_exams_problem_docs,
+    invalidate_exam_problems
+)
 
 logger = Logger("controllers/exam_problem", log_file="exam_problem.log")
 
-try:
-    exam_problem_collection = mongo_db["exam_problem"]
-except Exception as e:
-    logger.error(f"Error when connect to collection: {e}")
-    exit(1)
+exam_problem_collection = mongo_db["exam_problem"]
 
 
 # helper 
@@ -39,10 +41,8 @@ async def add_exam_problem(exam_problem_data: dict) -> dict:
     """
     try:
         exam_problem_data = ObjectId_helper(exam_problem_data)
-        exam_problem = await exam_problem_collection.insert_one(exam_problem_data)
-        new_exam_problem = await exam_problem_collection.find_one(
-            {"_id": exam_problem.inserted_id}
-        )
+        new_exam_problem = await insert_document(exam_problem_collection, exam_problem_data)
+        invalidate_exam_problems(exam_problem_data["exam_id"])
         return exam_problem_helper(new_exam_problem)
     except:
         logger.error(f"{traceback.format_exc()}")
@@ -109,16 +109,31 @@ async def retrieve_by_exam_id(exam_id: str) -> list:
     :return: list
     """
     try:
-        exam_problems = []
-        async for exam_problem in exam_problem_collection.find({"exam_id": ObjectId(exam_id)}):
-            exam_problems.append(exam_problem_helper(exam_problem))
-        return exam_problems
+        exam_problems = await get_exam_problem_docs(exam_id)
+        return [exam_problem_helper(exam_problem) for exam_problem in exam_problems]
     except:
         logger.error(f"{traceback.format_exc()}")
         return MessageException("Error when retrieve exam_problem",
                                 status.HTTP_500_INTERNAL_SERVER_ERROR)
 
 
+async def retrieve_by_exam_ids(exam_ids: list) -> dict | MessageException:
+    """
+    Retrieve all exam_problems of many exams
+    :param exam_ids: list of str
+    :return: dict, exam_id -> list
+    """
+    try:
+        exam_problems = await get_exams_problem_docs(exam_ids)
+        return {
+            exam_id: [exam_problem_helper(exam_problem) for exam_problem in links]
+            for exam_id, links in exam_problems.items()
+        }
+    except:
+        logger.error(f"{traceback.format_exc()}")
+        return MessageException("Error when retrieve exam_problem",
+                                status.HTTP_500_INTERNAL_SERVER_ERROR)
+
 
 async def update_exam_problem(id: str, data: dict) -> bool | MessageException:
     """
@@ -137,6 +152,9 @@ async def update_exam_problem(id: str, data: dict) -> bool | MessageException:
         updated_exam_problem = await exam_problem_collection.update_one(
             {"_id": ObjectId(id)}, {"$set": data}
         )
+        invalidate_exam_problems(exam_problem["exam_id"])
+        if "exam_id" in data:
+            invalidate_exam_problems(data["exam_id"])
         if updated_exam_problem.modified_count == 0:
             raise MessageException("Error when update exam_problem",
                                    status.HTTP_500_INTERNAL_SERVER_ERROR)
@@ -158,6 +176,7 @@ async def delete_exam_problem(id: str) -> bool:
             raise MessageException("Exam_problem not found", 
                                    status.HTTP_404_NOT_FOUND)
         deleted_exam_problem = await exam_problem_collection.delete_one({"_id": ObjectId(id)})
+        invalidate_exam_problems(exam_problem["exam_id"])
         if deleted_exam_problem.deleted_count == 0:
             raise MessageException("Error when delete exam_problem",
                                    status.HTTP_500_INTERNAL_SERVER_ERROR)
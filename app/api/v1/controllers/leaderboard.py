@@ -0,0 +1,255 @@
+import traceback
+from datetime import datetime, UTC
+from app.utils import utc_to_local, MessageException, Logger
+from fastapi import status
+from app.core.database import mongo_db
+from app.core.cascade import on_delete
+from bson.objectid import ObjectId
+from pymongo import ReplaceOne
+
+logger = Logger("controllers/leaderboard", log_file="leaderboard.log")
+
+leaderboard_collection = mongo_db["leaderboards"]
+submission_collection = mongo_db["submissions"]
+exam_collection = mongo_db["exams"]
+user_collection = mongo_db["users"]
+
+# Ranking order: best score first, the earlier submission wins a tie
+RANKING_SORT = [("total_score", -1), ("achieved_at", 1)]
+
+
+# helper
+def leaderboard_helper(entry: dict, rank: int, user_info: dict | None = None) -> dict:
+    user_info = user_info or {}
+    fullname = user_info.get("fullname") or user_info.get("username")
+    return {
+        "rank": rank,
+        "clerk_user_id": entry["clerk_user_id"],
+        "username": user_info.get("username"),
+        "fullname": fullname,
+        "avatar": user_info.get("avatar"),
+        "contest_id": str(entry["contest_id"]),
+        "exam_id": str(entry["exam_id"]),
+        "submission_id": str(entry["submission_id"]),
+        "total_score": entry["total_score"],
+        "max_score": entry["max_score"],
+        "total_problems_passed": entry["total_problems_passed"],
+        "achieved_at": utc_to_local(entry["achieved_at"]),
+    }
+
+
+def entry_from_submission(contest_id: ObjectId, submission: dict) -> dict:
+    return {
+        "contest_id": contest_id,
+        "clerk_user_id": submission["clerk_user_id"],
+        "exam_id": submission["exam_id"],
+        "submission_id": submission["_id"],
+        "total_score": submission["total_score"],
+        "max_score": submission["max_score"],
+        "total_problems_passed": submission.get("total_problems_passed", 0),
+        "achieved_at": submission["created_at"],
+    }
+
+
+async def record_leaderboard_score(contest_id: str | ObjectId,
+                                   submission: dict
+                                   ) -> bool | MessageException:
+    """
+    Keep the best submission of the user in the contest leaderboard.
+    The entry is only replaced when the new score is strictly higher,
+    done in one atomic update (pipeline update with upsert).
+    :param contest_id: str | ObjectId
+    :param submission: dict, raw submission document
+    :return: bool
+    """
+    try:
+        contest_id = ObjectId(contest_id)
+        entry = entry_from_submission(contest_id, submission)
+        is_better = {
+            "$or": [
+                {"$eq": [{"$type": "$total_score"}, "missing"]},
+                {"$gt": [entry["total_score"], "$total_score"]}
+            ]
+        }
+        set_stage = {
+            field: {"$cond": [is_better, {"$literal": value}, f"${field}"]}
+            for field, value in entry.items()
+            if field not in ["contest_id", "clerk_user_id"]
+        }
+        set_stage["updated_at"] = datetime.now(UTC)
+        await leaderboard_collection.update_one(
+            {"contest_id": contest_id, "clerk_user_id": entry["clerk_user_id"]},
+            [{"$set": set_stage}],
+            upsert=True
+        )
+        return True
+    except:
+        logger.error(f"{traceback.format_exc()}")
+        return MessageException("Error when record leaderboard score",
+                                status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+
+async def refresh_leaderboard(contest_id: str | ObjectId,
+                              clerk_user_ids: list | None = None
+                              ) -> int:
+    """
+    Rank users again from their best remaining submission of the contest,
+    the users without any lose their entry
+    :param contest_id: str | ObjectId
+    :param clerk_user_ids: list[str], every user of the contest by default
+    :return: int, number of ranked users
+    """
+    contest_id = ObjectId(contest_id)
+    exam_ids = [exam["_id"] async for exam in
+                exam_collection.find({"contest_id": contest_id}, {"_id": 1})]
+    match = {
+        "exam_id": {"$in": exam_ids},
+        "submitted_problems": {"$ne": None}
+    }
+    if clerk_user_ids is not None:
+        match["clerk_user_id"] = {"$in": clerk_user_ids}
+    pipeline = [
+        {"$match": match},
+        {"$sort": {"total_score": -1, "created_at": 1}},
+        {
+            "$group": {
+                "_id": "$clerk_user_id",
+                "submission": {"$first": "$$ROOT"}
+            }
+        },
+        {
+            "$project": {
+                "submission.submitted_problems": 0
+            }
+        }
+    ]
+    best_submissions = await submission_collection.aggregate(pipeline).to_list(length=None)
+
+    now = datetime.now(UTC)
+    operations = []
+    for result in best_submissions:
+        entry = entry_from_submission(contest_id, result["submission"])
+        operations.append(ReplaceOne(
+            {"contest_id": contest_id, "clerk_user_id": entry["clerk_user_id"]},
+            {**entry, "updated_at": now},
+            upsert=True
+        ))
+    if operations:
+        await leaderboard_collection.bulk_write(operations, ordered=False)
+    stale_users = {"$nin": [result["_id"] for result in best_submissions]}
+    if clerk_user_ids is not None:
+        stale_users["$in"] = clerk_user_ids
+    await leaderboard_collection.delete_many({
+        "contest_id": contest_id,
+        "clerk_user_id": stale_users
+    })
+    return len(operations)
+
+
+async def rebuild_leaderboard(contest_id: str) -> int | MessageException:
+    """
+    Rebuild the leaderboard of a contest from the existing submissions
+    :param contest_id: str
+    :return: int, number of ranked users
+    """
+    try:
+        total_users = await refresh_leaderboard(contest_id)
+        logger.info(f"Rebuilt leaderboard of contest {contest_id}: {total_users} users")
+        return total_users
+    except:
+        logger.error(f"{traceback.format_exc()}")
+        return MessageException("Error when rebuild leaderboard",
+                                status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+
+async def remove_leaderboard_submissions(submission_ids: list) -> None:
+    """
+    Rank again the users whose entry is one of the deleted submissions,
+    from their remaining submissions of the contest
+    :param submission_ids: list[ObjectId]
+    """
+    entries = await leaderboard_collection.find(
+        {"submission_id": {"$in": [ObjectId(id) for id in submission_ids]}},
+        {"contest_id": 1, "clerk_user_id": 1}
+    ).to_list(length=None)
+    users_by_contest = {}
+    for entry in entries:
+        users_by_contest.setdefault(entry["contest_id"], []).append(entry["clerk_user_id"])
+    for contest_id, clerk_user_ids in users_by_contest.items():
+        await refresh_leaderboard(contest_id, clerk_user_ids)
+
+
+# Submissions deleted by a cascade (exam deleted)
+on_delete("submissions", remove_leaderboard_submissions)
+
+
+async def retrieve_top_leaderboard(contest_id: str, limit: int = 10) -> list | MessageException:
+    """
+    Retrieve the top-N users of a contest leaderboard
+    :param contest_id: str
+    :param limit: int
+    :return: list
+    """
+    try:
+        entries = await leaderboard_collection.find(
+            {"contest_id": ObjectId(contest_id)}
+        ).sort(RANKING_SORT).limit(limit).to_list(length=None)
+
+        users_info = {}
+        async for user in user_collection.find(
+            {"clerk_user_id": {"$in": [entry["clerk_user_id"] for entry in entries]}},
+            {"clerk_user_id": 1, "username": 1, "fullname": 1, "avatar": 1}
+        ):
+            users_info[user["clerk_user_id"]] = user
+
+        # Same score -> same rank (1, 2, 2, 4)
+        leaderboard = []
+        rank = 0
+        for index, entry in enumerate(entries):
+            if index == 0 or entry["total_score"] != entries[index - 1]["total_score"]:
+                rank = index + 1
+            leaderboard.append(
+                leaderboard_helper(entry, rank, users_info.get(entry["clerk_user_id"]))
+            )
+        return leaderboard
+    except:
+        logger.error(f"{traceback.format_exc()}")
+        return MessageException("Error when retrieve leaderboard",
+                                status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+
+async def retrieve_leaderboard_rank(contest_id: str,
+                                    clerk_user_id: str
+                                    ) -> dict | MessageException:
+    """
+    Retrieve the rank of a user in a contest leaderboard
+    :param contest_id: str
+    :param clerk_user_id: str
+    :return: dict
+    """
+    try:
+        contest_id = ObjectId(contest_id)
+        entry = await leaderboard_collection.find_one(
+            {"contest_id": contest_id, "clerk_user_id": clerk_user_id}
+        )
+        if not entry:
+            raise MessageException("You are not on the leaderboard yet",
+                                   status.HTTP_404_NOT_FOUND)
+        higher_count = await leaderboard_collection.count_documents(
+            {"contest_id": contest_id, "total_score": {"$gt": entry["total_score"]}}
+        )
+        total_users = await leaderboard_collection.count_documents({"contest_id": contest_id})
+        user_info = await user_collection.find_one(
+            {"clerk_user_id": clerk_user_id},
+            {"username": 1, "fullname": 1, "avatar": 1}
+        )
+        return {
+            **leaderboard_helper(entry, higher_count + 1, user_info),
+            "total_users": total_users
+        }
+    except MessageException as e:
+        return e
+    except:
+        logger.error(f"{traceback.format_exc()}")
+        return MessageException("Error when retrieve leaderboard rank",
+                                status.HTTP_500_INTERNAL_SERVER_ERROR)
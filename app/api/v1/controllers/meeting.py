@@ -7,18 +7,20 @@ from app.utils import (
 from fastapi import status
 from app.utils.logger import Logger
 from bson.objectid import ObjectId
-from app.core.database import mongo_client, mongo_db
+from pymongo.errors import DuplicateKeyError
+from app.core.database import mongo_db
+from app.core.persistence import insert_document, update_document
+from app.core.cascade import cascade_delete, on_delete
+from app.core.cohort_index import meeting_index
 from app.api.v1.controllers.cohort_permission import is_meeting_permission
 
 logger = Logger("controllers/meeting", log_file="meeting.log")
-try:
-    user_collection = mongo_db["users"]
-    meeting_collection = mongo_db["meetings"]
-    document_collection = mongo_db["documents"]
-    attendee_collection = mongo_db["attendees"]
-except Exception as e:
-    logger.error(f"Error when connect to collection: {e}")
-    exit(1)
+user_collection = mongo_db["users"]
+meeting_collection = mongo_db["meetings"]
+document_collection = mongo_db["documents"]
+attendee_collection = mongo_db["attendees"]
+
+on_delete("meetings", lambda ids: [meeting_index.invalidate(id) for id in ids])
 
 
 # helper
@@ -49,9 +51,12 @@ async def add_meeting(meeting_data: dict) -> dict:
     :return: dict
     """
     try:
-        meeting = await meeting_collection.insert_one(meeting_data)
-        new_meeting = await meeting_collection.find_one({"_id": meeting.inserted_id})
+        new_meeting = await insert_document(meeting_collection, meeting_data)
+        meeting_index.invalidate(new_meeting["_id"])
         return meeting_helper(new_meeting)
+    except DuplicateKeyError:
+        return MessageException("The title already exists.",
+                                status.HTTP_400_BAD_REQUEST)
     except:
         logger.error(f"{traceback.format_exc()}")
         return MessageException("Error when add meeting", 
@@ -89,11 +94,11 @@ async def retrieve_meeting_by_pipeline(pipeline: list) -> list:
                                 status.HTTP_500_INTERNAL_SERVER_ERROR)
 
 
-async def retrieve_meeting_by_id(id: str, clerk_user_id: str) -> dict | MessageException:
+async def retrieve_meeting_by_id(id: str, user: str | dict) -> dict | MessageException:
     """
     Retrieve a meeting by meeting id
     :param id: str
-    :param clerk_user_id: str
+    :param user: str (clerk_user_id) | dict (user info)
     :return: dict
     """
     try:
@@ -101,7 +106,7 @@ async def retrieve_meeting_by_id(id: str, clerk_user_id: str) -> dict | MessageE
             "_id": ObjectId(id),
         }
         meeting_permission = await is_meeting_permission(query_params, 
-                                                         clerk_user_id, 
+                                                         user, 
                                                          return_item=True)
         if isinstance(meeting_permission, MessageException):
             return meeting_permission
@@ -118,7 +123,7 @@ async def retrieve_meeting_by_id(id: str, clerk_user_id: str) -> dict | MessageE
                                 status.HTTP_500_INTERNAL_SERVER_ERROR)
 
 
-async def retrieve_meeting_by_slug(slug: str, clerk_user_id: str) -> dict | MessageException:
+async def retrieve_meeting_by_slug(slug: str, user: str | dict) -> dict | MessageException:
     """
     Retrieve a meeting by meeting slug
     :param slug: str
@@ -129,7 +134,7 @@ async def retrieve_meeting_by_slug(slug: str, clerk_user_id: str) -> dict | Mess
             "slug": slug
         }
         meeting_permission = await is_meeting_permission(query_params,
-                                                         clerk_user_id, 
+                                                         user, 
                                                          return_item=True)
         if isinstance(meeting_permission, MessageException):
             return meeting_permission
@@ -147,26 +152,6 @@ async def retrieve_meeting_by_slug(slug: str, clerk_user_id: str) -> dict | Mess
                                 status.HTTP_500_INTERNAL_SERVER_ERROR)
 
 
-async def meeting_slug_is_unique(slug: str, is_update = False) -> bool | MessageException:
-    """
-    Check if the slug is unique
-    :param slug: str
-    :return: bool
-    """
-    try:
-        meeting = await meeting_collection.find_one({"slug": slug})
-        if meeting and not is_update:
-            return MessageException("The title already exists.",
-                                    status.HTTP_400_BAD_REQUEST)
-        return True
-    except MessageException as e:
-        return e
-    except:
-        logger.error(f"{traceback.format_exc()}")
-        return MessageException("An error occurred when check slug", 
-                                status.HTTP_500_INTERNAL_SERVER_ERROR)
-
-
 async def update_meeting(id: str, meeting_data: dict) -> dict:
     """
     Update a meeting with a matching ID
@@ -175,22 +160,21 @@ async def update_meeting(id: str, meeting_data: dict) -> dict:
     :return: dict
     """
     try:
-        meeting = await meeting_collection.find_one({"_id": ObjectId(id)})
-        if not meeting:
+        updated_meeting_data = await update_document(meeting_collection,
+                                                     {"_id": ObjectId(id)},
+                                                     {"$set": meeting_data})
+        if not updated_meeting_data:
             raise MessageException("Meeting not found", 
                                    status.HTTP_404_NOT_FOUND)
-        
-        updated_meeting = await meeting_collection.update_one(
-            {"_id": ObjectId(id)}, {"$set": meeting_data}
-        )
-        if updated_meeting.modified_count == 0:
-            raise MessageException("Update meeting failed", 
-                                   status.HTTP_400_BAD_REQUEST)
-        updated_meeting_data = await meeting_collection.find_one({"_id": ObjectId(id)})
+        if "cohorts" in meeting_data:
+            meeting_index.invalidate(id)
         return meeting_helper(updated_meeting_data)
 
     except MessageException as e:
         return e
+    except DuplicateKeyError:
+        return MessageException("The title already exists.",
+                                status.HTTP_400_BAD_REQUEST)
     except:
         logger.error(f"{traceback.format_exc()}")
         return MessageException("An error occurred when update meeting",
@@ -205,10 +189,10 @@ async def delete_meeting(id: str) -> bool:
 
     :param id: str
 
-    :return: bool
+    :return: bool, False when the deletion continues in the background
     """
     try:
-        meeting = await meeting_collection.find_one({"_id": ObjectId(id)})
+        meeting = await meeting_collection.find_one({"_id": ObjectId(id)}, {"date": 1})
         if not meeting:
             raise MessageException("Meeting not found",
                                    status.HTTP_404_NOT_FOUND)
@@ -216,38 +200,18 @@ async def delete_meeting(id: str) -> bool:
         if is_past(meeting["date"], "utc"):
             raise MessageException("Cannot delete meeting in the past",
                                    status.HTTP_400_BAD_REQUEST)
+
+        # Documents and attendees, then the meeting
+        done = await cascade_delete("meetings", [meeting["_id"]])
+        logger.info(f"Delete meeting with ID: {id}" if done else
+                    f"Deleting meeting with ID: {id} in the background")
+        return done
     except MessageException as e:
         return e
     except:
         logger.error(f"{traceback.format_exc()}")
         return MessageException("An error occurred when delete meeting",
                                 status.HTTP_500_INTERNAL_SERVER_ERROR)
-    
-    # Transaction to delete meeting and documents
-    async with await mongo_client.start_session() as session:
-        try:
-            async with session.start_transaction():
-                del_meeting = await meeting_collection.delete_one(
-                    {"_id": ObjectId(id)},
-                    session=session)
-                logger.info(f"Delete meeting with ID: {id}")
-                del_documents = await document_collection.delete_many(
-                    {"meeting_id": ObjectId(id)},
-                    session=session)
-                logger.info(f"Delete documents: {del_documents.deleted_count}")
-                del_attendees = await attendee_collection.delete_many(
-                    {"meeting_id": ObjectId(id)},
-                    session=session)
-                logger.info(f"Delete attendees: {del_attendees.deleted_count}")
-        except:
-            logger.error(f"{traceback.format_exc()}")
-            return MessageException("An error occurred when delete meeting",
-                                    status.HTTP_500_INTERNAL_SERVER_ERROR)
-        else:
-            if del_meeting.deleted_count == 0:
-                raise MessageException("Delete meeting failed",
-                                        status.HTTP_400_BAD_REQUEST)
-            return True
         
         
 async def retrieve_upcoming_meeting_by_pipeline(pipeline: list) -> dict | MessageException:
@@ -1,21 +1,37 @@
 import traceback
 from app.utils import utc_to_local, MessageException, Logger
 from fastapi import status
-from app.core.database import mongo_client, mongo_db
+from app.core.database import mongo_db
+from app.core.transactions import run_transaction
+from app.core.persistence import insert_document
 from bson.objectid import ObjectId
 from app.api.v1.controllers.category import (
     category_helper
 )
+from app.core.cache import (
+    get_problem_doc,
+    get_problem_docs,
+    invalidate_problem,
+    PUBLIC_PROBLEM_PROJECTION
+)
 
 logger = Logger("controllers/problem", log_file="problem.log")
 
-try:
-    problem_collection = mongo_db["problems"]
-    exam_problem_collection = mongo_db["exam_problem"]
-    problem_category_collection = mongo_db["problem_category"]
-except Exception as e:
-    logger.error(f"Error when connect to collection: {e}")
-    exit(1)
+problem_collection = mongo_db["problems"]
+exam_problem_collection = mongo_db["exam_problem"]
+problem_category_collection = mongo_db["problem_category"]
+
+
+# Problems of the lists, read without their content (same for every role)
+PROBLEM_SUMMARY_PROJECTION = {
+    "description": 0,
+    "admin_template": 0,
+    "code_template": 0,
+    "code_solution": 0,
+    "public_testcases": 0,
+    "private_testcases": 0,
+    "choices": 0,
+}
 
 
 # helper (admin)
@@ -39,14 +55,30 @@ def problem_helper(problem) -> dict:
         "updated_at": utc_to_local(problem["updated_at"])
     }
 
-# helper (user)
+# helper of the problems read with PROBLEM_SUMMARY_PROJECTION
+def problem_summary_helper(problem) -> dict:
+    return {
+        "id": str(problem["_id"]),
+        "creator_id": problem["creator_id"],
+        "title": problem["title"],
+        "slug": problem["slug"],
+        "difficulty": problem["difficulty"],
+        "is_published": problem["is_published"],
+        "problem_score": problem["problem_score"],
+        "created_at": utc_to_local(problem["created_at"]),
+        "updated_at": utc_to_local(problem["updated_at"])
+    }
+
+# helper (user), the problem may be read with PUBLIC_PROBLEM_PROJECTION.
+# The input is left untouched, problems from the caches can be passed as is.
 def hide_problem_helper(problem) -> dict:
-    if problem["choices"] is not None:
-        for i in range(len(problem["choices"])):
-            problem["choices"][i]["is_correct"] = False
+    choices = problem["choices"]
+    if choices is not None:
+        choices = [{**choice, "is_correct": False} for choice in choices]
 
-    if problem["private_testcases"] is not None:
-        problem["private_testcases"] = []
+    private_testcases = problem.get("private_testcases", [])
+    if private_testcases is not None:
+        private_testcases = []
 
     return {
         "id": str(problem["_id"]),
@@ -60,8 +92,8 @@ def hide_problem_helper(problem) -> dict:
         "code_template": problem["code_template"],
         "code_solution": "",
         "public_testcases": problem["public_testcases"],
-        "private_testcases": problem["private_testcases"],
-        "choices": problem["choices"],
+        "private_testcases": private_testcases,
+        "choices": choices,
         "problem_score": int(problem["problem_score"]),
         "created_at": utc_to_local( problem["created_at"]),
         "updated_at": utc_to_local(problem["updated_at"]),
@@ -74,8 +106,7 @@ async def add_problem(problem_data: dict) -> dict:
     :return: dict
     """
     try:
-        problem = await problem_collection.insert_one(problem_data)
-        new_problem = await problem_collection.find_one({"_id": problem.inserted_id})
+        new_problem = await insert_document(problem_collection, problem_data)
         return problem_helper(new_problem)
     except:
         logger.error(f"{traceback.format_exc()}")
@@ -83,16 +114,23 @@ async def add_problem(problem_data: dict) -> dict:
                                 status.HTTP_500_INTERNAL_SERVER_ERROR)
 
 
-async def retrieve_problems(full_return: bool = False) -> list:
+async def retrieve_problems(full_return: bool = False, summary: bool = False) -> list:
     """
     Retrieve all problems from the database
     :param full_return: bool
+    :param summary: bool, without their content (overrides full_return)
     :return: list
     """
     try:
         problems = []
-        async for problem in problem_collection.find():
-            if full_return:
+        if summary:
+            projection = PROBLEM_SUMMARY_PROJECTION
+        else:
+            projection = None if full_return else PUBLIC_PROBLEM_PROJECTION
+        async for problem in problem_collection.find({}, projection):
+            if summary:
+                problem_data = problem_summary_helper(problem)
+            elif full_return:
                 problem_data = problem_helper(problem)
             else:
                 problem_data = hide_problem_helper(problem)
@@ -104,16 +142,24 @@ async def retrieve_problems(full_return: bool = False) -> list:
                                 status.HTTP_500_INTERNAL_SERVER_ERROR)
 
 
-async def retrieve_problems_by_ids(ids: list, full_return: bool = False) -> list:
+async def retrieve_problems_by_ids(ids: list, 
+                                   full_return: bool = False,
+                                   projection: dict | None = None) -> list:
     """
     Retrieve problems with a matching IDs
     :param ids: list
     :param full_return: bool
+    :param projection: dict, when given only the projected fields are returned (with "id")
     :return: list
     """
     try:
         problems = []
-        async for problem in problem_collection.find({"_id": {"$in": ids}}):
+        if projection is not None:
+            async for problem in problem_collection.find({"_id": {"$in": ids}}, projection):
+                problems.append({"id": str(problem.pop("_id")), **problem})
+            return problems
+
+        for problem in await get_problem_docs(ids, public=not full_return):
             if full_return:
                 problem_data = problem_helper(problem)
             else:
@@ -134,7 +180,7 @@ async def retrieve_problem(id: str, full_return: bool = False) -> dict:
     :return: dict
     """
     try:
-        problem = await problem_collection.find_one({"_id": ObjectId(id)})
+        problem = await get_problem_doc(id, public=not full_return)
         if problem:
             if full_return:
                 return problem_helper(problem)
@@ -149,16 +195,21 @@ async def retrieve_problem(id: str, full_return: bool = False) -> dict:
 async def retrieve_problem_by_pipeline(pipeline: list,
                                             page: int,
                                             per_page: int, 
-                                            role: str
+                                            role: str,
+                                            summary: bool = False
                                             ) -> dict:
     """
     Retrieve all problems with search, filter and pagination.
     :param pipeline: list
     :param page: int
     :param per_page: int
+    :param summary: bool, the pipeline projects PROBLEM_SUMMARY_PROJECTION
     :return: dict
     """
     try:
+        if role != "admin":
+            # The lookups and the $group never carry the hidden fields
+            pipeline = [{"$project": PUBLIC_PROBLEM_PROJECTION}, *pipeline]
         pipeline_results = await problem_collection.aggregate(pipeline).to_list(length=None)
         problems = pipeline_results[0]["problems"]
         if len(problems) < 1:
@@ -175,7 +226,12 @@ async def retrieve_problem_by_pipeline(pipeline: list,
 
         result_data = []
         for problem in problems:  
-            problem_info = problem_helper(problem) if role == "admin" else hide_problem_helper(problem)
+            if summary:
+                problem_info = problem_summary_helper(problem)
+            elif role == "admin":
+                problem_info = problem_helper(problem)
+            else:
+                problem_info = hide_problem_helper(problem)
             return_dict = {
                 **problem_info,
                 "categories": [category_helper(category) for category in problem["category_info"]]
@@ -212,6 +268,7 @@ async def update_problem(id: str, data: dict) -> bool:
         updated_problem = await problem_collection.update_one(
             {"_id": ObjectId(id)}, {"$set": data}
         )
+        invalidate_problem(id)
         if updated_problem.modified_count == 0:
             raise MessageException("Error when update problem",
                                    status.HTTP_400_BAD_REQUEST)
@@ -231,14 +288,14 @@ async def delete_problem(id: str) -> bool:
     :return: bool
     """
     try:
-        problem = await problem_collection.find_one({"_id": ObjectId(id)})
+        problem = await problem_collection.find_one({"_id": ObjectId(id)}, {"_id": 1})
         if not problem:
             raise MessageException("Problem not found",
                                    status.HTTP_404_NOT_FOUND)
         
-        exam_problem_data = await exam_problem_collection.find(
-            {"problem_id": ObjectId(id)}).to_list(length=None)
-        if len(exam_problem_data) > 0:
+        exam_problem = await exam_problem_collection.find_one(
+            {"problem_id": ObjectId(id)}, {"_id": 1})
+        if exam_problem is not None:
             raise MessageException("Problem is used in exam",
                                    status.HTTP_400_BAD_REQUEST)
         
@@ -249,27 +306,28 @@ async def delete_problem(id: str) -> bool:
         return MessageException("Error when delete problem",
                                 status.HTTP_500_INTERNAL_SERVER_ERROR)
     
-    async with await mongo_client.start_session() as session:
-        try:
-            async with session.start_transaction():
-                # Delete all problem_category
-                deleted_problem_category = await problem_category_collection.delete_many(
-                    {"problem_id": ObjectId(id)}, session=session)
-                logger.info(f"Delete problem_category: {deleted_problem_category.deleted_count}")
+    # No transaction: the links are deleted before the problem, and deleting
+    # again after a failure completes the deletion
+    async def delete(session):
+        deleted_problem_category = await problem_category_collection.delete_many(
+            {"problem_id": ObjectId(id)}, session=session)
+        logger.info(f"Delete problem_category: {deleted_problem_category.deleted_count}")
 
-                # Delete problem
-                deleted_problem = await problem_collection.delete_one(
-                    {"_id": ObjectId(id)}, session=session)
-                logger.info(f"Delete problem with ID: {id}")
+        deleted_problem = await problem_collection.delete_one(
+            {"_id": ObjectId(id)}, session=session)
+        logger.info(f"Delete problem with ID: {id}")
+        return deleted_problem
 
-        except:
-            logger.error(f"{traceback.format_exc()}")
-            return MessageException("Error when delete problem",
-                                    status.HTTP_500_INTERNAL_SERVER_ERROR)
-        else:
-            if deleted_problem.deleted_count == 0:
-                raise MessageException("Delete problem failed",
-                                        status.HTTP_400_BAD_REQUEST)
-            return True
+    try:
+        deleted_problem = await run_transaction("delete_problem", delete, atomic=False)
+    except:
+        logger.error(f"{traceback.format_exc()}")
+        return MessageException("Error when delete problem",
+                                status.HTTP_500_INTERNAL_SERVER_ERROR)
+    invalidate_problem(id)
+    if deleted_problem.deleted_count == 0:
+        return MessageException("Delete problem failed",
+                                status.HTTP_400_BAD_REQUEST)
+    return True
                                    
 
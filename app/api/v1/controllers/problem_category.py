@@ -3,16 +3,13 @@ from app.utils import utc_to_local, MessageException, Logger
 from fastapi import status
 from typing import List
 from app.core.database import mongo_db
+from app.core.persistence import insert_document, insert_documents
 from bson.objectid import ObjectId
 from pymongo import UpdateOne, DeleteOne
 
 logger = Logger("controllers/problem_category", log_file="problem_category.log")
 
-try:
-    problem_category_collection = mongo_db["problem_category"]
-except Exception as e:
-    logger.error(f"Error when connect to collection: {e}")
-    exit(1)
+problem_category_collection = mongo_db["problem_category"]
 
 
 # helper 
@@ -39,10 +36,8 @@ async def add_problem_category(problem_category_data: dict) -> dict:
     """
     try:
         problem_category_data = ObjectId_helper(problem_category_data)
-        problem_category = await problem_category_collection.insert_one(problem_category_data)
-        new_problem_category = await problem_category_collection.find_one(
-            {"_id": problem_category.inserted_id}
-        )
+        new_problem_category = await insert_document(problem_category_collection,
+                                                     problem_category_data)
         return problem_category_helper(new_problem_category)
     except:
         logger.error(f"{traceback.format_exc()}")
@@ -58,14 +53,10 @@ async def add_more_problem_category(problem_category_data: List[dict]) -> list:
     """
     try:
         problem_category_data = [ObjectId_helper(problem_category) for problem_category in problem_category_data]
-        problem_category = await problem_category_collection.insert_many(problem_category_data)
-
-        new_problem_categories = []
-        async for problem_category in problem_category_collection.find(
-            {"_id": {"$in": problem_category.inserted_ids}}
-        ):
-            new_problem_categories.append(problem_category_helper(problem_category))
-        return new_problem_categories
+        new_problem_categories = await insert_documents(problem_category_collection,
+                                                        problem_category_data)
+        return [problem_category_helper(problem_category)
+                for problem_category in new_problem_categories]
     except:
         logger.error(f"{traceback.format_exc()}")
         return MessageException("Error when add problem_category",
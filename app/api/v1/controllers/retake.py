@@ -3,15 +3,12 @@ from app.utils import utc_to_local, MessageException, Logger
 from fastapi import status
 from typing import List
 from app.core.database import mongo_db
+from app.core.persistence import insert_document
 from bson.objectid import ObjectId
 
 logger = Logger("controllers/retake", log_file="retake.log")
 
-try:
-    retake_collection = mongo_db["retake"]
-except Exception as e:
-    logger.error(f"Error when connect to collection: {e}")
-    exit(1)
+retake_collection = mongo_db["retake"]
 
 
 # helper 
@@ -33,8 +30,7 @@ async def add_retake(retake_data: dict) -> dict:
     """
     try:
         retake_data["exam_id"] = ObjectId(retake_data["exam_id"])
-        retake = await retake_collection.insert_one(retake_data)
-        new_retake = await retake_collection.find_one({"_id": retake.inserted_id})
+        new_retake = await insert_document(retake_collection, retake_data)
         return retake_helper(new_retake)
     except:
         logger.error(f"{traceback.format_exc()}")
@@ -151,6 +147,31 @@ async def retrieve_retakes_by_user_exam_id(clerk_user_id: str,
                                 status.HTTP_500_INTERNAL_SERVER_ERROR)
 
 
+async def retrieve_retakes_by_user_exam_ids(clerk_user_id: str,
+                                           exam_ids: List[str]
+                                           ) -> list | MessageException:
+    """
+    Retrieve retakes of a user for many exams, in one query
+    :param clerk_user_id: str
+    :param exam_ids: list of str
+    :return: list
+    """
+    try:
+        retakes = []
+        async for retake in retake_collection.find(
+            {
+                "clerk_user_id": clerk_user_id,
+                "exam_id": {"$in": [ObjectId(exam_id) for exam_id in exam_ids]}
+            }
+        ):
+            retakes.append(retake_helper(retake))
+        return retakes
+    except:
+        logger.error(f"{traceback.format_exc()}")
+        return MessageException("Error when retrieve retakes",
+                                status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+
 async def retrieve_retakes_unsubmit(submission_retake_ids: List[ObjectId]) -> list | MessageException:
     """
     Retrieve retakes that have not been submitted
@@ -2,15 +2,13 @@ import traceback
 from app.utils import utc_to_local, MessageException, Logger
 from fastapi import status
 from app.core.database import mongo_db
+from app.core.persistence import insert_document
+from pymongo.errors import DuplicateKeyError
 
 
 logger = Logger("controllers/shortener", log_file="shortener.log")
 
-try:
-    shortener_collection = mongo_db["shortener"]
-except Exception as e:
-    logger.error(f"Error when connect to collection: {e}")
-    exit(1)
+shortener_collection = mongo_db["shortener"]
 
 # shortener helper
 def shortener_helper(shortener) -> dict:
@@ -30,18 +28,12 @@ async def add_short_url(shortener_data: dict) -> dict | MessageException:
     :return: dict
     """
     try:
-        # Check the short url is already exist
-        short_url = await shortener_collection.find_one({
-            "short_url": shortener_data["short_url"]
-        })
-        if short_url:
-            return MessageException("Short url already exist",
-                                    status.HTTP_400_BAD_REQUEST)
-        data = await shortener_collection.insert_one(shortener_data)
-        new_data = await shortener_collection.find_one({
-            "_id": data.inserted_id
-        })
+        # The short url is unique
+        new_data = await insert_document(shortener_collection, shortener_data)
         return shortener_helper(new_data)
+    except DuplicateKeyError:
+        return MessageException("Short url already exist",
+                                status.HTTP_400_BAD_REQUEST)
     except:
         logger.error(f"{traceback.format_exc()}")
         return MessageException("Error when add new short url",
@@ -1,26 +1,43 @@
 import traceback
 from app.utils import utc_to_local, MessageException, Logger
 from fastapi import status
-from app.core.database import mongo_client, mongo_db
+from app.core.database import mongo_db
+from app.core.transactions import run_transaction
+from app.core.persistence import insert_document, update_document
 from bson.objectid import ObjectId
 from datetime import datetime, UTC
+from pymongo import ReplaceOne
+from app.api.v1.controllers.leaderboard import (
+    record_leaderboard_score,
+    remove_leaderboard_submissions
+)
+from app.api.v1.controllers.analytics import invalidate_analytics
+from app.api.v1.controllers.draft_buffer import draft_buffer, draft_key
 
 
 logger = Logger("controllers/submission", log_file="submission.log")
 
-try:
-    submission_collection = mongo_db["submissions"]
-    draft_submission_collection = mongo_db["draft_submissions"]
-    retake_collection = mongo_db["retake"]
-    timer_collection = mongo_db["timer"]
-    certificate_collection = mongo_db["certificate"]
-except Exception as e:
-    logger.error(f"Error when connect to collection: {e}")
-    exit(1)
+submission_collection = mongo_db["submissions"]
+draft_submission_collection = mongo_db["draft_submissions"]
+retake_collection = mongo_db["retake"]
+timer_collection = mongo_db["timer"]
+certificate_collection = mongo_db["certificate"]
+testcase_result_collection = mongo_db["submission_testcases"]
+
+
+# Submissions of the lists, read without their submitted problems
+SUBMISSION_SUMMARY_PROJECTION = {"submitted_problems": 0}
 
 
 # submission helper
 def submission_helper(submission) -> dict:
+    return {
+        **submission_summary_helper(submission),
+        "submitted_problems": submission["submitted_problems"],
+    }
+
+# helper of the submissions read with SUBMISSION_SUMMARY_PROJECTION
+def submission_summary_helper(submission) -> dict:
     retake_id = submission.get("retake_id", None)
     retake_id = str(retake_id) if retake_id else None
     return {
@@ -28,7 +45,6 @@ def submission_helper(submission) -> dict:
         "exam_id": str(submission["exam_id"]),
         "clerk_user_id": submission["clerk_user_id"],
         "retake_id": retake_id,
-        "submitted_problems": submission["submitted_problems"],
         "total_problems": submission["total_problems"],
         "total_score": submission["total_score"],
         "max_score": submission["max_score"],
@@ -68,6 +84,98 @@ def update_helper(submission: dict) -> dict:
     return submission
 
 
+def split_testcase_results(submitted_problems: list | None) -> tuple[list | None, list]:
+    """
+    Split the per-testcase results out of the submitted problems.
+    The submitted problems keep a compact verdict (passed/total testcases),
+    the detail results are returned to be stored in "submission_testcases".
+    :param submitted_problems: list
+    :return: (list, list)
+    """
+    if submitted_problems is None:
+        return None, []
+
+    compact_problems = []
+    testcase_results = []
+    for problem in submitted_problems:
+        problem = dict(problem)
+        testcase_result = {"problem_id": problem["problem_id"]}
+        has_results = False
+        for kind in ["public", "private"]:
+            results = problem.pop(f"{kind}_testcases_results", None)
+            problem[f"{kind}_testcases_results"] = None
+            testcase_result[f"{kind}_testcases_results"] = results
+            if results is None:
+                # Keep the verdict of an already compacted problem
+                problem.setdefault(f"{kind}_testcases_passed", None)
+                problem.setdefault(f"{kind}_testcases_total", None)
+                continue
+            has_results = True
+            problem[f"{kind}_testcases_passed"] = sum(1 for result in results if result.get("is_pass"))
+            problem[f"{kind}_testcases_total"] = len(results)
+        compact_problems.append(problem)
+        if has_results:
+            testcase_results.append(testcase_result)
+    return compact_problems, testcase_results
+
+
+async def upsert_testcase_results(submission_id: str | ObjectId, 
+                                  testcase_results: list,
+                                  complete: bool = False,
+                                  session=None) -> None:
+    """
+    Replace the testcase results of a submission
+    :param submission_id: str | ObjectId
+    :param testcase_results: list
+    :param complete: bool, the results of every problem of the submission:
+        the stored results of the other problems are removed
+    """
+    submission_id = ObjectId(submission_id)
+    operations = [
+        ReplaceOne(
+            {"submission_id": submission_id, "problem_id": result["problem_id"]},
+            {**result, "submission_id": submission_id, "created_at": datetime.now(UTC)},
+            upsert=True
+        ) for result in testcase_results
+    ]
+    if operations:
+        await testcase_result_collection.bulk_write(operations, ordered=False, session=session)
+    if complete:
+        # Remove results of problems that are no longer in the submission
+        await testcase_result_collection.delete_many(
+            {
+                "submission_id": submission_id,
+                "problem_id": {"$nin": [result["problem_id"] for result in testcase_results]}
+            },
+            session=session
+        )
+
+
+async def attach_testcase_results(submission_id: str | ObjectId,
+                                  submitted_problems: list | None) -> list | None:
+    """
+    Load the testcase results of a submission (detail view only)
+    and attach them to the submitted problems.
+    :param submission_id: str | ObjectId
+    :param submitted_problems: list
+    :return: list
+    """
+    if not submitted_problems:
+        return submitted_problems
+    testcase_results = {}
+    async for result in testcase_result_collection.find({"submission_id": ObjectId(submission_id)}):
+        testcase_results[result["problem_id"]] = result
+
+    for problem in submitted_problems:
+        result = testcase_results.get(problem["problem_id"])
+        if result is None:
+            # Not migrated yet, the results are still embedded
+            continue
+        problem["public_testcases_results"] = result["public_testcases_results"]
+        problem["private_testcases_results"] = result["private_testcases_results"]
+    return submitted_problems
+
+
 async def add_submission(submission_data: dict, error_dict=False) -> dict:
     """
     Create a new submission in the database
@@ -76,10 +184,12 @@ async def add_submission(submission_data: dict, error_dict=False) -> dict:
     """
     try:
         submission_data = ObjectId_helper(submission_data)
-        submission = await submission_collection.insert_one(submission_data)
-        new_submission = await submission_collection.find_one(
-            {"_id": submission.inserted_id}
-        )
+        submitted_problems, testcase_results = split_testcase_results(
+            submission_data.get("submitted_problems"))
+        submission_data["submitted_problems"] = submitted_problems
+        new_submission = await insert_document(submission_collection, submission_data)
+        if testcase_results:
+            await upsert_testcase_results(new_submission["_id"], testcase_results)
         return submission_helper(new_submission)
     except:
         logger.error(f"{traceback.format_exc()}")
@@ -93,15 +203,18 @@ async def add_submission(submission_data: dict, error_dict=False) -> dict:
         return MessageException(msg, status_code)
 
 
-async def retrieve_submissions() -> list:
+async def retrieve_submissions(summary: bool = False) -> list:
     """
     Retrieve all submissions from database
+    :param summary: bool, without the submitted problems
     :return: list
     """
     try:
         submissions = []
-        async for submission in submission_collection.find():
-            return_data = submission_helper(submission)
+        projection = SUBMISSION_SUMMARY_PROJECTION if summary else None
+        helper = submission_summary_helper if summary else submission_helper
+        async for submission in submission_collection.find({}, projection):
+            return_data = helper(submission)
             submissions.append(return_data)
         return submissions
     except:
@@ -145,16 +258,20 @@ async def retrieve_submission_by_id(id: str) -> dict:
                                 status.HTTP_500_INTERNAL_SERVER_ERROR)
 
 
-async def retrieve_submission_by_exam_id(exam_id: str) -> list:
+async def retrieve_submission_by_exam_id(exam_id: str, summary: bool = False) -> list:
     """
     Retrieve all submissions by exam ID
     :param exam_id: str
+    :param summary: bool, without the submitted problems
     :return: list
     """
     try:
         submissions = []
-        async for submission in submission_collection.find({"exam_id": ObjectId(exam_id)}):
-            return_data = submission_helper(submission)
+        projection = SUBMISSION_SUMMARY_PROJECTION if summary else None
+        helper = submission_summary_helper if summary else submission_helper
+        async for submission in submission_collection.find({"exam_id": ObjectId(exam_id)},
+                                                           projection):
+            return_data = helper(submission)
             submissions.append(return_data)
         return submissions
     except:
@@ -241,12 +358,14 @@ async def retrieve_submission_by_id_user_retake(exam_id: str,
 
 async def update_submission(id: str, 
                             submission_data: dict,
-                            error_dict: bool = False
+                            error_dict: bool = False,
+                            contest_id: str | None = None
                             ) -> dict | MessageException:
     """
     Update a submission with a matching ID
     :param id: str
     :param data: dict
+    :param contest_id: str, record the new score in the contest leaderboard
     :return: dict
     """
     try:
@@ -260,10 +379,32 @@ async def update_submission(id: str,
                                    status.HTTP_400_BAD_REQUEST)
 
         submission_data = update_helper(submission_data)
-        updated_submission = await submission_collection.update_one(
-            {"_id": ObjectId(id)}, {"$set": submission_data}
-        )
-        if updated_submission.modified_count == 0:
+        testcase_results, complete = [], False
+        if "submitted_problems" in submission_data:
+            submitted_problems, testcase_results = split_testcase_results(
+                submission_data["submitted_problems"])
+            submission_data["submitted_problems"] = submitted_problems
+            # Problems passed already compacted keep their stored results
+            complete = (submitted_problems is not None
+                        and len(testcase_results) == len(submitted_problems))
+
+        # The results are only written for an existing submission (the
+        # timeout job may update a submission deleted in between)
+        async def update(session):
+            new_submission = await update_document(submission_collection,
+                                                   {"_id": ObjectId(id)},
+                                                   {"$set": submission_data},
+                                                   session=session)
+            if new_submission and (testcase_results or complete):
+                await upsert_testcase_results(id, testcase_results, complete,
+                                              session=session)
+            return new_submission
+
+        if testcase_results or complete:
+            new_submission = await run_transaction("update_submission", update)
+        else:
+            new_submission = await update(None)
+        if not new_submission:
             if error_dict:
                 return {
                     "message": "Error when update submission",
@@ -271,7 +412,11 @@ async def update_submission(id: str,
                 }
             raise MessageException("Error when update submission",
                                    status.HTTP_400_BAD_REQUEST)
-        new_submission = await submission_collection.find_one({"_id": ObjectId(id)})
+        await invalidate_analytics(new_submission["exam_id"])
+        if contest_id and new_submission.get("submitted_problems") is not None:
+            recorded = await record_leaderboard_score(contest_id, new_submission)
+            if isinstance(recorded, MessageException):
+                logger.warning(f"Leaderboard not updated for submission {id}: {recorded.message}")
         return submission_helper(new_submission)
     except MessageException as e:
         if error_dict:
@@ -295,48 +440,47 @@ async def update_submission(id: str,
 async def upsert_draft_submission(draft_submission_data: dict
                                   ) -> dict | bool | MessageException:
     """
-    Upsert a draft submission with a matching ID
-    :param draft_id: str
-    :param submission_data: dict
+    Save the draft version of a submission. Saves are buffered and
+    coalesced by the draft buffer, only the last one is written.
+    :param draft_submission_data: dict
     :return: dict
     """
-    try:        
-        draft_submission_data["exam_id"] = ObjectId(draft_submission_data["exam_id"])
-        draft_submission_data["clerk_user_id"] = draft_submission_data["clerk_user_id"]
-        retake_id = draft_submission_data.get("retake_id", None)
-        if retake_id is not None:
-            draft_submission_data["retake_id"] = ObjectId(retake_id)
-
-        draft_submission = await draft_submission_collection.update_one(
-            {
-                "exam_id": draft_submission_data["exam_id"], 
-                "clerk_user_id": draft_submission_data["clerk_user_id"], 
-                "retake_id": draft_submission_data["retake_id"]
-            }, 
-            {
-                "$set": draft_submission_data,
-                "$setOnInsert": {"created_at": datetime.now(UTC)}
-            },
-            upsert=True
-        )
-        if draft_submission.upserted_id:
+    try:
+        created = await draft_buffer.save(draft_submission_data)
+        if created:
             return {
                 "detail": "Draft submission created",
             }
-        if draft_submission.modified_count == 0:
-            raise MessageException("Error when update draft submission",
-                                   status.HTTP_400_BAD_REQUEST)
         return {
             "detail": "Draft submission updated",
         }
-    except MessageException as e:
-        return e
     except:
         logger.error(f"{traceback.format_exc()}")
         return MessageException("Error when update draft submission",
                                 status.HTTP_500_INTERNAL_SERVER_ERROR)
 
 
+async def flush_draft_submission(exam_id: str,
+                                 retake_id: str | None,
+                                 clerk_user_id: str
+                                 ) -> bool | MessageException:
+    """
+    Write the buffered draft of a submission right away, used on submit
+    :param exam_id: str
+    :param retake_id: str
+    :param clerk_user_id: str
+    :return: bool
+    """
+    try:
+        await draft_buffer.flush(draft_key(exam_id, retake_id, clerk_user_id),
+                                 forget=True, shared=True)
+        return True
+    except:
+        logger.error(f"{traceback.format_exc()}")
+        return MessageException("Error when save draft submission",
+                                status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+
 async def retrieve_draft_submission(exam_id: str,
                                     retake_id: str | None,
                                     clerk_user_id: str,
@@ -351,6 +495,8 @@ async def retrieve_draft_submission(exam_id: str,
     :return dict
     """
     try:
+        # The latest autosave may still be in a buffer, of any worker
+        await draft_buffer.flush(draft_key(exam_id, retake_id, clerk_user_id), shared=True)
         if retake_id is not None:
             retake_id = ObjectId(retake_id)
 
@@ -396,32 +542,45 @@ async def delete_submission(id: str) -> bool:
     :param id: str
     :return: bool
     """
-    async with await mongo_client.start_session() as session:
-        try:
-            async with session.start_transaction():
-                submission_info = await retrieve_submission_by_id(id)
-                retake_id = ObjectId(submission_info["retake_id"]) if submission_info["retake_id"] else None
-                if retake_id:
-                    await retake_collection.delete_one({"_id": retake_id}, session=session)
-
-                # Delete timer
-                await timer_collection.delete_one(
-                    {"exam_id": ObjectId(submission_info["exam_id"]),
-                    "retake_id": retake_id,
-                    "clerk_user_id": submission_info["clerk_user_id"]}, session=session)
+    submission_info = await retrieve_submission_by_id(id)
+    if isinstance(submission_info, MessageException):
+        return submission_info
+    retake_id = ObjectId(submission_info["retake_id"]) if submission_info["retake_id"] else None
 
-                # Delete certificate
-                await certificate_collection.delete_one({"submission_id": ObjectId(submission_info["id"])}, session=session)
+    async def delete(session):
+        if retake_id:
+            await retake_collection.delete_one({"_id": retake_id}, session=session)
 
-                # Delete submission
-                await submission_collection.delete_one({"_id": ObjectId(id)}, session=session)
+        # Delete timer
+        await timer_collection.delete_one(
+            {"exam_id": ObjectId(submission_info["exam_id"]),
+             "retake_id": retake_id,
+             "clerk_user_id": submission_info["clerk_user_id"]}, session=session)
 
-        except:
-            logger.error(f"{traceback.format_exc()}")
-            return MessageException("Error when delete submission",
-                                    status.HTTP_500_INTERNAL_SERVER_ERROR)
-        else:
-            return True
+        # Delete certificate, its submission_id is stored as a string
+        await certificate_collection.delete_one(
+            {"submission_id": {"$in": [id, ObjectId(id)]}}, session=session)
+
+        # Delete testcase results
+        await testcase_result_collection.delete_many({"submission_id": ObjectId(id)}, session=session)
+
+        # Delete submission
+        await submission_collection.delete_one({"_id": ObjectId(id)}, session=session)
+
+    try:
+        await run_transaction("delete_submission", delete)
+    except:
+        logger.error(f"{traceback.format_exc()}")
+        return MessageException("Error when delete submission",
+                                status.HTTP_500_INTERNAL_SERVER_ERROR)
+    await invalidate_analytics(submission_info["exam_id"])
+    try:
+        await remove_leaderboard_submissions([ObjectId(id)])
+    except:
+        # The submission is deleted, the leaderboard can be rebuilt
+        logger.error(f"Leaderboard not updated for deleted submission {id}: "
+                     f"{traceback.format_exc()}")
+    return True
 
 
 async def delete_draft_submission(exam_id: str,
@@ -437,6 +596,7 @@ async def delete_draft_submission(exam_id: str,
         :return: bool
         """
         try:
+            await draft_buffer.discard(draft_key(exam_id, retake_id, clerk_user_id))
             if retake_id is not None:
                 retake_id = ObjectId(retake_id)
     
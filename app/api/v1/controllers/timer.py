@@ -1,6 +1,9 @@
 import traceback
 from datetime import datetime, UTC
 from app.core.database import mongo_db
+from app.core.persistence import insert_document
+from app.core.cache import get_exam_doc, get_contest_doc
+from app.api.v1.controllers.user import retrieve_user
 from app.utils import (
     MessageException,
     Logger, 
@@ -8,21 +11,15 @@ from app.utils import (
 )
 from fastapi import status
 from bson.objectid import ObjectId
+from pymongo.errors import DuplicateKeyError
 import inngest
 from app.inngest.client import inngest_client
 
 
 logger = Logger("controllers/timer", log_file="timer.log")
 
-try:
-    timer_collection = mongo_db["timer"]
-    submission_collection = mongo_db["submissions"]
-    user_collection = mongo_db["users"]
-    exam_collection = mongo_db["exams"]
-    contest_collection = mongo_db["contests"]
-except Exception as e:
-    logger.error(f"Error when connect to collection: {e}")
-    exit(1)
+timer_collection = mongo_db["timer"]
+submission_collection = mongo_db["submissions"]
 
 
 # helper
@@ -55,11 +52,10 @@ async def add_timer(timer_data_input: dict) -> dict | MessageException:
     - Check if exam is active
     - Check if the contest is active
     - Check if the cohort of user has the permission
-    - Check if the timer already exists
     - Check if the pseudo submission already exists
 
     Then, add some things:
-    - Add a timer
+    - Add a timer, if it does not exist yet
     - Add a pseudo submission
 
     :param timer_data: dict
@@ -77,8 +73,11 @@ async def add_timer(timer_data_input: dict) -> dict | MessageException:
         retake_id = timer_data["retake_id"]
         clerk_user_id = timer_data["clerk_user_id"]
 
+        # Exam, contest and user are read through the caches: at the start
+        # of an exam every student hits them at once, concurrent misses
+        # share a single query
         # Check if exam is active
-        exam_info = await exam_collection.find_one({"_id": exam_id})
+        exam_info = await get_exam_doc(exam_id)
         if not exam_info:
             raise MessageException("Exam not found", status.HTTP_404_NOT_FOUND)
         if not exam_info["is_active"]:
@@ -86,7 +85,7 @@ async def add_timer(timer_data_input: dict) -> dict | MessageException:
         
 
         # Check if the contest is active
-        contest_info = await contest_collection.find_one({"_id": exam_info["contest_id"]})
+        contest_info = await get_contest_doc(exam_info["contest_id"])
         if not contest_info:
             raise MessageException("Contest not found", status.HTTP_404_NOT_FOUND)
         if not contest_info["is_active"]:
@@ -94,7 +93,9 @@ async def add_timer(timer_data_input: dict) -> dict | MessageException:
 
 
         # Check if the cohort of user has the permission
-        user_info = await user_collection.find_one({"clerk_user_id": clerk_user_id})
+        user_info = await retrieve_user(clerk_user_id)
+        if isinstance(user_info, MessageException):
+            raise user_info
         if not user_info:
             raise MessageException("User not found", status.HTTP_404_NOT_FOUND)
         user_cohort = user_info["cohort"]
@@ -104,17 +105,10 @@ async def add_timer(timer_data_input: dict) -> dict | MessageException:
                                    status.HTTP_403_FORBIDDEN)
 
 
-        # Check if the timer already exists
-        timer_info = await timer_collection.find_one({
-            "exam_id": exam_id,
-            "retake_id": retake_id,
-            "clerk_user_id": clerk_user_id
-        })
-        if timer_info:
-            raise MessageException("Timer already exists", status.HTTP_400_BAD_REQUEST)
-
-
-        # Check if the pseudo submission already exists
+        # Check if the pseudo submission already exists. Kept as a read: the
+        # pseudo submission is inserted later by the background function, its
+        # unique index cannot refuse this start. Without it, a restart after the
+        # timer alone was deleted would start an exam which is never submitted.
         submission_info = await submission_collection.find_one({
                 "exam_id": exam_id,
                 "retake_id": retake_id,
@@ -124,9 +118,12 @@ async def add_timer(timer_data_input: dict) -> dict | MessageException:
             raise MessageException("Pseudo submission already exists", status.HTTP_400_BAD_REQUEST)
         
 
-        # Add a timer
-        inserted_timer = await timer_collection.insert_one(timer_data)
-        new_timer = await timer_collection.find_one({"_id": inserted_timer.inserted_id})
+        # Add a timer, unique by exam, user and retake: a second start
+        # (e.g. two tabs) fails on the index instead of a prior read
+        try:
+            new_timer = await insert_document(timer_collection, timer_data)
+        except DuplicateKeyError:
+            raise MessageException("Timer already exists", status.HTTP_400_BAD_REQUEST)
 
         str_exam_id = str(exam_info['_id'])
         str_retake_id = str(timer_data_input["retake_id"]) if timer_data_input["retake_id"] else None
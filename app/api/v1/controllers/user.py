@@ -2,18 +2,46 @@ import traceback
 import requests
 from fastapi import status
 from app.core.config import settings
-from app.utils import utc_to_local, MessageException, Logger
+from app.utils import utc_to_local, MessageException, Logger, is_duplicate_key
 from requests.exceptions import HTTPError, Timeout
-from app.core.database import mongo_client, mongo_db
+from app.core.database import mongo_db
+from app.core.transactions import run_transaction
+from app.core.persistence import insert_document
 from pymongo import UpdateOne
+from pymongo.errors import DuplicateKeyError
+from app.core.cache import ReadThroughCache, cache_backend
+from app.core.counters import SequenceAllocator
+from app.core.cascade import find_reference
 
 logger = Logger("controllers/user", log_file="user.log")
 
-try:
-    user_collection = mongo_db["users"]
-except Exception as e:
-    logger.error(f"Error when connect to collection: {e}")
-    exit(1)
+user_collection = mongo_db["users"]
+
+# clerk_user_id -> user_helper(user)
+user_cache = ReadThroughCache("user",
+                              maxsize=settings.USER_CACHE_SIZE,
+                              ttl=settings.USER_CACHE_TTL,
+                              backend=cache_backend)
+
+# Attendance ids of the users, "0000", "0001", ...
+attend_id_allocator = SequenceAllocator("attend_id",
+                                        collection_name="users",
+                                        field="attend_id",
+                                        width=4)
+# Allocations tried when the allocated id is already taken (set by a script)
+ATTEND_ID_ATTEMPTS = 5
+
+
+async def invalidate_users_by_email(emails: set | list) -> None:
+    """
+    Drop the cached users with a matching email (role/cohort changes by email)
+    :param emails: set | list
+    """
+    emails = list(set(emails))
+    if emails:
+        async for user in user_collection.find({"email": {"$in": emails}},
+                                               {"clerk_user_id": 1}):
+            user_cache.invalidate(user["clerk_user_id"])
 
 # helper
 def user_helper(user) -> dict:
@@ -77,37 +105,34 @@ def whitelist_helper(user) -> dict:
     }
 
 
-async def find_missing_attend_id(user_collection) -> str:
-    """
-    Find the smallest missing attend_id in the user collection
-    :param user_collection: collection
-    :return: str
-    """
-    cursor = user_collection.find({}, {"attend_id": 1})
-    attend_ids = set()  # Use a set for faster lookup
-
-    async for user in cursor:
-        attend_ids.add(user["attend_id"])
-
-    missing_attend_ids = "0".zfill(4)
-    while missing_attend_ids in attend_ids:
-        missing_attend_ids = str(int(missing_attend_ids) + 1).zfill(4)
-
-    return missing_attend_ids
-
-
 async def add_user(user_data: dict) -> dict:
     """
-    Create a new user
+    Create a new user, with the next attend_id
     :param user_data: dict
     :return: dict
     """
     try:
-        attend_id = await find_missing_attend_id(user_collection)
-        user_data["attend_id"] = attend_id
-        user = await user_collection.insert_one(user_data)
-        new_user = await user_collection.find_one({"_id": user.inserted_id})
-        return user_helper(new_user)
+        for _ in range(ATTEND_ID_ATTEMPTS):
+            user_data["attend_id"] = await attend_id_allocator.allocate()
+            try:
+                new_user = await insert_document(user_collection, user_data)
+                return user_helper(new_user)
+            except DuplicateKeyError as e:
+                if is_duplicate_key(e, "attend_id"):
+                    logger.warning(f"attend_id {user_data['attend_id']} already taken")
+                    continue
+                await attend_id_allocator.release(user_data["attend_id"])
+                if not is_duplicate_key(e, "clerk_user_id"):
+                    raise
+                # Concurrent first login of the same user
+                existing_user = await user_collection.find_one(
+                    {"clerk_user_id": user_data["clerk_user_id"]}
+                )
+                return user_helper(existing_user)
+        raise MessageException("No attend_id available",
+                               status.HTTP_500_INTERNAL_SERVER_ERROR)
+    except MessageException as e:
+        return e
     except:
         logger.error(f"{traceback.format_exc()}")
         return MessageException("Error when add user",
@@ -130,16 +155,25 @@ async def retrieve_users() -> list[dict]:
                                 status.HTTP_500_INTERNAL_SERVER_ERROR)
 
 
-async def retrieve_user(clerk_user_id: str) -> dict:
+async def load_user(clerk_user_id: str) -> dict | None:
+    user = await user_collection.find_one({"clerk_user_id": clerk_user_id})
+    if user:
+        return user_helper(user)
+
+
+async def retrieve_user(clerk_user_id: str, use_cache: bool = True) -> dict:
     """
     Retrieve a user with a matching ID
     :param clerk_user_id: str
+    :param use_cache: bool, False to read the database (and refresh the cache)
     :return: dict
     """
     try:
-        user = await user_collection.find_one({"clerk_user_id": clerk_user_id})
+        if not use_cache:
+            user_cache.invalidate(clerk_user_id)
+        user = await user_cache.get(clerk_user_id, lambda: load_user(clerk_user_id))
         if user:
-            return user_helper(user)
+            return user
     except:
         logger.error(f"{traceback.format_exc()}")
         return MessageException("Error when retrieve user",
@@ -242,6 +276,7 @@ async def update_user(clerk_user_id: str, data: dict) -> bool:
         updated_user = await user_collection.update_one(
             {"clerk_user_id": clerk_user_id}, {"$set": data}
         )
+        user_cache.invalidate(clerk_user_id)
         if updated_user.modified_count == 0:
             raise MessageException("Update user failed",
                                    status.HTTP_400_BAD_REQUEST)
@@ -334,6 +369,7 @@ async def upsert_admin_list(new_admins: list[dict]) -> bool:
         if operations:
             result = await user_collection.bulk_write(operations)
             logger.info(f"Bulk write result: {result.bulk_api_result}")
+            await invalidate_users_by_email(emails_to_upgrade | emails_to_downgrade)
         return True
     except:
         logger.error(f"{traceback.format_exc()}")
@@ -352,41 +388,20 @@ async def delete_user_by_clerk_user_id(clerk_user_id: str) -> bool:
         if not user_info:
             raise MessageException("User not found", status.HTTP_404_NOT_FOUND)
         
-        # Check if user is in other collections
-        # 1. Problem: creator_id
-        problems = await mongo_db["problems"].find({"creator_id": clerk_user_id}).to_list(length=None)
-        if problems:
-            raise MessageException("User is a creator of some problems", status.HTTP_400_BAD_REQUEST)
-        
-        # 2. Exam: creator_id
-        exams = await mongo_db["exams"].find({"creator_id": clerk_user_id}).to_list(length=None)
-        if exams:
-            raise MessageException("User is a creator of some exams", status.HTTP_400_BAD_REQUEST)
-        
-        # 3. Problem-Exam: creator_id
-        problem_exams = await mongo_db["problem_exams"].find({"creator_id": clerk_user_id}).to_list(length=None)
-        if problem_exams:
-            raise MessageException("User is a creator of some problem-exams", status.HTTP_400_BAD_REQUEST)
-        
-        # 4. Contest: creator_id
-        contests = await mongo_db["contests"].find({"creator_id": clerk_user_id}).to_list(length=None)
-        if contests:
-            raise MessageException("User is a creator of some contests", status.HTTP_400_BAD_REQUEST)
-
-        # 5. Meeting: creator_id
-        meetings = await mongo_db["meetings"].find({"creator_id": clerk_user_id}).to_list(length=None)
-        if meetings:
-            raise MessageException("User is a creator of some meetings", status.HTTP_400_BAD_REQUEST)
-        
-        # 6. Document: creator_id
-        documents = await mongo_db["documents"].find({"creator_id": clerk_user_id}).to_list(length=None)
-        if documents:
-            raise MessageException("User is a creator of some documents", status.HTTP_400_BAD_REQUEST)
-        
-        # 7. Submission: clerk_user_id
-        submissions = await mongo_db["submissions"].find({"clerk_user_id": clerk_user_id}).to_list(length=None)
-        if submissions:
-            raise MessageException("User is a creator of some submissions", status.HTTP_400_BAD_REQUEST)
+        # Check if user is in other collections, one document is enough
+        references = [
+            ("problems", {"creator_id": clerk_user_id}),
+            ("exams", {"creator_id": clerk_user_id}),
+            ("exam_problem", {"creator_id": clerk_user_id}),
+            ("contests", {"creator_id": clerk_user_id}),
+            ("meetings", {"creator_id": clerk_user_id}),
+            ("documents", {"creator_id": clerk_user_id}),
+            ("submissions", {"clerk_user_id": clerk_user_id}),
+        ]
+        referencing = await find_reference(references)
+        if referencing is not None:
+            name = "problem-exams" if referencing == "exam_problem" else referencing
+            raise MessageException(f"User is a creator of some {name}", status.HTTP_400_BAD_REQUEST)
         
     except MessageException as e:
         return e
@@ -396,24 +411,33 @@ async def delete_user_by_clerk_user_id(clerk_user_id: str) -> bool:
                                 status.HTTP_500_INTERNAL_SERVER_ERROR)
                                 
     
-    async with await mongo_client.start_session() as session:
-        try:
-            async with session.start_transaction():
-                # Del attendees
-                await mongo_db["attendees"].delete_many(
-                    {"attend_id": user_info["attend_id"]}, session=session)
-
-                # Delete user
-                deleted_user = await user_collection.delete_one(
-                    {"clerk_user_id": clerk_user_id}, session=session)
-                
-        except:
-            logger.error(f"{traceback.format_exc()}")
-            return MessageException("Error when delete user",
-                                    status.HTTP_500_INTERNAL_SERVER_ERROR)
-        else:
-            if deleted_user.deleted_count == 0:
-                raise MessageException("Delete user failed",
-                                       status.HTTP_400_BAD_REQUEST)
-            return True
+    async def delete(session):
+        # Del attendees
+        await mongo_db["attendees"].delete_many(
+            {"attend_id": user_info["attend_id"]}, session=session)
+
+        # Del leaderboard entries
+        await mongo_db["leaderboards"].delete_many(
+            {"clerk_user_id": clerk_user_id}, session=session)
+
+        # The attend_id is free to reuse
+        if user_info.get("attend_id"):
+            await attend_id_allocator.release(user_info["attend_id"],
+                                              session=session)
+
+        # Delete user
+        return await user_collection.delete_one(
+            {"clerk_user_id": clerk_user_id}, session=session)
+
+    try:
+        deleted_user = await run_transaction("delete_user", delete)
+    except:
+        logger.error(f"{traceback.format_exc()}")
+        return MessageException("Error when delete user",
+                                status.HTTP_500_INTERNAL_SERVER_ERROR)
+    user_cache.invalidate(clerk_user_id)
+    if deleted_user.deleted_count == 0:
+        return MessageException("Delete user failed",
+                                status.HTTP_400_BAD_REQUEST)
+    return True
         
\ No newline at end of file
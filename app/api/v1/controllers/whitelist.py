@@ -1,18 +1,18 @@
 import traceback
 from fastapi import status
 from app.utils import utc_to_local, MessageException,Logger
-from app.core.database import mongo_client, mongo_db
+from app.core.database import mongo_db
+from app.core.transactions import run_transaction
+from app.core.persistence import insert_document, update_document
 from bson.objectid import ObjectId
 from pymongo import UpdateOne, DeleteOne
+from pymongo.errors import DuplicateKeyError
+from app.api.v1.controllers.user import invalidate_users_by_email
 
 logger = Logger("controllers/user", log_file="user.log")
 
-try:
-    whitelist_collection = mongo_db["whitelists"]
-    user_collection = mongo_db["users"]
-except Exception as e:
-    logger.error(f"Error when connect to collection: {e}")
-    exit(1)
+whitelist_collection = mongo_db["whitelists"]
+user_collection = mongo_db["users"]
 
 # Helper
 def whitelist_helper(user) -> dict:
@@ -34,14 +34,12 @@ async def add_whitelist(whitelist_data: dict) -> dict | MessageException:
     :return: dict
     """
     try:
-        # Check the email is already in the whitelist
-        email = whitelist_data["email"]
-        if await whitelist_collection.find_one({"email": email}):
-            raise MessageException("Email already in whitelist",
-                                   status.HTTP_400_BAD_REQUEST)
-        whitelist = await whitelist_collection.insert_one(whitelist_data)
-        new_whitelist = await whitelist_collection.find_one({"_id": whitelist.inserted_id})
+        # The email is unique in the whitelist
+        new_whitelist = await insert_document(whitelist_collection, whitelist_data)
         return whitelist_helper(new_whitelist)
+    except DuplicateKeyError:
+        return MessageException("Email already in whitelist",
+                                status.HTTP_400_BAD_REQUEST)
     except:
         logger.error(f"{traceback.format_exc()}")
         return MessageException("Error when add whitelist",
@@ -91,6 +89,7 @@ async def upsert_whitelist(new_whitelists: list[dict],
             if downgrade_operations:
                 downgrade_result = await user_collection.bulk_write(downgrade_operations)
                 logger.info(f"Bulk write downgrade result: {downgrade_result.bulk_api_result}")
+                await invalidate_users_by_email(emails_to_delete)
 
         if operations:
             result = await whitelist_collection.bulk_write(operations)
@@ -190,17 +189,12 @@ async def update_whitelist_by_id(id: str, data: dict) -> dict | MessageException
         if len(data) < 1:
             raise MessageException("No data to update", 
                                    status.HTTP_400_BAD_REQUEST)
-        current_whitelist = await whitelist_collection.find_one({"_id": ObjectId(id)})
-        if not current_whitelist:
-            raise Exception("Whitelist not found")
-        
-        updated = await whitelist_collection.update_one(
-            {"_id": ObjectId(id)}, {"$set": data}
-        )
-        if updated.modified_count == 0:
-            raise MessageException("Update whitelist failed",
-                                   status.HTTP_400_BAD_REQUEST)
-        updated_whitelist = await whitelist_collection.find_one({"_id": ObjectId(id)})
+        updated_whitelist = await update_document(whitelist_collection,
+                                                  {"_id": ObjectId(id)},
+                                                  {"$set": data})
+        if not updated_whitelist:
+            raise MessageException("Whitelist not found",
+                                   status.HTTP_404_NOT_FOUND)
         return whitelist_helper(updated_whitelist)
     
     except MessageException as e:
@@ -254,25 +248,25 @@ async def delete_whitelist_by_id(id: str) -> bool | MessageException:
         return MessageException("Error when retrieve whitelist",
                                 status.HTTP_500_INTERNAL_SERVER_ERROR)
 
-    async with await mongo_client.start_session() as session:
-        try:
-            async with session.start_transaction():
-                deleted_whitelist = await whitelist_collection.delete_one(
-                    {"_id": ObjectId(id)}, session=session)
-                
-                await user_collection.update_one(
-                    {"email": whitelist_info["email"]},
-                    {"$set": {"role": "user"}},
-                    session=session
-                )
-        
-        except:
-            logger.error(f"{traceback.format_exc()}")
-            return MessageException("Error when delete whitelist",
-                                    status.HTTP_500_INTERNAL_SERVER_ERROR)
-        else:
-            if deleted_whitelist.deleted_count == 0:
-                raise MessageException("Delete whitelist failed",
-                                       status.HTTP_400_BAD_REQUEST)
-            return True
+    async def delete(session):
+        deleted_whitelist = await whitelist_collection.delete_one(
+            {"_id": ObjectId(id)}, session=session)
+        await user_collection.update_one(
+            {"email": whitelist_info["email"]},
+            {"$set": {"role": "user"}},
+            session=session
+        )
+        return deleted_whitelist
+
+    try:
+        deleted_whitelist = await run_transaction("delete_whitelist", delete)
+    except:
+        logger.error(f"{traceback.format_exc()}")
+        return MessageException("Error when delete whitelist",
+                                status.HTTP_500_INTERNAL_SERVER_ERROR)
+    await invalidate_users_by_email([whitelist_info["email"]])
+    if deleted_whitelist.deleted_count == 0:
+        return MessageException("Delete whitelist failed",
+                                status.HTTP_400_BAD_REQUEST)
+    return True
         
\ No newline at end of file
@@ -0,0 +1,39 @@
+from fastapi import APIRouter, status
+from app.utils import MessageException, Logger
+from app.api.v1.controllers.analytics import retrieve_analytics
+from app.schemas.response import (
+    DictResponseModel,
+    ErrorResponseModel
+)
+
+
+router = APIRouter()
+logger = Logger("routes/analytics", log_file="analytics.log")
+
+
+@router.get("/exam/{exam_id}",
+            tags=["Admin"],
+            description="Retrieve score distribution and pass rates of an exam")
+async def get_exam_analytics(exam_id: str, refresh: bool = False):
+    analytics = await retrieve_analytics("exam", exam_id, refresh)
+    if isinstance(analytics, MessageException):
+        return ErrorResponseModel(error=str(analytics),
+                                  message="An error occurred.",
+                                  code=analytics.status_code)
+    return DictResponseModel(data=analytics,
+                             message="Exam analytics retrieved successfully.",
+                             code=status.HTTP_200_OK)
+
+
+@router.get("/contest/{contest_id}",
+            tags=["Admin"],
+            description="Retrieve score distribution and pass rates of all exams in a contest")
+async def get_contest_analytics(contest_id: str, refresh: bool = False):
+    analytics = await retrieve_analytics("contest", contest_id, refresh)
+    if isinstance(analytics, MessageException):
+        return ErrorResponseModel(error=str(analytics),
+                                  message="An error occurred.",
+                                  code=analytics.status_code)
+    return DictResponseModel(data=analytics,
+                             message="Contest analytics retrieved successfully.",
+                             code=status.HTTP_200_OK)
@@ -1,9 +1,11 @@
 from app.utils.logger import Logger
 from datetime import datetime, UTC
-from fastapi import APIRouter, Depends, status
+from fastapi import APIRouter, Depends, Request, status
+from app.utils import MessageException
 from app.api.v1.controllers.category import (
     add_category,
     retrieve_categories,
+    retrieve_categories_version,
     retrieve_category,
     update_category
 )
@@ -19,6 +21,12 @@ from app.schemas.response import (
     ErrorResponseModel
 )
 from app.core.security import is_admin, is_authenticated
+from app.core.etag import (
+    make_etag,
+    is_not_modified,
+    not_modified,
+    conditional_response
+)
 
 router = APIRouter()
 logger = Logger("routes/category", log_file="category.log")
@@ -46,28 +54,42 @@ async def create_category(category: CategorySchema):
 
 @router.get("/categories",
             description="Retrieve all categories")
-async def get_categories():
+async def get_categories(request: Request):
+    # Answer the polling clients from the version, before reading the categories
+    version = await retrieve_categories_version()
+    etag = None
+    if not isinstance(version, MessageException):
+        etag = make_etag("categories", version["count"], version["updated_at"])
+        if is_not_modified(request, etag):
+            return not_modified(etag)
+
     categories = await retrieve_categories()
     if isinstance(categories, Exception):
         return ErrorResponseModel(error=str(categories),
                                   message="Occur error when retrieve categories.",
                                   code=status.HTTP_400_BAD_REQUEST)
-    return ListResponseModel(data=categories,
-                             message="Categories retrieved successfully.",
-                             code=status.HTTP_200_OK)
+    response = ListResponseModel(data=categories,
+                                 message="Categories retrieved successfully.",
+                                 code=status.HTTP_200_OK)
+    if etag is None:
+        return response
+    return conditional_response(request, response, etag=etag)
 
 
 @router.get("/{id}",
             description="Retrieve a category with a matching ID")
-async def get_category(id: str):
+async def get_category(id: str, request: Request):
     category = await retrieve_category(id)
     if isinstance(category, Exception):
         return ErrorResponseModel(error=str(category),
                                   message="Occur error when retrieve category.",
                                   code=status.HTTP_400_BAD_REQUEST)
-    return DictResponseModel(data=category,
-                             message="Category retrieved successfully.",
-                             code=status.HTTP_200_OK)
+    response = DictResponseModel(data=category,
+                                 message="Category retrieved successfully.",
+                                 code=status.HTTP_200_OK)
+    return conditional_response(request, response,
+                                etag=make_etag(category["id"], category["updated_at"]),
+                                last_modified=category["updated_at"])
 
 
 @router.patch("/{id}",
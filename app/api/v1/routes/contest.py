@@ -8,7 +8,7 @@ from app.utils import (
 )
 from slugify import slugify
 from fastapi import (
-    APIRouter, Depends, 
+    APIRouter, Depends, Request,
     status, HTTPException
 )
 from fastapi.responses import JSONResponse
@@ -21,7 +21,6 @@ from app.api.v1.controllers.contest import (
     delete_contest,
     retrieve_available_contests,
     retrieve_contest_by_slug,
-    contest_slug_is_unique,
     submission_result
 )
 from app.api.v1.controllers.exam import (
@@ -35,12 +34,9 @@ from app.api.v1.controllers.exam_problem import (
 from app.api.v1.controllers.submission import (
     update_submission,
     upsert_draft_submission,
+    flush_draft_submission,
     retrieve_submission_by_id_user_retake
 )
-from app.api.v1.controllers.certificate import (
-    retrieve_certificate_by_validation_id
-)
-from app.api.v1.controllers.user import retrieve_user
 from app.schemas.submission import (
     SubmittedProblem,
     SubmissionSchema,
@@ -62,7 +58,8 @@ from app.schemas.response import (
     ErrorResponseModel
 )
 from app.schemas.certificate import CertificateDB
-from app.core.security import is_admin, is_authenticated
+from app.core.security import is_admin, is_authenticated, get_current_user
+from app.core.etag import make_etag, document_versions, conditional_response
 import inngest
 from app.inngest.client import inngest_client
 
@@ -77,14 +74,8 @@ logger = Logger("routes/contest", log_file="contest.log")
              description="Create a new contest")
 async def create_contest(contest: ContestSchema, 
                          creator_id=Depends(is_authenticated)):
+    # The slug is unique, add_contest fails on a title which already exists
     contest_slug = slugify(contest.title)
-    # Check meeting_slug is unique
-    is_unique = await contest_slug_is_unique(contest_slug)
-    if isinstance(is_unique, Exception):
-        raise HTTPException(
-            status_code=is_unique.status_code,
-            detail=str(is_unique)
-        )
     contest_dict = ContestSchemaDB(
         **contest.model_dump(), 
         creator_id=creator_id,
@@ -94,6 +85,11 @@ async def create_contest(contest: ContestSchema,
     ).model_dump()
     new_contest = await add_contest(contest_dict)
     if isinstance(new_contest, MessageException):
+        if new_contest.status_code == status.HTTP_400_BAD_REQUEST:
+            raise HTTPException(
+                status_code=new_contest.status_code,
+                detail=str(new_contest)
+            )
         return ErrorResponseModel(error=str(new_contest),
                                   message="An error occurred.",
                                   code=status.HTTP_404_NOT_FOUND)
@@ -130,9 +126,10 @@ async def create_exam_problem(exam_id: str,
              description="Submit problems to a contest")
 async def create_submission(exam_id: str,
                             submission_data: SubmissionSchema,
-                            clerk_user_id: str = Depends(is_authenticated)):
+                            user_info: dict = Depends(get_current_user)):
+    clerk_user_id = user_info["clerk_user_id"]
     # Check the exam still open (is active)
-    exam_info = await retrieve_exam(exam_id, clerk_user_id)
+    exam_info = await retrieve_exam(exam_id, user_info)
     if isinstance(exam_info, MessageException):
         raise HTTPException(
             status_code=exam_info.status_code,
@@ -144,7 +141,7 @@ async def create_submission(exam_id: str,
             detail="The exam is not active."
         )
     # Check the contest still open (is active)
-    contest_info = await retrieve_contest(exam_info["contest_id"], clerk_user_id)
+    contest_info = await retrieve_contest(exam_info["contest_id"], user_info)
     if isinstance(contest_info, MessageException):
         raise HTTPException(
             status_code=contest_info.status_code,
@@ -157,12 +154,6 @@ async def create_submission(exam_id: str,
         )
     
     # Check the user is allowed to submit
-    user_info = await retrieve_user(clerk_user_id)
-    if isinstance(user_info, MessageException):
-        raise HTTPException(
-            status_code=user_info.status_code,
-            detail=user_info.message
-        )
     user_cohort = user_info["cohort"]
     # limit permission by the main cohort of the user
     if not is_cohort_permission(user_cohort, [user_cohort], contest_info["cohorts"]):
@@ -170,7 +161,14 @@ async def create_submission(exam_id: str,
             detail="You are not allowed to submit this exam.",
             status_code=status.HTTP_403_FORBIDDEN
         )
-    
+
+    # Write the last autosave before the draft is deleted
+    flushed_draft = await flush_draft_submission(exam_id=exam_id,
+                                                 retake_id=submission_data.retake_id,
+                                                 clerk_user_id=clerk_user_id)
+    if isinstance(flushed_draft, MessageException):
+        logger.error(f"Draft of exam {exam_id} not saved: {flushed_draft.message}")
+
     submitted_problems: List[SubmittedProblem] | None = submission_data.submitted_problems
     exam_results = await submission_result(submitted_problems)
     if isinstance(exam_results, MessageException):
@@ -201,7 +199,8 @@ async def create_submission(exam_id: str,
     ).model_dump()
 
     updated_submission = await update_submission(pseudo_submission["id"], 
-                                                 upsert_submission)
+                                                 upsert_submission,
+                                                 contest_id=contest_info["id"])
     if isinstance(updated_submission, MessageException):
         raise HTTPException(
             status_code=updated_submission.status_code,
@@ -211,13 +210,8 @@ async def create_submission(exam_id: str,
     if (contest_info["certificate_template"] is not None 
     and exam_results["max_score"] > 0 
     and exam_results["total_score"] / exam_results["max_score"] >= 0.5):
+        # A taken validation_id is replaced when the certificate is inserted
         validation_id = generate_id()
-        # Check if validation_id is exist
-        start_time = datetime.now(UTC)
-        while await retrieve_certificate_by_validation_id(validation_id):
-            validation_id = generate_id()
-        end_time = datetime.now(UTC)
-        logger.info(f"Generate validation_id in {end_time - start_time}")
 
         # Create a new certificate
         certificate_data = CertificateDB(
@@ -233,7 +227,7 @@ async def create_submission(exam_id: str,
         await inngest_client.send(
             inngest.Event(
                 name="contest/certificate",
-                id=f"certificate-{validation_id}",
+                id=f"certificate-{pseudo_submission['id']}",
                 data={
                     "user_info": {
                         "fullname": user_info["fullname"],
@@ -279,9 +273,10 @@ async def create_submission(exam_id: str,
              description="Upsert the draft version of problems to a contest")
 async def upsert_submission(exam_id: str,
                             submission_data: SubmissionSchema,
-                            clerk_user_id: str = Depends(is_authenticated)):
+                            user_info: dict = Depends(get_current_user)):
+    clerk_user_id = user_info["clerk_user_id"]
     # Check the exam still open (is active)
-    exam_info = await retrieve_exam(exam_id, clerk_user_id)
+    exam_info = await retrieve_exam(exam_id, user_info)
     if isinstance(exam_info, MessageException):
         raise HTTPException(
             status_code=exam_info.status_code,
@@ -293,7 +288,7 @@ async def upsert_submission(exam_id: str,
             detail="The exam is not active."
         )
     # Check the contest still open (is active)
-    contest_info = await retrieve_contest(exam_info["contest_id"], clerk_user_id)
+    contest_info = await retrieve_contest(exam_info["contest_id"], user_info)
     if isinstance(contest_info, MessageException):
         raise HTTPException(
             status_code=contest_info.status_code,
@@ -305,12 +300,6 @@ async def upsert_submission(exam_id: str,
             detail="The contest is not active."
         )
     # Check the user is allowed to submit
-    user_info = await retrieve_user(clerk_user_id)
-    if isinstance(user_info, MessageException):
-        raise HTTPException(
-            status_code=user_info.status_code,
-            detail=user_info.message
-        )
     user_cohort = user_info["cohort"]
     # limit permission by the main cohort of the user
     if not is_cohort_permission(user_cohort, [user_cohort], contest_info["cohorts"]):
@@ -360,8 +349,8 @@ async def get_contests():
 
 @router.get("/contest/instruction/{slug}",
             description="Retrieve a contest instruction with a matching slug")
-async def get_contest_instruction(slug: str, clerk_user_id: str = Depends(is_authenticated)):
-    contest = await retrieve_contest_by_slug(slug, clerk_user_id)
+async def get_contest_instruction(slug: str, user_info: dict = Depends(get_current_user)):
+    contest = await retrieve_contest_by_slug(slug, user_info)
     if isinstance(contest, MessageException):
         return HTTPException(
             status_code=contest.status_code,
@@ -379,8 +368,8 @@ async def get_contest_instruction(slug: str, clerk_user_id: str = Depends(is_aut
 
 @router.get("/available",
             description="Retrieve all available contests")
-async def get_available_contests(clerk_user_id: str = Depends(is_authenticated)):
-    contests = await retrieve_available_contests(clerk_user_id)
+async def get_available_contests(user_info: dict = Depends(get_current_user)):
+    contests = await retrieve_available_contests(user_info)
     if isinstance(contests, MessageException):
         return ErrorResponseModel(error=contests.message,
                                   message="Error when retrieve contests.",
@@ -392,28 +381,41 @@ async def get_available_contests(clerk_user_id: str = Depends(is_authenticated))
 
 @router.get("/{id}",
             description="Retrieve a contest with a matching ID")
-async def get_contest(id: str, clerk_user_id: str = Depends(is_authenticated)):
-    contest = await retrieve_contest(id, clerk_user_id)
+async def get_contest(id: str,
+                      request: Request,
+                      user_info: dict = Depends(get_current_user)):
+    contest = await retrieve_contest(id, user_info)
     if isinstance(contest, MessageException):
         return ErrorResponseModel(error=contest.message,
                                   message="An error occurred.",
                                   code=contest.status_code)
-    return DictResponseModel(data=contest,
-                             message="Contest retrieved successfully.",
-                             code=status.HTTP_200_OK)
+    response = DictResponseModel(data=contest,
+                                 message="Contest retrieved successfully.",
+                                 code=status.HTTP_200_OK)
+    return conditional_response(request, response,
+                                etag=make_etag(contest["id"], contest["updated_at"]),
+                                last_modified=contest["updated_at"],
+                                private=True)
 
 
 @router.get("/{id}/details",
             description="Retrieve a contest with a matching ID and its details")
-async def get_contest_detail(id: str, clerk_user_id: str = Depends(is_authenticated)):
-    contest_details = await retrieve_contest_detail(id, clerk_user_id)
+async def get_contest_detail(id: str,
+                             request: Request,
+                             user_info: dict = Depends(get_current_user)):
+    contest_details = await retrieve_contest_detail(id, user_info)
     if isinstance(contest_details, MessageException):
         return ErrorResponseModel(error=str(contest_details),
                                   message="An error occurred.",
                                   code=status.HTTP_404_NOT_FOUND)
-    return DictResponseModel(data=contest_details,
-                             message="Contest retrieved successfully.",
-                             code=status.HTTP_200_OK)
+    response = DictResponseModel(data=contest_details,
+                                 message="Contest retrieved successfully.",
+                                 code=status.HTTP_200_OK)
+    # The available exam depends on the retakes of the user
+    etag = make_etag(user_info["clerk_user_id"],
+                     contest_details["retake_id"],
+                     document_versions(contest_details))
+    return conditional_response(request, response, etag=etag, private=True)
 
 
 @router.put("/{id}",
@@ -424,13 +426,6 @@ async def update_contest_data(id: str,
                               contest: UpdateContestSchema,
                               creator_id=Depends(is_authenticated)):
     contest_slug = slugify(contest.title)
-    # Check meeting_slug is unique
-    is_unique = await contest_slug_is_unique(contest_slug, is_update=True)
-    if isinstance(is_unique, Exception):
-        raise HTTPException(
-            status_code=is_unique.status_code,
-            detail=str(is_unique)
-        )
     contest_dict = UpdateContestSchemaDB(
         **contest.model_dump(),
         creator_id=creator_id,
@@ -439,6 +434,12 @@ async def update_contest_data(id: str,
     ).model_dump()
     updated_contest = await update_contest(id, contest_dict)
     if isinstance(updated_contest, MessageException):
+        # The slug is unique, update_contest fails on a title which already exists
+        if updated_contest.status_code == status.HTTP_409_CONFLICT:
+            raise HTTPException(
+                status_code=updated_contest.status_code,
+                detail=str(updated_contest)
+            )
         return ErrorResponseModel(error=str(updated_contest),
                                   message="An error occurred.",
                                   code=status.HTTP_404_NOT_FOUND)
@@ -485,6 +486,11 @@ async def delete_contest_data(id: str):
         return ErrorResponseModel(error=str(delete_result),
                                   message="An error occurred when delete contest.",
                                   code=status.HTTP_404_NOT_FOUND)
+    if delete_result is False:
+        # The contest is deleted last, once its exams are
+        return ListResponseModel(data=[],
+                                 message="Contest deletion in progress.",
+                                 code=status.HTTP_202_ACCEPTED)
     if not delete_result:
         return ErrorResponseModel(error="No contests were updated.",
                                   message="An error occurred when delete contest.",
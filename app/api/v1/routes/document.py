@@ -4,7 +4,7 @@ from fastapi import (
     APIRouter, Depends,
     status, HTTPException
 )
-from app.core.security import is_admin, is_authenticated
+from app.core.security import is_admin, is_authenticated, get_current_user
 from app.api.v1.controllers.document import (
     add_document,
     retrieve_documents,
@@ -73,8 +73,8 @@ async def get_documents():
 
 @router.get("/{id}",
             description="Retrieve a document by id")
-async def get_document_by_id(id: str, clerk_user_id: str = Depends(is_authenticated)):
-    document = await retrieve_document_by_id(id, clerk_user_id)
+async def get_document_by_id(id: str, user_info: dict = Depends(get_current_user)):
+    document = await retrieve_document_by_id(id, user_info)
     if isinstance(document, Exception):
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
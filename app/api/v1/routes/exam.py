@@ -5,7 +5,7 @@ from app.utils import (
     Logger,
 )
 from fastapi import (
-    APIRouter, Depends, 
+    APIRouter, Depends, Request,
     status, HTTPException
 )
 from app.schemas.exam import (
@@ -30,7 +30,8 @@ from app.schemas.response import (
     ListResponseModel,
     DictResponseModel
 )
-from app.core.security import is_admin, is_authenticated
+from app.core.security import is_admin, is_authenticated, get_current_user
+from app.core.etag import make_etag, document_versions, conditional_response
 
 from app.api.v1.controllers.exam import (
     add_exam,
@@ -136,8 +137,8 @@ async def get_exams():
 
 @router.get("/{id}",
             description="Retrieve a exam with a matching ID")
-async def get_exam_by_id(id: str, clerk_user_id: str = Depends(is_authenticated)):
-    exam = await retrieve_exam(id, clerk_user_id)
+async def get_exam_by_id(id: str, user_info: dict = Depends(get_current_user)):
+    exam = await retrieve_exam(id, user_info)
     if isinstance(exam, MessageException):
         return HTTPException(status_code=exam.status_code,
                              detail=exam.message)
@@ -178,14 +179,18 @@ async def get_retake(exam_id: str):
 @router.get("/{id}/detail",
             description="Retrieve a exam with a matching ID and its problems")
 async def get_exam_detail(id: str, 
-                          clerk_user_id=Depends(is_authenticated)):
-    exam_detail = await retrieve_exam_detail(id, clerk_user_id)
+                          request: Request,
+                          user_info: dict = Depends(get_current_user)):
+    exam_detail = await retrieve_exam_detail(id, user_info)
     if isinstance(exam_detail, MessageException):
         return HTTPException(status_code=exam_detail.status_code,
                              detail=exam_detail.message)
-    return DictResponseModel(data=exam_detail,
-                             message="Exam retrieved successfully.",
-                             code=status.HTTP_200_OK)
+    response = DictResponseModel(data=exam_detail,
+                                 message="Exam retrieved successfully.",
+                                 code=status.HTTP_200_OK)
+    return conditional_response(request, response,
+                                etag=make_etag(document_versions(exam_detail)),
+                                private=True)
 
 
 @router.put("/{id}",
@@ -219,6 +224,11 @@ async def delete_exam_data(id: str):
     if isinstance(deleted_exam, MessageException):
         return HTTPException(status_code=deleted_exam.status_code,
                              detail=deleted_exam.message)
+    if deleted_exam is False:
+        # The exam is deleted last, once its submissions are
+        return ListResponseModel(data=[],
+                                 message="Exam deletion in progress.",
+                                 code=status.HTTP_202_ACCEPTED)
     return ListResponseModel(data=[],
                              message="Exam deleted successfully.",
                              code=status.HTTP_200_OK)
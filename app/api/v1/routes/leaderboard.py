@@ -0,0 +1,82 @@
+from fastapi import (
+    APIRouter, Depends,
+    status, HTTPException, Query
+)
+from app.utils import MessageException, Logger
+from app.api.v1.controllers.leaderboard import (
+    rebuild_leaderboard,
+    retrieve_top_leaderboard,
+    retrieve_leaderboard_rank
+)
+from app.api.v1.controllers.cohort_permission import is_contest_permission
+from app.schemas.response import (
+    ListResponseModel,
+    DictResponseModel,
+    ErrorResponseModel
+)
+from app.core.security import is_admin, get_current_user
+
+
+router = APIRouter()
+logger = Logger("routes/leaderboard", log_file="leaderboard.log")
+
+
+async def check_contest_permission(contest_id: str, user_info: dict) -> None:
+    permission = await is_contest_permission(contest_id, user_info)
+    if isinstance(permission, MessageException):
+        raise HTTPException(
+            status_code=permission.status_code,
+            detail=permission.message
+        )
+    if not permission:
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="You are not allowed to access this contest"
+        )
+
+
+@router.get("/{contest_id}",
+            description="Retrieve the top users of a contest leaderboard")
+async def get_leaderboard(contest_id: str,
+                          limit: int = Query(10, ge=1, le=100),
+                          user_info: dict = Depends(get_current_user)):
+    await check_contest_permission(contest_id, user_info)
+    leaderboard = await retrieve_top_leaderboard(contest_id, limit)
+    if isinstance(leaderboard, MessageException):
+        return ErrorResponseModel(error=str(leaderboard),
+                                  message="An error occurred.",
+                                  code=leaderboard.status_code)
+    return ListResponseModel(data=leaderboard,
+                             message="Leaderboard retrieved successfully.",
+                             code=status.HTTP_200_OK)
+
+
+@router.get("/{contest_id}/me",
+            description="Retrieve the rank of the current user in a contest leaderboard")
+async def get_my_rank(contest_id: str,
+                      user_info: dict = Depends(get_current_user)):
+    await check_contest_permission(contest_id, user_info)
+    my_rank = await retrieve_leaderboard_rank(contest_id, user_info["clerk_user_id"])
+    if isinstance(my_rank, MessageException):
+        raise HTTPException(
+            status_code=my_rank.status_code,
+            detail=my_rank.message
+        )
+    return DictResponseModel(data=my_rank,
+                             message="Rank retrieved successfully.",
+                             code=status.HTTP_200_OK)
+
+
+@router.post("/{contest_id}/rebuild",
+             dependencies=[Depends(is_admin)],
+             tags=["Admin"],
+             description="Rebuild a contest leaderboard from its submissions")
+async def rebuild_contest_leaderboard(contest_id: str):
+    total_users = await rebuild_leaderboard(contest_id)
+    if isinstance(total_users, MessageException):
+        return ErrorResponseModel(error=str(total_users),
+                                  message="An error occurred.",
+                                  code=total_users.status_code)
+    return DictResponseModel(data={"total_users": total_users},
+                             message="Leaderboard rebuilt successfully.",
+                             code=status.HTTP_200_OK)
@@ -5,7 +5,7 @@ from app.utils import (
     Logger
 )
 from fastapi import (
-    APIRouter, Depends, Query,
+    APIRouter, Depends, Query, Request,
     status, HTTPException
 )
 from app.utils import (
@@ -14,14 +14,15 @@ from app.utils import (
     utc_to_local
 )
 from slugify import slugify
-from app.core.security import is_admin, is_authenticated
+from app.core.security import is_admin, is_authenticated, get_current_user
+from app.core.etag import make_etag, document_versions, conditional_response
+from app.core.cohort_index import meeting_index
 from app.api.v1.controllers.meeting import (
     meeting_helper,
     add_meeting,
     retrieve_meeting_by_pipeline,
     retrieve_meeting_by_id,
     retrieve_meeting_by_slug,
-    meeting_slug_is_unique,
     retrieve_upcoming_meeting_by_pipeline,
     update_meeting,
     delete_meeting
@@ -37,7 +38,6 @@ from app.api.v1.controllers.attendee import (
     retrieve_attendees_by_meeting_id,
     delete_attendees_by_emails
 )
-from app.api.v1.controllers.user import retrieve_user
 from app.schemas.meeting import (
     MeetingSchema,
     MeetingSchemaDB,
@@ -70,16 +70,9 @@ async def create_meeting(meeting_data: MeetingSchema,
             detail="Meeting start time is in the past"
         )
 
+    # The slug is unique, add_meeting fails on a title which already exists
     meeting_slug = slugify(meeting_data.title)
 
-    # Check meeting_slug is unique
-    is_unique = await meeting_slug_is_unique(meeting_slug)
-    if isinstance(is_unique, Exception):
-        raise HTTPException(
-            status_code=is_unique.status_code,
-            detail=str(is_unique)
-        )
-
     meeting_db = MeetingSchemaDB(
         title=meeting_data.title,
         description=meeting_data.description,
@@ -170,14 +163,8 @@ async def get_meetings(
     query_cohort: int = Query(None, description="Show cohort meetings"),
     time_from: str = Query(None, description="Meeting time from"),
     time_to: str = Query(None, description="Meeting time to"),
-    clerk_user_id: str = Depends(is_authenticated)
+    user_info: dict = Depends(get_current_user)
 ):
-    user_info = await retrieve_user(clerk_user_id)
-    if isinstance(user_info, Exception):
-        raise HTTPException(
-            status_code=status.HTTP_400_BAD_REQUEST,
-            detail=str(user_info)
-        )
     feasible_cohort = user_info["feasible_cohort"]
     
     if time_from is None or time_to is None:
@@ -188,21 +175,18 @@ async def get_meetings(
         time_from = local_to_utc(time_from, return_isoformat=False)
         time_to = local_to_utc(time_to, return_isoformat=False)
 
-    cohort_matchs = [
-        { "cohorts": { "$exists": False } },
-        { "cohorts": None },
-    ]
-    if query_cohort in feasible_cohort:
-        cohort_matchs.append({ "cohorts": query_cohort })
+    # Public meetings, and the meetings of the queried cohort
+    query_cohorts = [query_cohort] if query_cohort in feasible_cohort else []
+    meeting_ids = await meeting_index.visible_ids(query_cohorts)
 
     pipeline = [
         {
             "$match": {
+                "_id": {"$in": list(meeting_ids)},
                 "date": {
                     "$gte": time_from,
                     "$lte": time_to
-                },
-                "$or": cohort_matchs
+                }
             }
         },
         {
@@ -256,22 +240,13 @@ async def get_meetings(
 # TODO: How many upcoming meetings should be retrieved?
 @router.get("/upcoming",
             description="Retrieve upcoming meetings")
-async def get_upcoming_meetings(clerk_user_id: str = Depends(is_authenticated)):
-    user_info = await retrieve_user(clerk_user_id)
-    if isinstance(user_info, Exception):
-        raise HTTPException(
-            status_code=status.HTTP_400_BAD_REQUEST,
-            detail=str(user_info)
-        )
+async def get_upcoming_meetings(user_info: dict = Depends(get_current_user)):
+    meeting_ids = await meeting_index.visible_ids(user_info["feasible_cohort"] or [])
     pipeline = [
         {
             "$match": {
-                "date": {"$gte": datetime.now(UTC)},
-                "$or": [
-                    { "cohorts": { "$exists": False } },
-                    { "cohorts": None },
-                    { "cohorts": { "$in": user_info["feasible_cohort"] } }
-                ]
+                "_id": {"$in": list(meeting_ids)},
+                "date": {"$gte": datetime.now(UTC)}
             }
         },
         {
@@ -308,8 +283,10 @@ async def get_upcoming_meetings(clerk_user_id: str = Depends(is_authenticated)):
 
 @router.get("/{id}",
             description="Retrieve a meeting by meeting id")
-async def get_meeting_by_id(id: str, clerk_user_id: str = Depends(is_authenticated)):
-    meeting_data = await retrieve_meeting_by_id(id, clerk_user_id)
+async def get_meeting_by_id(id: str,
+                            request: Request,
+                            user_info: dict = Depends(get_current_user)):
+    meeting_data = await retrieve_meeting_by_id(id, user_info)
     if isinstance(meeting_data, MessageException):
         raise HTTPException(
             status_code=meeting_data.status_code,
@@ -323,17 +300,22 @@ async def get_meeting_by_id(id: str, clerk_user_id: str = Depends(is_authenticat
         )
     meeting_data["documents"] = documents
 
-    return DictResponseModel(
+    response = DictResponseModel(
         data=meeting_data,
         message="Meeting retrieved successfully",
         code=status.HTTP_200_OK
     )
+    return conditional_response(request, response,
+                                etag=make_etag(document_versions(meeting_data)),
+                                private=True)
 
 
 @router.get("/slug/{slug}",
             description="Retrieve a meeting by meeting slug")
-async def get_meeting_by_slug(slug: str, clerk_user_id: str = Depends(is_authenticated)):
-    meeting_data = await retrieve_meeting_by_slug(slug, clerk_user_id)
+async def get_meeting_by_slug(slug: str,
+                              request: Request,
+                              user_info: dict = Depends(get_current_user)):
+    meeting_data = await retrieve_meeting_by_slug(slug, user_info)
     if isinstance(meeting_data, MessageException):
         raise HTTPException(
             status_code=meeting_data.status_code,
@@ -348,11 +330,14 @@ async def get_meeting_by_slug(slug: str, clerk_user_id: str = Depends(is_authent
         )
     meeting_data["documents"] = documents
 
-    return DictResponseModel(
+    response = DictResponseModel(
         data=meeting_data,
         message="Meeting retrieved successfully",
         code=status.HTTP_200_OK
     )
+    return conditional_response(request, response,
+                                etag=make_etag(document_versions(meeting_data)),
+                                private=True)
 
 
 @router.get("/{id}/attendees",
@@ -397,13 +382,6 @@ async def update_meeting_data(id: str,
 
     # Update meeting
     meeting_slug = slugify(meeting_data.title)
-    # Check meeting_slug is unique
-    is_unique = await meeting_slug_is_unique(meeting_slug, is_update=True)
-    if isinstance(is_unique, Exception):
-        raise HTTPException(
-            status_code=is_unique.status_code,
-            detail=str(is_unique)
-        )
     meeting_db = UpdateMeetingSchemaDB(
         title=meeting_data.title,
         description=meeting_data.description,
@@ -478,6 +456,13 @@ async def delete_meeting_data(id: str):
             status_code=status.HTTP_400_BAD_REQUEST,
             detail=str(deleted_meeting)
         )
+    if deleted_meeting is False:
+        # The meeting is deleted last, once its documents and attendees are
+        return ListResponseModel(
+            data=[],
+            message="Meeting deletion in progress",
+            code=status.HTTP_202_ACCEPTED
+        )
     return ListResponseModel(
         data=[],
         message="Meeting deleted successfully",
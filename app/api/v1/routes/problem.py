@@ -2,7 +2,7 @@ from typing import Optional, List
 from datetime import datetime, UTC
 from app.utils.logger import Logger
 from fastapi import (
-    APIRouter, 
+    APIRouter, Request,
     Body, Depends, Query, 
     HTTPException, status,
 )
@@ -13,8 +13,8 @@ from app.api.v1.controllers.problem import (
     update_problem,
     delete_problem,
     retrieve_problem_by_pipeline,
+    PROBLEM_SUMMARY_PROJECTION,
 )
-from app.api.v1.controllers.user import retrieve_user
 from app.api.v1.controllers.problem_category import (
     add_problem_category,
     add_more_problem_category,
@@ -35,7 +35,8 @@ from app.schemas.response import (
     DictResponseModel,
     ErrorResponseModel
 )
-from app.core.security import is_admin, is_authenticated
+from app.core.security import is_admin, is_authenticated, get_current_user
+from app.core.etag import make_etag, conditional_response
 
 router = APIRouter()
 logger = Logger("routes/problem", log_file="problem.log")
@@ -106,7 +107,7 @@ async def create_problem_category(id: str, category_id: str):
 @router.get("/problems",
             description="Retrieve all problems")
 async def get_problems(
-        clerk_user_id: str = Depends(is_authenticated),
+        current_user: dict = Depends(get_current_user),
         search: Optional[str] = Query(
             None, description="Search by problem title or description"),
         categories: Optional[str] = Query(
@@ -204,6 +205,9 @@ async def get_problems(
                     },
                     {
                         "$limit": per_page
+                    },
+                    {
+                        "$project": PROBLEM_SUMMARY_PROJECTION
                     }
                 ],
                 "total": [
@@ -215,9 +219,8 @@ async def get_problems(
         },
     ]
 
-    current_user = await retrieve_user(clerk_user_id)
     role = current_user["role"]
-    problems = await retrieve_problem_by_pipeline(pipeline, page, per_page, role)
+    problems = await retrieve_problem_by_pipeline(pipeline, page, per_page, role, summary=True)
     if isinstance(problems, Exception):
         return ErrorResponseModel(error=str(problems),
                                   message="An error occurred while retrieving problems.",
@@ -229,15 +232,18 @@ async def get_problems(
 
 @router.get("/{id}",
             description="Retrieve a problem with a matching ID")
-async def get_problem(id: str):
+async def get_problem(id: str, request: Request):
     problem = await retrieve_problem(id)
     if isinstance(problem, Exception):
         return ErrorResponseModel(error=str(problem),
                                   message="An error occurred while retrieving problem.",
                                   code=status.HTTP_404_NOT_FOUND)
-    return DictResponseModel(data=problem,
-                             message="Problem retrieved successfully.",
-                             code=status.HTTP_200_OK)
+    response = DictResponseModel(data=problem,
+                                 message="Problem retrieved successfully.",
+                                 code=status.HTTP_200_OK)
+    return conditional_response(request, response,
+                                etag=make_etag(problem["id"], problem["updated_at"]),
+                                last_modified=problem["updated_at"])
 
 
 @router.patch("/{id}",
@@ -12,30 +12,46 @@ from app.schemas.response import (
     DictResponseModel,
     ErrorResponseModel
 )
-from app.api.v1.controllers.exam import exam_helper
-from app.api.v1.controllers.contest import contest_helper
-from app.api.v1.controllers.user import (
-    retrieve_user,
-    user_helper
+from app.utils import nested_projection
+from app.api.v1.controllers.exam import (
+    exam_helper,
+    exam_summary_helper,
+    EXAM_SUMMARY_PROJECTION
 )
+from app.api.v1.controllers.contest import (
+    contest_helper,
+    contest_summary_helper,
+    CONTEST_SUMMARY_PROJECTION
+)
+from app.api.v1.controllers.user import user_helper
 from app.api.v1.controllers.problem import (
-    retrieve_problem
+    retrieve_problems_by_ids
 )
 from app.api.v1.controllers.submission import (
     submission_helper,
+    submission_summary_helper,
+    SUBMISSION_SUMMARY_PROJECTION,
     retrieve_submission_by_pipeline,
     retrieve_submission_by_id_user_retake,
+    attach_testcase_results,
     delete_submission,
 )
 from app.api.v1.controllers.certificate import (
     retrieve_certificate_by_submission_id,
 )
-from app.core.security import is_admin, is_authenticated
+from app.core.security import is_admin, get_current_user
 from app.utils import Logger
 
 router = APIRouter()
 logger = Logger("routes/submission", log_file="submission.log")
 
+# Submissions of the lists and the contest and exam embedded in them
+LIST_PROJECTION = {
+    **SUBMISSION_SUMMARY_PROJECTION,
+    **nested_projection(CONTEST_SUMMARY_PROJECTION, "contest_info"),
+    **nested_projection(EXAM_SUMMARY_PROJECTION, "exam_info"),
+}
+
 
 @router.get("/submissions",
             dependencies=[Depends(is_admin)],
@@ -121,6 +137,9 @@ async def get_submissions(
                     },
                     {
                         "$limit": per_page
+                    },
+                    {
+                        "$project": LIST_PROJECTION
                     }
                 ],
                 "total": [
@@ -157,9 +176,9 @@ async def get_submissions(
         for submission in submissions:
             submissions_data.append(
                 {
-                    **submission_helper(submission),
-                    "contest_info": contest_helper(submission["contest_info"]),
-                    "exam_info": exam_helper(submission["exam_info"]),
+                    **submission_summary_helper(submission),
+                    "contest_info": contest_summary_helper(submission["contest_info"]),
+                    "exam_info": exam_summary_helper(submission["exam_info"]),
                     "user_info": user_helper(submission["user_info"])
                 }
             )
@@ -179,7 +198,8 @@ async def get_submissions(
             description="Retrieve a submission by user ID")
 async def get_submission_by_user(exam_id: str,
                                  retake_id: Optional[str] = None,
-                                 clerk_user_id: str = Depends(is_authenticated)):
+                                 user_info: dict = Depends(get_current_user)):
+    clerk_user_id = user_info["clerk_user_id"]
     submission = await retrieve_submission_by_id_user_retake(exam_id,
                                                              retake_id,
                                                              clerk_user_id)
@@ -191,7 +211,7 @@ async def get_submission_by_user(exam_id: str,
         return ErrorResponseModel(error="Submission not found.",
                                   message="No submission found.",
                                   code=status.HTTP_404_NOT_FOUND)
-    user_info = await retrieve_user(clerk_user_id)
+    await attach_testcase_results(submission["id"], submission["submitted_problems"])
     submission["user"] = user_info
     return DictResponseModel(data=submission,
                              message="Your submission retrieved successfully.",
@@ -200,14 +220,17 @@ async def get_submission_by_user(exam_id: str,
 
 @router.get("/me/submissions", 
             description="Retrieve all submissions by user ID")
-async def get_submissions_by_user(clerk_user_id: str = Depends(is_authenticated)):
-    user_info = await retrieve_user(clerk_user_id)
+async def get_submissions_by_user(user_info: dict = Depends(get_current_user)):
+    clerk_user_id = user_info["clerk_user_id"]
     pipeline = [
         {
             "$match": {
                 "clerk_user_id": clerk_user_id
             }
         },
+        {
+            "$project": SUBMISSION_SUMMARY_PROJECTION
+        },
         {
             "$lookup": {
                 "from": "exams",
@@ -236,6 +259,12 @@ async def get_submissions_by_user(clerk_user_id: str = Depends(is_authenticated)
                 "preserveNullAndEmptyArrays": False
             }
         },
+        {
+            "$project": {
+                **nested_projection(CONTEST_SUMMARY_PROJECTION, "contest_info"),
+                **nested_projection(EXAM_SUMMARY_PROJECTION, "exam_info"),
+            }
+        },
     ]
 
     pipeline_results = await retrieve_submission_by_pipeline(pipeline)
@@ -247,7 +276,7 @@ async def get_submissions_by_user(clerk_user_id: str = Depends(is_authenticated)
     if pipeline_results:
         submissions_outputs = []
         for submission in pipeline_results:
-            contest_info = contest_helper(submission["contest_info"])
+            contest_info = contest_summary_helper(submission["contest_info"])
             if contest_info["id"] in [submission["contest_info"]["id"] for submission in submissions_outputs]:
                 # Append the highest submission score of duplicate submissions
                 for sub in submissions_outputs:
@@ -256,17 +285,17 @@ async def get_submissions_by_user(clerk_user_id: str = Depends(is_authenticated)
                             submissions_outputs.remove(sub)
                             submissions_outputs.append(
                                 {
-                                    **submission_helper(submission),
+                                    **submission_summary_helper(submission),
                                     "contest_info": contest_info,
-                                    "exam_info": exam_helper(submission["exam_info"]),
+                                    "exam_info": exam_summary_helper(submission["exam_info"]),
                                 }
                             )
             else:
                 submissions_outputs.append(
                     {
-                        **submission_helper(submission),
+                        **submission_summary_helper(submission),
                         "contest_info": contest_info,
-                        "exam_info": exam_helper(submission["exam_info"]),
+                        "exam_info": exam_summary_helper(submission["exam_info"]),
                     }
                 )
         
@@ -300,6 +329,11 @@ async def get_submissions_by_user(clerk_user_id: str = Depends(is_authenticated)
             description="Retrieve a submission with a matching ID")
 async def get_submission(id: str):
     pipeline = [
+        {
+            "$match": {
+                "_id": ObjectId(id)
+            }
+        },
         {
             "$lookup": {
                 "from": "users",
@@ -341,11 +375,6 @@ async def get_submission(id: str):
                 "path": "$exam_info.contest_info",
                 "preserveNullAndEmptyArrays": False
             }
-        },
-        {
-            "$match": {
-                "_id": ObjectId(id)
-            }
         }
     ]
 
@@ -354,23 +383,35 @@ async def get_submission(id: str):
         return ErrorResponseModel(error="An error occurred.",
                                   message="Retrieving submission failed.",
                                   code=status.HTTP_404_NOT_FOUND)
-    if not pipeline_results[0]:
+    if not pipeline_results:
         return ErrorResponseModel(error="Submission not found.",
                                   message="No submission found.",
                                   code=status.HTTP_404_NOT_FOUND)
-    if pipeline_results[0]["submitted_problems"] is None:
-        pipeline_results[0]["submitted_problems"] = []
+    submission = pipeline_results[0]
+    if submission["submitted_problems"] is None:
+        submission["submitted_problems"] = []
     else:
-        for problem in pipeline_results[0]["submitted_problems"]:
-            problem_info = await retrieve_problem(problem["problem_id"], full_return=True)
-            problem["solution_code"] = problem_info["code_solution"]
-
-    exam_info = exam_helper(pipeline_results[0]["exam_info"])
-    exam_info["contest_info"] = contest_helper(pipeline_results[0]["exam_info"]["contest_info"])
+        # Hydrate the solution of all submitted problems in one query
+        problem_ids = [ObjectId(problem["problem_id"]) 
+                       for problem in submission["submitted_problems"]]
+        problems_info = await retrieve_problems_by_ids(problem_ids,
+                                                       projection={"code_solution": 1})
+        if isinstance(problems_info, Exception):
+            return ErrorResponseModel(error="An error occurred.",
+                                      message="Retrieving problems of submission failed.",
+                                      code=status.HTTP_404_NOT_FOUND)
+        solution_codes = {problem["id"]: problem.get("code_solution") 
+                          for problem in problems_info}
+        for problem in submission["submitted_problems"]:
+            problem["solution_code"] = solution_codes.get(problem["problem_id"])
+        await attach_testcase_results(submission["_id"], submission["submitted_problems"])
+
+    exam_info = exam_helper(submission["exam_info"])
+    exam_info["contest_info"] = contest_helper(submission["exam_info"]["contest_info"])
 
     return_data = {
-        **submission_helper(pipeline_results[0]),
-        "user_info": user_helper(pipeline_results[0]["user_info"]),
+        **submission_helper(submission),
+        "user_info": user_helper(submission["user_info"]),
         "exam_info": exam_info
     }
     return DictResponseModel(data=return_data,
@@ -212,7 +212,7 @@ async def update_user_data(clerk_user_id: str, data: UpdateUserRole = Body(...))
     data_dict = data.model_dump()
     new_role = data_dict.get("role", None)
 
-    user_data = await retrieve_user(clerk_user_id)
+    user_data = await retrieve_user(clerk_user_id, use_cache=False)
     if isinstance(user_data, Exception):
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
@@ -314,7 +314,7 @@ async def update_user_via_clerk(clerk_user_id: str = Depends(is_authenticated)):
     role = "user"  # default role
 
     # check if user exist in DB
-    is_exist_user = await retrieve_user(clerk_user_id)  # -> user_data
+    is_exist_user = await retrieve_user(clerk_user_id, use_cache=False)  # -> user_data
     if isinstance(is_exist_user, Exception):
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
@@ -2,6 +2,7 @@ import traceback
 from app.utils.logger import Logger
 from fastapi import (
     APIRouter,
+    Request,
     status,
     HTTPException
 )
@@ -15,6 +16,7 @@ from app.api.v1.controllers.user import (
 from app.schemas.response import (
     DictResponseModel
 )
+from app.core.etag import make_etag, conditional_response
 
 router = APIRouter()
 logger = Logger("routes/verify", log_file="verify.log")
@@ -22,7 +24,7 @@ logger = Logger("routes/verify", log_file="verify.log")
 
 @router.get("/certificate/{validation_id}",
             description="Get certificate by validation id")
-async def get_certificate_by_validation_id(validation_id: str):
+async def get_certificate_by_validation_id(validation_id: str, request: Request):
     certificate = await retrieve_certificate_by_validation_id(validation_id)
     if not certificate:
         raise HTTPException(
@@ -36,6 +38,9 @@ async def get_certificate_by_validation_id(validation_id: str):
         "fullname": user_info["fullname"],
     }
 
-    return DictResponseModel(data=return_data,
-                                message="Certificate retrieved successfully",
-                                code=status.HTTP_200_OK)
+    response = DictResponseModel(data=return_data,
+                                 message="Certificate retrieved successfully",
+                                 code=status.HTTP_200_OK)
+    # Certificates have no updated_at, the (small) data is its own version
+    return conditional_response(request, response,
+                                etag=make_etag(sorted(return_data.items())))
@@ -0,0 +1,430 @@
+import copy
+import asyncio
+import traceback
+from typing import Any, Awaitable, Callable, Hashable
+from bson.objectid import ObjectId
+from app.core.config import settings
+from app.core.database import mongo_db
+from app.utils.cache import TTLCache, SingleFlight, MISSING, CACHE_REQUESTS
+from app.utils.cache_backend import (
+    CacheBackend,
+    InMemoryCacheBackend,
+    RedisCacheBackend
+)
+from app.utils.logger import Logger
+
+logger = Logger("core/cache", log_file="cache.log")
+
+
+def create_cache_backend() -> CacheBackend:
+    if settings.CACHE_BACKEND == "redis":
+        return RedisCacheBackend(settings.REDIS_URL)
+    return InMemoryCacheBackend()
+
+
+# Shared by the caches of every worker when CACHE_BACKEND is "redis"
+cache_backend = create_cache_backend()
+# Invalidations being published, referenced until they are done
+pending_invalidations = set()
+
+
+def schedule_invalidation(backend: CacheBackend, namespace: str, key: Hashable | None) -> None:
+    """
+    Invalidate a key in the shared backend and tell the other workers,
+    in the background: called from the synchronous invalidations
+    :param backend: CacheBackend
+    :param namespace: str
+    :param key: Hashable | None, None for the whole namespace
+    """
+    try:
+        loop = asyncio.get_running_loop()
+    except RuntimeError:
+        # Scripts without a loop, other workers rely on the TTL
+        return
+    task = loop.create_task(shared_invalidate(backend, namespace, key))
+    pending_invalidations.add(task)
+    task.add_done_callback(pending_invalidations.discard)
+
+
+async def shared_invalidate(backend: CacheBackend, namespace: str, key: Hashable | None) -> None:
+    try:
+        await backend.invalidate(namespace, key)
+    except:
+        logger.error(f"{traceback.format_exc()}")
+
+
+class ReadThroughCache:
+    """
+    Cache in front of the controllers reads. Every key has a version,
+    bumped by `invalidate`: an entry is only served when it was loaded
+    at the current version, so a load racing with a write is never
+    cached. Values are deep-copied out, callers can mutate them freely.
+
+    Concurrent misses share one load: the same key in `get`, the same set
+    of missing keys in `get_many` (e.g. every student opening an exam).
+
+    With a shared backend (Redis), the entries of this worker are backed
+    by the shared ones and invalidations are published to every worker.
+    A load racing with a write of another worker can still store the old
+    value in the shared backend, the TTL bounds it.
+    """
+    def __init__(self,
+                 name: str,
+                 maxsize: int,
+                 ttl: float,
+                 backend: CacheBackend | None = None
+                 ) -> None:
+        self.name = name
+        self.ttl = ttl
+        self._entries = TTLCache(name, maxsize=maxsize, ttl=ttl)
+        self._versions = {}
+        self._many_flight = SingleFlight(f"{name}_many")
+        self._backend = backend if backend is not None and backend.shared else None
+        if self._backend is not None:
+            self._backend.subscribe(name, self._on_invalidation)
+
+    def version(self, key: Hashable) -> int:
+        return self._versions.get(key, 0)
+
+    def invalidate(self, key: Hashable) -> None:
+        self._invalidate_local(key)
+        self._publish(key)
+
+    def clear(self) -> None:
+        self._clear_local()
+        self._publish(None)
+
+    def _invalidate_local(self, key: Hashable) -> None:
+        self._versions[key] = self.version(key) + 1
+        self._entries.invalidate(key)
+
+    def _clear_local(self) -> None:
+        for key in list(self._versions):
+            self._versions[key] += 1
+        self._entries.clear()
+        self._many_flight.clear()
+
+    def _on_invalidation(self, key: str | None) -> None:
+        # Also called back for the invalidations of this worker, once the
+        # shared entry is deleted: drops what was read from it in between
+        if key is None:
+            self._clear_local()
+        else:
+            self._invalidate_local(key)
+
+    def _publish(self, key: Hashable | None) -> None:
+        if self._backend is not None:
+            schedule_invalidation(self._backend, self.name, key)
+
+    async def _shared_get_many(self, keys: list) -> dict:
+        if self._backend is None:
+            return {}
+        try:
+            return await self._backend.get_many(self.name, keys)
+        except:
+            logger.error(f"{traceback.format_exc()}")
+            return {}
+
+    async def _shared_set_many(self, values: dict) -> None:
+        if self._backend is None or not values:
+            return
+        try:
+            await self._backend.set_many(self.name, values, self.ttl)
+        except:
+            logger.error(f"{traceback.format_exc()}")
+
+    async def get(self, key: Hashable, loader: Callable[[], Awaitable[Any]]) -> Any:
+        """
+        Return the cached value of a key or load it, None is never cached
+        :param key: Hashable
+        :param loader: async callable returning the value
+        """
+        entry = await self._entries.get_or_load(
+            key,
+            lambda: self._load(key, loader),
+            cache_if=lambda entry: entry[1] is not None and entry[0] == self.version(key)
+        )
+        return copy.deepcopy(entry[1])
+
+    async def get_many(self,
+                       keys: list,
+                       loader: Callable[[list], Awaitable[dict]]
+                       ) -> dict:
+        """
+        Return the values of many keys, the missing ones loaded in one call
+        :param keys: list
+        :param loader: async callable, list of keys -> {key: value}
+        :return: dict, key -> value (missing keys are left out)
+        """
+        values = {}
+        missing_keys = []
+        for key in keys:
+            entry = self._entries.get(key)
+            if entry is not MISSING and entry[0] == self.version(key):
+                values[key] = copy.deepcopy(entry[1])
+            else:
+                missing_keys.append(key)
+        CACHE_REQUESTS.labels(self.name, "hit").inc(len(values))
+        if missing_keys:
+            CACHE_REQUESTS.labels(self.name, "miss").inc(len(missing_keys))
+            # Same keys at the same versions, the same load can be shared
+            flight_key = tuple(sorted((key, self.version(key)) for key in missing_keys))
+            loaded = await self._many_flight.do(
+                flight_key,
+                lambda: self._load_many(missing_keys, loader)
+            )
+            for key, value in loaded.items():
+                values[key] = copy.deepcopy(value)
+        return values
+
+    async def _load(self, key: Hashable, loader: Callable[[], Awaitable[Any]]) -> tuple:
+        version = self.version(key)
+        shared = await self._shared_get_many([key])
+        if key in shared:
+            return version, shared[key]
+        value = await loader()
+        if value is not None and version == self.version(key):
+            await self._shared_set_many({key: value})
+        return version, value
+
+    async def _load_many(self,
+                         keys: list,
+                         loader: Callable[[list], Awaitable[dict]]
+                         ) -> dict:
+        versions = {key: self.version(key) for key in keys}
+        loaded = await self._shared_get_many(keys)
+        missing_keys = [key for key in keys if key not in loaded]
+        if missing_keys:
+            from_db = await loader(missing_keys)
+            await self._shared_set_many({
+                key: value for key, value in from_db.items()
+                if value is not None and versions.get(key) == self.version(key)
+            })
+            loaded.update(from_db)
+        for key, value in loaded.items():
+            if value is not None and versions.get(key) == self.version(key):
+                self._entries.set(key, (versions[key], value))
+        return loaded
+
+
+# Contents read by every student during an exam, changed a few times a week
+contest_cache = ReadThroughCache("contest",
+                                 maxsize=settings.CONTENT_CACHE_SIZE,
+                                 ttl=settings.CONTENT_CACHE_TTL,
+                                 backend=cache_backend)
+exam_cache = ReadThroughCache("exam",
+                              maxsize=settings.CONTENT_CACHE_SIZE,
+                              ttl=settings.CONTENT_CACHE_TTL,
+                              backend=cache_backend)
+contest_exams_cache = ReadThroughCache("contest_exams",
+                                       maxsize=settings.CONTENT_CACHE_SIZE,
+                                       ttl=settings.CONTENT_CACHE_TTL,
+                                       backend=cache_backend)
+exam_problems_cache = ReadThroughCache("exam_problems",
+                                       maxsize=settings.CONTENT_CACHE_SIZE,
+                                       ttl=settings.CONTENT_CACHE_TTL,
+                                       backend=cache_backend)
+problem_cache = ReadThroughCache("problem",
+                                 maxsize=settings.CONTENT_CACHE_SIZE,
+                                 ttl=settings.CONTENT_CACHE_TTL,
+                                 backend=cache_backend)
+# Problems as read by the students, without the fields they never see
+public_problem_cache = ReadThroughCache("public_problem",
+                                        maxsize=settings.CONTENT_CACHE_SIZE,
+                                        ttl=settings.CONTENT_CACHE_TTL,
+                                        backend=cache_backend)
+
+# The largest fields of a problem, never loaded for the students
+PUBLIC_PROBLEM_PROJECTION = {"private_testcases": 0, "code_solution": 0}
+
+
+# Raw documents (the helpers of the controllers are applied by the callers)
+async def get_contest_doc(id: str | ObjectId) -> dict | None:
+    return await contest_cache.get(
+        str(id),
+        lambda: mongo_db["contests"].find_one({"_id": ObjectId(id)})
+    )
+
+
+async def get_exam_doc(id: str | ObjectId) -> dict | None:
+    return await exam_cache.get(
+        str(id),
+        lambda: mongo_db["exams"].find_one({"_id": ObjectId(id)})
+    )
+
+
+async def get_contest_exam_docs(contest_id: str | ObjectId) -> list:
+    return await contest_exams_cache.get(
+        str(contest_id),
+        lambda: mongo_db["exams"].find({"contest_id": ObjectId(contest_id)}).to_list(length=None)
+    )
+
+
+async def get_exam_problem_docs(exam_id: str | ObjectId) -> list:
+    return await exam_problems_cache.get(
+        str(exam_id),
+        lambda: mongo_db["exam_problem"].find({"exam_id": ObjectId(exam_id)}).to_list(length=None)
+    )
+
+
+async def get_problem_doc(id: str | ObjectId, public: bool = False) -> dict | None:
+    """
+    :param public: bool, read with PUBLIC_PROBLEM_PROJECTION
+    """
+    cache = public_problem_cache if public else problem_cache
+    return await cache.get(
+        str(id),
+        lambda: mongo_db["problems"].find_one({"_id": ObjectId(id)},
+                                              PUBLIC_PROBLEM_PROJECTION if public else None)
+    )
+
+
+async def get_problem_docs(ids: list, public: bool = False) -> list:
+    """
+    Retrieve many problems, only the uncached ones are read (in one query)
+    :param ids: list of str | ObjectId
+    :param public: bool, read with PUBLIC_PROBLEM_PROJECTION
+    :return: list, in the order of ids (missing problems are left out)
+    """
+    async def load_problems(keys: list) -> dict:
+        cursor = mongo_db["problems"].find({"_id": {"$in": [ObjectId(key) for key in keys]}},
+                                           PUBLIC_PROBLEM_PROJECTION if public else None)
+        return {str(problem["_id"]): problem async for problem in cursor}
+
+    cache = public_problem_cache if public else problem_cache
+    keys = list(dict.fromkeys(str(id) for id in ids))
+    problems = await cache.get_many(keys, load_problems)
+    return [problems[key] for key in keys if key in problems]
+
+
+async def get_contests_exam_docs(contest_ids: list) -> dict:
+    """
+    Retrieve the exams of many contests, only the uncached ones are read (in one query)
+    :param contest_ids: list of str | ObjectId
+    :return: dict, str(contest_id) -> list of exams
+    """
+    async def load_exams(keys: list) -> dict:
+        exams = {key: [] for key in keys}
+        cursor = mongo_db["exams"].find({"contest_id": {"$in": [ObjectId(key) for key in keys]}})
+        async for exam in cursor:
+            exams[str(exam["contest_id"])].append(exam)
+        return exams
+
+    keys = list(dict.fromkeys(str(id) for id in contest_ids))
+    return await contest_exams_cache.get_many(keys, load_exams)
+
+
+async def get_exams_problem_docs(exam_ids: list) -> dict:
+    """
+    Retrieve the exam_problem links of many exams, only the uncached ones are read (in one query)
+    :param exam_ids: list of str | ObjectId
+    :return: dict, str(exam_id) -> list of exam_problems
+    """
+    async def load_exam_problems(keys: list) -> dict:
+        exam_problems = {key: [] for key in keys}
+        cursor = mongo_db["exam_problem"].find({"exam_id": {"$in": [ObjectId(key) for key in keys]}})
+        async for exam_problem in cursor:
+            exam_problems[str(exam_problem["exam_id"])].append(exam_problem)
+        return exam_problems
+
+    keys = list(dict.fromkeys(str(id) for id in exam_ids))
+    return await exam_problems_cache.get_many(keys, load_exam_problems)
+
+
+async def warm_content_caches() -> int:
+    """
+    Load the active contests, their exams, the problem links of the exams
+    and the problems as read by the students
+    :return: int, number of contests loaded
+    """
+    async def load_contests(keys: list) -> dict:
+        cursor = mongo_db["contests"].find({"_id": {"$in": [ObjectId(key) for key in keys]}})
+        return {str(contest["_id"]): contest async for contest in cursor}
+
+    contest_ids = [str(contest["_id"]) async for contest in
+                   mongo_db["contests"].find({"is_active": True}, {"_id": 1})]
+    await contest_cache.get_many(contest_ids, load_contests)
+    contest_exams = await get_contests_exam_docs(contest_ids)
+
+    # Already read with the exams of the contests
+    exams = {str(exam["_id"]): exam for exams in contest_exams.values() for exam in exams}
+
+    async def load_exams(keys: list) -> dict:
+        return {key: exams[key] for key in keys}
+
+    await exam_cache.get_many(list(exams), load_exams)
+    exam_problems = await get_exams_problem_docs(list(exams))
+    await get_problem_docs([exam_problem["problem_id"]
+                            for links in exam_problems.values() for exam_problem in links],
+                           public=True)
+    return len(contest_ids)
+
+
+# Invalidation, called by the mutations of the controllers
+def invalidate_contest(id: str | ObjectId) -> None:
+    contest_cache.invalidate(str(id))
+    contest_exams_cache.invalidate(str(id))
+
+
+def invalidate_exam(id: str | ObjectId, contest_id: str | ObjectId | None = None) -> None:
+    exam_cache.invalidate(str(id))
+    exam_problems_cache.invalidate(str(id))
+    if contest_id is not None:
+        contest_exams_cache.invalidate(str(contest_id))
+    else:
+        contest_exams_cache.clear()
+
+
+def invalidate_exam_problems(exam_id: str | ObjectId | None) -> None:
+    if exam_id is not None:
+        exam_problems_cache.invalidate(str(exam_id))
+    else:
+        exam_problems_cache.clear()
+
+
+def invalidate_problem(id: str | ObjectId) -> None:
+    problem_cache.invalidate(str(id))
+    public_problem_cache.invalidate(str(id))
+
+
+def invalidate_by_change(change: dict) -> None:
+    """
+    Invalidate the caches from a change stream event
+    :param change: dict
+    """
+    collection = change["ns"]["coll"]
+    id = change["documentKey"]["_id"]
+    document = change.get("fullDocument") or {}
+    if collection == "contests":
+        invalidate_contest(id)
+    elif collection == "exams":
+        invalidate_exam(id, document.get("contest_id"))
+    elif collection == "exam_problem":
+        invalidate_exam_problems(document.get("exam_id"))
+    elif collection == "problems":
+        invalidate_problem(id)
+
+
+async def watch_changes() -> None:
+    """
+    Keep the caches of this worker coherent with the writes of the other
+    workers (and scripts). Needs a replica set, enabled by CACHE_CHANGE_STREAM.
+    """
+    pipeline = [
+        {"$match": {"ns.coll": {"$in": ["contests", "exams", "exam_problem", "problems"]}}}
+    ]
+    while True:
+        try:
+            async with mongo_db.watch(pipeline, full_document="updateLookup") as stream:
+                logger.info("Watching changes to invalidate the caches")
+                async for change in stream:
+                    invalidate_by_change(change)
+        except asyncio.CancelledError:
+            raise
+        except:
+            logger.error(f"{traceback.format_exc()}")
+            # Changes may have been missed while the stream was down
+            for cache in [contest_cache, exam_cache, contest_exams_cache,
+                          exam_problems_cache, problem_cache, public_problem_cache]:
+                cache.clear()
+            await asyncio.sleep(5)
@@ -0,0 +1,179 @@
+"""
+Cascade deletion of a document and of everything depending on it.
+
+DEPENDENTS declares, per collection, the collections referencing its
+documents. `delete_cascade` walks them depth first and deletes in batches
+of CASCADE_BATCH_SIZE: the dependent ids are read with an _id projection,
+and the children of a batch are deleted before the batch itself. Stopping
+anywhere leaves no orphan, and running the cascade again on the same ids
+resumes it. This replaces one transaction over the whole cascade, which
+hits the transaction time limit on the large contests.
+
+A cascade larger than CASCADE_SYNC_LIMIT documents is finished by the
+"cascade/delete" background function (app/inngest/functions.py), one
+bounded step at a time.
+"""
+import time
+import asyncio
+import inspect
+import inngest
+from typing import Any, Callable
+from bson.objectid import ObjectId
+from app.core.config import settings
+from app.core.database import mongo_db
+from app.utils.logger import Logger
+
+logger = Logger("core/cascade", log_file="database.log")
+
+
+class Dependent:
+    def __init__(self, collection_name: str, field: str, as_string: bool = False) -> None:
+        """
+        :param collection_name: str, the referencing collection
+        :param field: str, the field holding the _id of the parent
+        :param as_string: bool, the _id is also stored as a string
+        """
+        self.collection_name = collection_name
+        self.field = field
+        self.as_string = as_string
+
+    def filter(self, ids: list) -> dict:
+        if self.as_string:
+            ids = [*ids, *[str(id) for id in ids]]
+        return {self.field: {"$in": ids}}
+
+
+DEPENDENTS = {
+    "contests": [
+        # Before the exams, their submissions do not rank anyone again
+        Dependent("leaderboards", "contest_id"),
+        Dependent("exams", "contest_id"),
+    ],
+    "exams": [
+        Dependent("exam_problem", "exam_id"),
+        Dependent("retake", "exam_id"),
+        Dependent("timer", "exam_id"),
+        Dependent("draft_submissions", "exam_id"),
+        Dependent("submissions", "exam_id"),
+    ],
+    "submissions": [
+        # CertificateSchema stores the submission id as a string
+        Dependent("certificate", "submission_id", as_string=True),
+        Dependent("submission_testcases", "submission_id"),
+    ],
+    "meetings": [
+        Dependent("documents", "meeting_id"),
+        Dependent("attendees", "meeting_id"),
+    ],
+}
+
+# collection -> callbacks(ids) run after each deleted batch (cache
+# invalidation, leaderboard)
+_on_delete = {}
+
+
+def on_delete(collection_name: str, callback: Callable[[list], Any]) -> None:
+    """
+    Register a callback run with the ids of every batch deleted from a
+    collection, including the batches deleted by the background function
+    :param collection_name: str
+    :param callback: Callable[[list[ObjectId]], None], or a coroutine function
+    """
+    _on_delete.setdefault(collection_name, []).append(callback)
+
+
+class _LimitReached(Exception):
+    pass
+
+
+class _Cascade:
+    def __init__(self, limit: int | None, batch_size: int) -> None:
+        self.limit = limit
+        self.batch_size = batch_size
+        self.deleted = 0
+
+    async def delete(self, collection_name: str, ids: list) -> None:
+        # Children first, the parents stay reachable until their children are gone
+        for dependent in DEPENDENTS.get(collection_name, []):
+            collection = mongo_db[dependent.collection_name]
+            while True:
+                batch = await collection.find(
+                    dependent.filter(ids), {"_id": 1}
+                ).limit(self.batch_size).to_list(length=None)
+                if not batch:
+                    break
+                await self.delete(dependent.collection_name,
+                                  [document["_id"] for document in batch])
+
+        result = await mongo_db[collection_name].delete_many({"_id": {"$in": ids}})
+        self.deleted += result.deleted_count
+        for callback in _on_delete.get(collection_name, []):
+            result = callback(ids)
+            if inspect.isawaitable(result):
+                await result
+        if self.limit is not None and self.deleted >= self.limit:
+            raise _LimitReached()
+
+
+async def delete_cascade(collection_name: str,
+                         ids: list,
+                         limit: int | None = None
+                         ) -> tuple[int, bool]:
+    """
+    Delete documents and everything depending on them (DEPENDENTS)
+    :param collection_name: str
+    :param ids: list[ObjectId]
+    :param limit: int, stop after about this many deleted documents
+    :return: tuple, (deleted documents, True when the cascade is complete)
+    """
+    cascade = _Cascade(limit, settings.CASCADE_BATCH_SIZE)
+    try:
+        await cascade.delete(collection_name, [ObjectId(id) for id in ids])
+    except _LimitReached:
+        return cascade.deleted, False
+    return cascade.deleted, True
+
+
+async def cascade_delete(collection_name: str, ids: list) -> bool:
+    """
+    Delete up to CASCADE_SYNC_LIMIT documents now, the rest in the background
+    :param collection_name: str
+    :param ids: list[ObjectId | str]
+    :return: bool, True when the cascade is complete, False when it continues
+        in the background
+    """
+    deleted, done = await delete_cascade(collection_name, ids,
+                                         limit=settings.CASCADE_SYNC_LIMIT)
+    if not done:
+        # app.inngest imports the controllers, which import this module
+        from app.inngest.client import inngest_client
+        ids = [str(id) for id in ids]
+        logger.info(f"Cascade of {collection_name} {ids} continues in the background "
+                    f"({deleted} documents deleted)")
+        await inngest_client.send(
+            inngest.Event(
+                name="cascade/delete",
+                # Not deduplicated with an earlier cascade of the same ids,
+                # which may have failed for good: deleting again resumes it
+                id=f"cascade-{collection_name}-{'-'.join(ids)}-{time.time_ns()}",
+                data={"collection_name": collection_name, "ids": ids}
+            )
+        )
+    return done
+
+
+async def find_reference(references: list[tuple[str, dict]]) -> str | None:
+    """
+    First collection holding a document matching its filter, one limit(1)
+    query per collection, run concurrently
+    :param references: list, (collection_name, filter)
+    :return: str, None when no collection references the document
+    """
+    found = await asyncio.gather(*[
+        mongo_db[collection_name].find_one(filter, {"_id": 1})
+        for collection_name, filter in references
+    ])
+    for (collection_name, _), document in zip(references, found):
+        if document is not None:
+            return collection_name
+    return None
@@ -0,0 +1,183 @@
+import time
+import asyncio
+import traceback
+from bson.objectid import ObjectId
+from app.core.config import settings
+from app.core.database import mongo_db
+from app.core.cache import cache_backend, schedule_invalidation
+from app.utils.logger import Logger
+from app.utils import is_cohort_permission
+
+logger = Logger("core/cohort_index", log_file="cache.log")
+
+# Bucket of the resources without cohorts, visible to everyone
+PUBLIC = None
+
+
+def bucket_keys(cohorts: list[int] | None) -> list:
+    return cohorts if cohorts is not None else [PUBLIC]
+
+
+class CohortIndex:
+    """
+    Cohort -> ids of the documents of a collection visible to the cohort,
+    with a PUBLIC bucket for the documents without cohorts. Only the
+    `cohorts` field of the documents is kept.
+
+    The index is loaded on first use, then maintained incrementally: a
+    write marks its id dirty (`invalidate`) in every worker through the
+    cache backend, and only the dirty documents are read again on the
+    next use. The whole index is rebuilt every `max_age` seconds, which
+    bounds the writes made outside of the API (scripts, other services).
+
+    The invalidations only reach the other workers through a shared cache
+    backend. Without one, their writes are seen at the next rebuild: the
+    age is bounded by CONTENT_CACHE_TTL, like the cached contents the
+    permission checks would read otherwise.
+    """
+    def __init__(self, collection_name: str, max_age: float) -> None:
+        self.name = f"cohort_index:{collection_name}"
+        self.max_age = max_age
+        self._collection_name = collection_name
+        self._buckets = {}
+        self._cohorts = {}
+        self._dirty = set()
+        self._loaded_at = None
+        self._generation = 0
+        self._lock = asyncio.Lock()
+        cache_backend.subscribe(self.name, self._on_invalidation)
+
+    @property
+    def collection(self):
+        return mongo_db[self._collection_name]
+
+    def __len__(self) -> int:
+        return len(self._cohorts)
+
+    def _on_invalidation(self, key: str | None) -> None:
+        if key is None:
+            self._loaded_at = None
+            self._generation += 1
+        else:
+            self._dirty.add(ObjectId(key))
+
+    def invalidate(self, id: str | ObjectId) -> None:
+        """
+        Mark a document written (added, updated or deleted) in every worker
+        :param id: str | ObjectId
+        """
+        self._dirty.add(ObjectId(id))
+        schedule_invalidation(cache_backend, self.name, str(id))
+
+    def clear(self) -> None:
+        self._loaded_at = None
+        self._generation += 1
+        schedule_invalidation(cache_backend, self.name, None)
+
+    def _set(self, id: ObjectId, cohorts: list[int] | None) -> None:
+        self._remove(id)
+        self._cohorts[id] = cohorts
+        for cohort in bucket_keys(cohorts):
+            self._buckets.setdefault(cohort, set()).add(id)
+
+    def _remove(self, id: ObjectId) -> None:
+        if id not in self._cohorts:
+            return
+        cohorts = self._cohorts.pop(id)
+        for cohort in bucket_keys(cohorts):
+            bucket = self._buckets.get(cohort)
+            if bucket is not None:
+                bucket.discard(id)
+                if not bucket:
+                    del self._buckets[cohort]
+
+    async def ensure_loaded(self) -> None:
+        """
+        Rebuild the index when it is missing or too old, read the dirty
+        documents again otherwise
+        """
+        if (self._loaded_at is not None and not self._dirty
+                and time.monotonic() - self._loaded_at < self.max_age):
+            return
+        async with self._lock:
+            if self._loaded_at is None or time.monotonic() - self._loaded_at >= self.max_age:
+                await self._rebuild()
+            elif self._dirty:
+                await self._refresh()
+
+    async def _rebuild(self) -> None:
+        # Writes made during the read stay dirty and are read again
+        self._dirty = set()
+        generation = self._generation
+        started_at = time.monotonic()
+        buckets, cohorts = {}, {}
+        async for document in self.collection.find({}, {"cohorts": 1}):
+            id = document["_id"]
+            cohorts[id] = document.get("cohorts")
+            for cohort in bucket_keys(cohorts[id]):
+                buckets.setdefault(cohort, set()).add(id)
+        self._buckets, self._cohorts = buckets, cohorts
+        # Cleared during the read, rebuilt again on next use
+        if generation == self._generation:
+            self._loaded_at = started_at
+        logger.info(f"Rebuilt the {self.name} ({len(cohorts)} documents)")
+
+    async def _refresh(self) -> None:
+        dirty, self._dirty = self._dirty, set()
+        try:
+            documents = await self.collection.find(
+                {"_id": {"$in": list(dirty)}}, {"cohorts": 1}
+            ).to_list(length=None)
+        except:
+            self._dirty |= dirty
+            raise
+        for id in dirty:
+            self._remove(id)
+        for document in documents:
+            self._set(document["_id"], document.get("cohorts"))
+
+    async def visible_ids(self, cohorts: list[int]) -> set:
+        """
+        Ids of the public documents and of the documents of any of the cohorts
+        :param cohorts: list[int]
+        :return: set[ObjectId]
+        """
+        await self.ensure_loaded()
+        ids = set(self._buckets.get(PUBLIC, ()))
+        for cohort in cohorts:
+            ids |= self._buckets.get(cohort, set())
+        return ids
+
+    async def is_visible(self,
+                         id: str | ObjectId,
+                         user_cohort: int,
+                         feasible_cohort: list[int] | None
+                         ) -> bool | None:
+        """
+        Check the cohort permission of a document from the index
+        :param id: str | ObjectId
+        :param user_cohort: int
+        :param feasible_cohort: list[int]
+        :return: bool, None when the document is not in the index
+        """
+        if not ObjectId.is_valid(id):
+            return None
+        try:
+            await self.ensure_loaded()
+        except:
+            logger.error(f"{traceback.format_exc()}")
+            return None
+        id = ObjectId(id)
+        if id not in self._cohorts:
+            return None
+        return is_cohort_permission(user_cohort, feasible_cohort, self._cohorts[id])
+
+
+def index_max_age() -> float:
+    if cache_backend.shared:
+        return settings.COHORT_INDEX_MAX_AGE
+    return min(settings.COHORT_INDEX_MAX_AGE, settings.CONTENT_CACHE_TTL)
+
+
+contest_index = CohortIndex("contests", max_age=index_max_age())
+meeting_index = CohortIndex("meetings", max_age=index_max_age())
@@ -13,6 +13,7 @@ class Settings(BaseSettings):
     OPENAPI_URL: str | None = "/v1/openapi.json" if ENV_TYPE == "development" else None
     DOCS_URL: str | None = "/v1/docs" if ENV_TYPE == "development" else None
     MONGODB_URI: str = os.getenv("MONGODB_URI")
+    MONGODB_DB: str = os.getenv("MONGODB_DB")
     CLERK_SECRET_KEY: str = os.getenv("CLERK_SECRET_KEY")
     FRONTEND_URL: str = os.getenv("FRONTEND_URL")
     RESEND_API_KEY: str = os.getenv("RESEND_API_KEY")
@@ -20,5 +21,56 @@ class Settings(BaseSettings):
     INNGEST_EVENT_KEY: str = os.getenv("INNGEST_EVENT_KEY")
     ADMIN_COHORT: int = 2100
     ADMIN_FEASIBLE_COHORT: list[int] = list(range(FROM_YEAR, CURRENT_YEAR+1))
+    # Seconds between two writes of the buffered draft submissions (0 to write through).
+    # Must stay below the grace period of the timeout submit (5 seconds).
+    # Only with the redis CACHE_BACKEND, which keeps the buffered saves for
+    # the other workers: with the memory one every save is written through.
+    DRAFT_FLUSH_INTERVAL: float = 3
+    # Users are cached per worker, a role change reaches the other workers within the TTL
+    USER_CACHE_TTL: float = 10
+    USER_CACHE_SIZE: int = 10000
+    # Verified session tokens, an entry never outlives the token exp
+    JWT_CACHE_SIZE: int = 10000
+    JWT_CACHE_MAX_TTL: float = 300
+    # Contests, exams, exam problems and problems, invalidated on write in this
+    # worker, the TTL (or the change stream) covers the writes of other workers
+    CONTENT_CACHE_TTL: float = 30
+    CONTENT_CACHE_SIZE: int = 2048
+    CACHE_CHANGE_STREAM: bool = False
+    # Cohort visibility of the contests and meetings, maintained on write,
+    # fully rebuilt at this age to pick up the writes made outside of the API
+    # (at most CONTENT_CACHE_TTL with the memory CACHE_BACKEND, the writes of
+    # the other workers are only seen by the rebuild)
+    COHORT_INDEX_MAX_AGE: float = 300
+    # Connection pool of each worker, MONGO_MIN_POOL_SIZE connections are
+    # opened at startup and kept open
+    MONGO_MAX_POOL_SIZE: int = 100
+    MONGO_MIN_POOL_SIZE: int = 10
+    MONGO_MAX_IDLE_TIME_MS: int | None = 300000
+    MONGO_CONNECT_TIMEOUT_MS: int = 10000
+    MONGO_SERVER_SELECTION_TIMEOUT_MS: int = 10000
+    MONGO_WAIT_QUEUE_TIMEOUT_MS: int | None = None
+    MONGO_SOCKET_TIMEOUT_MS: int | None = None
+    # e.g. "zstd,snappy,zlib", the first one the server supports is used
+    # (zstd and snappy need the zstandard and python-snappy packages)
+    MONGO_COMPRESSORS: str | None = None
+    # Cascade deletions (contests, exams, meetings): documents deleted per
+    # batch, and deleted in the request before the background function takes over
+    CASCADE_BATCH_SIZE: int = 500
+    CASCADE_SYNC_LIMIT: int = 5000
+    # Transactions (app/core/transactions.py) retried on transient errors:
+    # attempts and seconds, whichever runs out first
+    MONGO_TRANSACTION_MAX_ATTEMPTS: int = 5
+    MONGO_TRANSACTION_TIMEOUT: float = 30
+    # Create the missing indexes of app/core/indexes.py at startup
+    ENSURE_INDEXES: bool = True
+    # Commands slower than this are logged with their shape, a sample of the
+    # slow finds and aggregations is explained (at most once per shape and interval)
+    MONGO_SLOW_COMMAND_MS: float = 200
+    MONGO_EXPLAIN_SAMPLE_RATE: float = 0.1
+    MONGO_EXPLAIN_INTERVAL: float = 600
+    # "memory" (caches per worker) or "redis" (shared by the workers, REDIS_URL)
+    CACHE_BACKEND: str = "memory"
+    REDIS_URL: str | None = os.getenv("REDIS_URL")
 
 settings = Settings()
\ No newline at end of file
@@ -0,0 +1,103 @@
+"""
+Sequential identifiers allocated from a counter document, e.g. the
+attendance ids of the users ("0000", "0001", ...).
+
+A counter is a document of the `counters` collection:
+{"_id": name, "seq": next number, "free": released ids, smallest first}.
+An allocation pops a released id, else increments `seq`, both in one
+atomic update, so concurrent allocations never return the same id. The
+counter is seeded once from the ids already in use: `seq` above the
+largest one, the gaps below it as free ids.
+"""
+import asyncio
+from pymongo import ReturnDocument
+from pymongo.errors import DuplicateKeyError
+from motor.motor_asyncio import AsyncIOMotorClientSession
+from app.core.database import mongo_db
+from app.utils.logger import Logger
+
+logger = Logger("core/counters", log_file="database.log")
+
+
+class SequenceAllocator:
+    def __init__(self, name: str, collection_name: str, field: str, width: int) -> None:
+        """
+        :param name: str, _id of the counter document
+        :param collection_name: str, collection holding the ids (seed)
+        :param field: str, field holding the ids (seed)
+        :param width: int, ids are zero-padded to this width
+        """
+        self.name = name
+        self.width = width
+        self._collection_name = collection_name
+        self._field = field
+        self._seeded = False
+        self._lock = asyncio.Lock()
+
+    @property
+    def counters(self):
+        return mongo_db["counters"]
+
+    def format(self, number: int) -> str:
+        return str(number).zfill(self.width)
+
+    async def _seed(self) -> None:
+        if self._seeded:
+            return
+        async with self._lock:
+            if self._seeded:
+                return
+            if await self.counters.find_one({"_id": self.name}, {"_id": 1}) is None:
+                ids = await mongo_db[self._collection_name].distinct(
+                    self._field, {self._field: {"$type": "string"}}
+                )
+                numbers = {int(id) for id in ids if id.isdigit()}
+                seq = max(numbers) + 1 if numbers else 0
+                free = [self.format(number) for number in range(seq) if number not in numbers]
+                try:
+                    # The first worker to seed wins
+                    await self.counters.update_one(
+                        {"_id": self.name},
+                        {"$setOnInsert": {"seq": seq, "free": free}},
+                        upsert=True
+                    )
+                    logger.info(f"Seeded the counter {self.name}: {seq} ({len(free)} free)")
+                except DuplicateKeyError:
+                    pass
+            self._seeded = True
+
+    async def allocate(self) -> str:
+        """
+        :return: str, an id no other allocation returned (unless released)
+        """
+        await self._seed()
+        counter = await self.counters.find_one_and_update(
+            {"_id": self.name, "free.0": {"$exists": True}},
+            {"$pop": {"free": -1}},
+            projection={"free": {"$slice": 1}}
+        )
+        if counter is not None:
+            return counter["free"][0]
+        counter = await self.counters.find_one_and_update(
+            {"_id": self.name},
+            {"$inc": {"seq": 1}},
+            projection={"seq": 1},
+            return_document=ReturnDocument.BEFORE
+        )
+        return self.format(counter["seq"])
+
+    async def release(self,
+                      id: str,
+                      session: AsyncIOMotorClientSession | None = None
+                      ) -> None:
+        """
+        Give back an id which is no longer used, the next allocations reuse it
+        :param id: str
+        :param session: AsyncIOMotorClientSession
+        """
+        await self._seed()
+        await self.counters.update_one(
+            {"_id": self.name, "free": {"$ne": id}},
+            {"$push": {"free": {"$each": [id], "$sort": 1}}},
+            session=session
+        )
@@ -1,27 +1,65 @@
-import os
+"""
+MongoDB client of the application.
+
+The client is created at import without any I/O (Motor connects on first
+use), so the controllers keep their collections as module attributes.
+`connect_database`, awaited in the lifespan before the worker accepts
+traffic, checks the connection and opens the pool; `close_database`
+closes it at shutdown.
+
+Motor binds the client to the event loop of its first use: the worker
+loop in the application, a single `asyncio.run` in the scripts.
+"""
 import asyncio
 import motor.motor_asyncio
 from app.core.config import settings
+from app.core.monitoring import command_monitor
 from app.utils.logger import Logger
 logger = Logger("core/database", log_file="database.log")
 
-try:
-    MONGODB_URI = settings.MONGODB_URI
-    logger.info("Connecting to MongoDB")
-    logger.info(f"MongoDB Cluster: {MONGODB_URI.split('appName=')[-1]}")
-    mongo_client = motor.motor_asyncio.AsyncIOMotorClient(settings.MONGODB_URI, 
-                                                          uuidRepresentation="standard")
-    conn = mongo_client.admin.command('ping')
-    mongo_client.get_io_loop = asyncio.get_running_loop
-    logger.info("Connected to MongoDB")
-except Exception as e:
-    logger.error(f"An error occurred while trying to connect to MongoDB: {e}")
-    exit(1)
-
-
-try:
-    mongo_db = mongo_client[os.getenv('MONGODB_DB')]
-    logger.info("Connected to Database")
-except Exception as e:
-    logger.error(f"An error occurred while trying to connect to Database: {e}")
-    exit(1)
\ No newline at end of file
+
+def create_client() -> motor.motor_asyncio.AsyncIOMotorClient:
+    options = {
+        "maxPoolSize": settings.MONGO_MAX_POOL_SIZE,
+        "minPoolSize": settings.MONGO_MIN_POOL_SIZE,
+        "maxIdleTimeMS": settings.MONGO_MAX_IDLE_TIME_MS,
+        "connectTimeoutMS": settings.MONGO_CONNECT_TIMEOUT_MS,
+        "serverSelectionTimeoutMS": settings.MONGO_SERVER_SELECTION_TIMEOUT_MS,
+        "waitQueueTimeoutMS": settings.MONGO_WAIT_QUEUE_TIMEOUT_MS,
+        "socketTimeoutMS": settings.MONGO_SOCKET_TIMEOUT_MS,
+    }
+    if settings.MONGO_COMPRESSORS:
+        options["compressors"] = settings.MONGO_COMPRESSORS
+    client = motor.motor_asyncio.AsyncIOMotorClient(settings.MONGODB_URI,
+                                                    uuidRepresentation="standard",
+                                                    event_listeners=[command_monitor],
+                                                    **options)
+    return client
+
+
+mongo_client = create_client()
+mongo_db = mongo_client[settings.MONGODB_DB]
+
+
+async def connect_database() -> None:
+    """
+    Check the connection (raises when the server is unreachable within
+    MONGO_SERVER_SELECTION_TIMEOUT_MS) and open MONGO_MIN_POOL_SIZE
+    connections, so that the first requests do not pay for them
+    """
+    logger.info(f"Connecting to MongoDB: {settings.MONGODB_URI.split('appName=')[-1]}")
+    try:
+        await mongo_client.admin.command("ping")
+    except Exception as e:
+        logger.error(f"An error occurred while trying to connect to MongoDB: {e}")
+        raise
+    # Concurrent pings check out as many connections
+    if settings.MONGO_MIN_POOL_SIZE > 1:
+        await asyncio.gather(*[mongo_client.admin.command("ping")
+                               for _ in range(settings.MONGO_MIN_POOL_SIZE)])
+    logger.info(f"Connected to MongoDB, database: {settings.MONGODB_DB}")
+
+
+def close_database() -> None:
+    mongo_client.close()
+    logger.info("Closed the MongoDB connections")
@@ -0,0 +1,128 @@
+"""
+Conditional GET for read-mostly resources.
+
+The ETag of a response is derived from the versions of the documents it
+is built from (ids and updated_at), not from its body: a request with a
+matching If-None-Match is answered 304 without serializing the data. When
+a cheap version of the resource is available (e.g. count and max(updated_at)
+of a collection), `is_not_modified` can be checked before the full query.
+"""
+import hashlib
+from datetime import datetime, UTC
+from email.utils import format_datetime, parsedate_to_datetime
+from fastapi import Request, Response, status
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
+from pydantic import BaseModel
+
+
+def make_etag(*versions) -> str:
+    """
+    Weak ETag of the versions a response is built from
+    :param versions: ids, updated_at, ... (anything with a stable repr)
+    :return: str
+    """
+    digest = hashlib.blake2b(repr(versions).encode(), digest_size=16).hexdigest()
+    return f'W/"{digest}"'
+
+
+def document_versions(data) -> list:
+    """
+    Collect (id, updated_at) of every document nested in a response data,
+    documents without updated_at are versioned by their created_at
+    :param data: dict | list
+    :return: list
+    """
+    versions = []
+    if isinstance(data, dict):
+        if "id" in data:
+            versions.append((data["id"], data.get("updated_at", data.get("created_at"))))
+        for value in data.values():
+            if isinstance(value, (dict, list)):
+                versions.extend(document_versions(value))
+    elif isinstance(data, list):
+        for item in data:
+            versions.extend(document_versions(item))
+    return versions
+
+
+def to_datetime(value: datetime | str) -> datetime:
+    if isinstance(value, str):
+        value = datetime.fromisoformat(value)
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=UTC)
+    return value.astimezone(UTC)
+
+
+def is_not_modified(request: Request,
+                    etag: str,
+                    last_modified: datetime | str | None = None
+                    ) -> bool:
+    """
+    Check the validators of a request, If-Modified-Since is only used
+    when there is no If-None-Match
+    :param request: Request
+    :param etag: str
+    :param last_modified: datetime | str (isoformat)
+    :return: bool
+    """
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match is not None:
+        if if_none_match.strip() == "*":
+            return True
+        # Weak comparison
+        tags = {tag.strip().removeprefix("W/") for tag in if_none_match.split(",")}
+        return etag.removeprefix("W/") in tags
+
+    if_modified_since = request.headers.get("if-modified-since")
+    if if_modified_since is not None and last_modified is not None:
+        try:
+            since = parsedate_to_datetime(if_modified_since)
+        except (TypeError, ValueError):
+            return False
+        # HTTP dates have a resolution of one second
+        return to_datetime(last_modified).replace(microsecond=0) <= since
+    return False
+
+
+def validator_headers(etag: str,
+                      last_modified: datetime | str | None = None,
+                      private: bool = False
+                      ) -> dict:
+    headers = {
+        "ETag": etag,
+        # Always revalidate, private when the response depends on the user
+        "Cache-Control": "private, no-cache" if private else "no-cache"
+    }
+    if last_modified is not None:
+        headers["Last-Modified"] = format_datetime(to_datetime(last_modified), usegmt=True)
+    return headers
+
+
+def not_modified(etag: str,
+                 last_modified: datetime | str | None = None,
+                 private: bool = False
+                 ) -> Response:
+    return Response(status_code=status.HTTP_304_NOT_MODIFIED,
+                    headers=validator_headers(etag, last_modified, private))
+
+
+def conditional_response(request: Request,
+                         response: BaseModel,
+                         etag: str,
+                         last_modified: datetime | str | None = None,
+                         private: bool = False
+                         ) -> Response:
+    """
+    304 when the client has this version, the response with its validators otherwise
+    :param request: Request
+    :param response: BaseModel, e.g. DictResponseModel
+    :param etag: str, see make_etag
+    :param last_modified: datetime | str (isoformat)
+    :param private: bool, the response depends on the user
+    :return: Response
+    """
+    if is_not_modified(request, etag, last_modified):
+        return not_modified(etag, last_modified, private)
+    return JSONResponse(content=jsonable_encoder(response),
+                        headers=validator_headers(etag, last_modified, private))
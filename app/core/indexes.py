@@ -0,0 +1,230 @@
+"""
+Indexes the controllers rely on, per collection.
+
+`ensure_indexes` creates the missing ones at startup (create_indexes is a
+no-op for an existing identical index). An index which exists with other
+options (e.g. a unique index over duplicated data, built by hand before)
+is left as is and logged: `diff_indexes` reports it, and
+`scripts/indexes.py --replace` rebuilds it.
+
+The unique indexes are the only uniqueness check of several write paths
+(timers, whitelists, slugs, short urls, attendees, certificates,
+attend_id): `check_unique_indexes` fails the startup when one of them is
+not in place as declared, instead of accepting duplicates silently.
+"""
+import traceback
+from pymongo import IndexModel, ASCENDING, DESCENDING
+from pymongo.errors import OperationFailure
+from app.core.database import mongo_db
+from app.utils.logger import Logger
+
+logger = Logger("core/indexes", log_file="database.log")
+
+
+INDEXES = {
+    "users": [
+        IndexModel([("clerk_user_id", ASCENDING)], name="clerk_user_id", unique=True),
+        IndexModel([("email", ASCENDING)], name="email"),
+        # Users created before the attendance ids have none
+        IndexModel([("attend_id", ASCENDING)], name="attend_id", unique=True,
+                   partialFilterExpression={"attend_id": {"$type": "string"}}),
+    ],
+    "whitelists": [
+        IndexModel([("email", ASCENDING)], name="email", unique=True),
+    ],
+    "contests": [
+        IndexModel([("slug", ASCENDING)], name="slug", unique=True),
+    ],
+    "exams": [
+        IndexModel([("contest_id", ASCENDING)], name="contest_id"),
+    ],
+    "exam_problem": [
+        IndexModel([("exam_id", ASCENDING), ("index", ASCENDING)], name="exam_id_index"),
+        IndexModel([("problem_id", ASCENDING)], name="problem_id"),
+    ],
+    "problem_category": [
+        IndexModel([("problem_id", ASCENDING)], name="problem_id"),
+        IndexModel([("category_id", ASCENDING)], name="category_id"),
+    ],
+    # One attempt (first try or retake) of an exam per user
+    "timer": [
+        IndexModel([("exam_id", ASCENDING), ("clerk_user_id", ASCENDING), ("retake_id", ASCENDING)],
+                   name="exam_id_clerk_user_id_retake_id", unique=True),
+        IndexModel([("clerk_user_id", ASCENDING)], name="clerk_user_id"),
+    ],
+    "submissions": [
+        IndexModel([("exam_id", ASCENDING), ("clerk_user_id", ASCENDING), ("retake_id", ASCENDING)],
+                   name="exam_id_clerk_user_id_retake_id", unique=True),
+        IndexModel([("clerk_user_id", ASCENDING)], name="clerk_user_id"),
+    ],
+    "draft_submissions": [
+        IndexModel([("exam_id", ASCENDING), ("clerk_user_id", ASCENDING), ("retake_id", ASCENDING)],
+                   name="exam_id_clerk_user_id_retake_id", unique=True),
+    ],
+    "submission_testcases": [
+        IndexModel([("submission_id", ASCENDING), ("problem_id", ASCENDING)],
+                   name="submission_id_problem_id", unique=True),
+    ],
+    "retake": [
+        IndexModel([("clerk_user_id", ASCENDING), ("exam_id", ASCENDING)],
+                   name="clerk_user_id_exam_id"),
+        IndexModel([("exam_id", ASCENDING)], name="exam_id"),
+    ],
+    "leaderboards": [
+        IndexModel([("contest_id", ASCENDING), ("clerk_user_id", ASCENDING)],
+                   name="contest_id_clerk_user_id", unique=True),
+        # Ranking (RANKING_SORT) and rank counts of a contest
+        IndexModel([("contest_id", ASCENDING), ("total_score", DESCENDING), ("achieved_at", ASCENDING)],
+                   name="contest_id_ranking"),
+        # Entries of the deleted submissions
+        IndexModel([("submission_id", ASCENDING)], name="submission_id"),
+    ],
+    "certificate": [
+        IndexModel([("validation_id", ASCENDING)], name="validation_id", unique=True),
+        IndexModel([("submission_id", ASCENDING)], name="submission_id", unique=True,
+                   partialFilterExpression={"submission_id": {"$exists": True}}),
+        IndexModel([("clerk_user_id", ASCENDING)], name="clerk_user_id"),
+    ],
+    "meetings": [
+        IndexModel([("slug", ASCENDING)], name="slug", unique=True),
+        IndexModel([("date", ASCENDING)], name="date"),
+    ],
+    "documents": [
+        IndexModel([("meeting_id", ASCENDING)], name="meeting_id"),
+    ],
+    "attendees": [
+        IndexModel([("meeting_id", ASCENDING), ("attend_id", ASCENDING)],
+                   name="meeting_id_attend_id", unique=True),
+    ],
+    "shortener": [
+        IndexModel([("short_url", ASCENDING)], name="short_url", unique=True),
+        IndexModel([("original_url", ASCENDING)], name="original_url"),
+    ],
+}
+
+# Options compared with the live indexes
+COMPARED_OPTIONS = ["unique", "partialFilterExpression", "sparse", "expireAfterSeconds"]
+
+
+def index_spec(document: dict) -> dict:
+    """
+    Comparable form of an index, from an IndexModel document or
+    from index_information()
+    :param document: dict
+    :return: dict
+    """
+    keys = document["key"]
+    keys = list(keys.items()) if isinstance(keys, dict) else list(keys)
+    # Directions read back from the server may be doubles
+    spec = {"key": [(field, int(direction) if isinstance(direction, (int, float)) else direction)
+                    for field, direction in keys]}
+    for option in COMPARED_OPTIONS:
+        if document.get(option):
+            spec[option] = document[option]
+    return spec
+
+
+async def live_indexes(collection_name: str) -> dict:
+    """
+    :param collection_name: str
+    :return: dict, name -> spec of the indexes of the collection, _id excluded
+    """
+    information = await mongo_db[collection_name].index_information()
+    return {name: index_spec(index) for name, index in information.items()
+            if name != "_id_"}
+
+
+def find_live_index(live: dict, name: str, spec: dict) -> str | None:
+    """
+    Name of the live index matching a declared one, by name, then by
+    keys (indexes created by hand have generated names, e.g. "slug_1")
+    """
+    if name in live:
+        return name
+    for live_name, live_spec in live.items():
+        if live_spec["key"] == spec["key"]:
+            return live_name
+    return None
+
+
+async def diff_indexes(collection_names: list | None = None) -> dict:
+    """
+    Compare the declared indexes with the live database
+    :param collection_names: list[str], every declared collection by default
+    :return: dict, collection -> {"missing": [...], "changed": {...}, "extra": [...]}
+        missing: declared names, changed: declared name -> live name (other
+        options or other name), extra: live indexes not declared here
+    """
+    result = {}
+    for collection_name in collection_names or INDEXES:
+        live = await live_indexes(collection_name)
+        missing, changed, matched = [], {}, set()
+        for model in INDEXES.get(collection_name, []):
+            name = model.document["name"]
+            spec = index_spec(model.document)
+            live_name = find_live_index(live, name, spec)
+            if live_name is None:
+                missing.append(name)
+                continue
+            matched.add(live_name)
+            if live_name != name or live[live_name] != spec:
+                changed[name] = live_name
+        result[collection_name] = {
+            "missing": missing,
+            "changed": changed,
+            "extra": [name for name in live if name not in matched],
+        }
+    return result
+
+
+async def ensure_indexes(replace: bool = False) -> dict:
+    """
+    Create the declared indexes missing from the database, idempotent
+    :param replace: bool, drop and rebuild the indexes declared with other options
+    :return: dict, collection -> names of the indexes in place
+    """
+    ensured = {}
+    for collection_name, models in INDEXES.items():
+        collection = mongo_db[collection_name]
+        if replace:
+            changed = (await diff_indexes([collection_name]))[collection_name]["changed"]
+            for name, live_name in changed.items():
+                logger.info(f"Drop the index {collection_name}.{live_name} to rebuild it as {name}")
+                await collection.drop_index(live_name)
+        # One index at a time, a conflicting index does not prevent the others
+        for model in models:
+            name = model.document["name"]
+            try:
+                await collection.create_indexes([model])
+                ensured.setdefault(collection_name, []).append(name)
+            except OperationFailure as e:
+                logger.error(f"Index {collection_name}.{name} not created: {e}")
+            except:
+                logger.error(f"{traceback.format_exc()}")
+    return ensured
+
+
+async def check_unique_indexes() -> None:
+    """
+    Raise when a declared unique index is missing, or lives with other
+    options (e.g. not unique: the data held duplicates when it was built)
+    """
+    problems = []
+    for collection_name, models in INDEXES.items():
+        unique_models = [model for model in models if model.document.get("unique")]
+        if not unique_models:
+            continue
+        live = await live_indexes(collection_name)
+        for model in unique_models:
+            name = model.document["name"]
+            spec = index_spec(model.document)
+            live_name = find_live_index(live, name, spec)
+            if live_name is None:
+                problems.append(f"{collection_name}.{name} missing")
+            elif live[live_name] != spec:
+                problems.append(f"{collection_name}.{name} changed (live: {live_name})")
+    if problems:
+        message = (f"Unique indexes not in place: {', '.join(problems)}. "
+                   "Remove the duplicates, then run scripts/indexes.py --replace")
+        logger.error(message)
+        raise RuntimeError(message)
@@ -2,11 +2,14 @@ import time
 from starlette.middleware.base import BaseHTTPMiddleware
 from starlette.requests import Request
 from app.utils.logger import Logger
+from app.core.monitoring import request_label
 logger = Logger("core/middleware", log_file="middleware.log", stream_handler=False)
 
 class LogProcessAndTime(BaseHTTPMiddleware):
     async def dispatch(self, request: Request, call_next):
         start_time = time.time()
+        # Slow MongoDB commands are logged with the request which sent them
+        request_label.set(f"{request.method} {request.url.path}")
         response = await call_next(request)
         process_time = time.time() - start_time
         logger.info(
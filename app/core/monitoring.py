@@ -0,0 +1,226 @@
+"""
+Monitoring of the MongoDB commands sent by the application.
+
+Every command is timed per command and collection (Prometheus histogram,
+exported with the other metrics). Commands slower than
+MONGO_SLOW_COMMAND_MS are logged with the shape of their filter or
+pipeline, values replaced by "?", and the request which sent them. A
+sample of the slow aggregations and finds is explained (queryPlanner) to
+log the plan they used, e.g. a COLLSCAN under a $lookup.
+
+The listener is called from the threads of the Motor executor, the
+request label follows through the context copied by Motor.
+"""
+import json
+import time
+import random
+import asyncio
+import traceback
+from contextvars import ContextVar
+from prometheus_client import Counter, Histogram
+from pymongo import monitoring
+from app.core.config import settings
+from app.utils.logger import Logger
+
+logger = Logger("core/monitoring", log_file="database.log")
+
+MONGO_COMMAND_DURATION = Histogram(
+    "app_mongo_command_duration_seconds",
+    "Duration of the MongoDB commands",
+    ["command", "collection"],
+    buckets=(0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+)
+MONGO_COMMAND_FAILURES = Counter(
+    "app_mongo_command_failures_total",
+    "MongoDB commands which failed",
+    ["command", "collection"]
+)
+MONGO_SLOW_COMMANDS = Counter(
+    "app_mongo_slow_commands_total",
+    "MongoDB commands slower than MONGO_SLOW_COMMAND_MS",
+    ["command", "collection"]
+)
+
+# "<method> <path>" of the request being served, set by the middleware
+request_label: ContextVar[str | None] = ContextVar("request_label", default=None)
+
+# Where the filter or the pipeline of a command is
+SHAPE_FIELDS = {
+    "find": "filter",
+    "aggregate": "pipeline",
+    "count": "query",
+    "distinct": "query",
+    "findAndModify": "query",
+}
+# Names of fields and collections, not values
+KEPT_KEYS = {"from", "localField", "foreignField", "as", "$sort", "$project", "$limit", "$skip"}
+# Options kept when explaining a command (no session, transaction, ...)
+EXPLAINED_FIELDS = {
+    "find": ["find", "filter", "sort", "projection", "hint", "skip", "limit", "collation"],
+    "aggregate": ["aggregate", "pipeline", "cursor", "allowDiskUse", "hint", "collation", "let"],
+}
+# Not timed: handshakes, monitoring, and the explains sent from here
+IGNORED_COMMANDS = {"hello", "ismaster", "isMaster", "ping", "saslStart",
+                    "saslContinue", "endSessions", "explain", "buildInfo", "buildinfo"}
+
+
+def command_collection(command_name: str, command: dict) -> str:
+    if command_name == "getMore":
+        return command.get("collection", "-")
+    target = command.get(command_name)
+    return target if isinstance(target, str) else "-"
+
+
+def query_shape(value, key: str | None = None):
+    """
+    Shape of a filter or a pipeline: operators and fields are kept,
+    values are replaced by "?"
+    :param value: dict | list | Any
+    :return: dict | list | str
+    """
+    if key in KEPT_KEYS:
+        return value
+    if isinstance(value, dict):
+        return {k: query_shape(v, k) for k, v in value.items()}
+    if isinstance(value, (list, tuple)):
+        # Stages of a pipeline, conditions of $and/$or: kept one by one
+        if value and all(isinstance(item, dict) for item in value):
+            return [query_shape(item) for item in value]
+        return ["?"] if value else []
+    if isinstance(value, str) and value.startswith("$"):
+        # Field path, e.g. "$clerk_user_id"
+        return value
+    return "?"
+
+
+def command_shape(command_name: str, command: dict):
+    if command_name in SHAPE_FIELDS:
+        return query_shape(command.get(SHAPE_FIELDS[command_name]))
+    if command_name in ("update", "delete"):
+        statements = command.get("updates" if command_name == "update" else "deletes") or []
+        return [query_shape(statement.get("q")) for statement in statements[:1]]
+    return None
+
+
+def plan_summary(explain: dict) -> str:
+    """
+    Stages of an explain output, in order, e.g.
+    "$cursor > FETCH > IXSCAN(exam_id) > $lookup"
+    :param explain: dict
+    :return: str
+    """
+    stages = []
+
+    def walk(value, pipeline_stage: bool = False):
+        if isinstance(value, dict):
+            if isinstance(value.get("stage"), str):
+                index_name = value.get("indexName")
+                stages.append(f"{value['stage']}({index_name})" if index_name else value["stage"])
+            for key, item in value.items():
+                if key in ("rejectedPlans", "parsedQuery", "command"):
+                    continue
+                if pipeline_stage and key.startswith("$"):
+                    stages.append(key)
+                walk(item, key == "stages")
+        elif isinstance(value, list):
+            for item in value:
+                walk(item, pipeline_stage)
+
+    walk(explain)
+    return " > ".join(stages)
+
+
+class CommandMonitor(monitoring.CommandListener):
+    """
+    pymongo command listener: latency histograms, slow command log and
+    sampled explains. `start` (in the lifespan) enables the explains.
+    """
+    def __init__(self,
+                 slow_ms: float,
+                 explain_sample_rate: float,
+                 explain_interval: float
+                 ) -> None:
+        self.slow_ms = slow_ms
+        self.explain_sample_rate = explain_sample_rate
+        self.explain_interval = explain_interval
+        self._started = {}
+        self._explained_at = {}
+        self._loop = None
+        self._db = None
+
+    def start(self, db) -> None:
+        """
+        :param db: AsyncIOMotorDatabase, to send the explains
+        """
+        self._loop = asyncio.get_running_loop()
+        self._db = db
+
+    def stop(self) -> None:
+        self._loop = None
+
+    def started(self, event: monitoring.CommandStartedEvent) -> None:
+        if event.command_name in IGNORED_COMMANDS:
+            return
+        self._started[(event.connection_id, event.request_id)] = (
+            command_collection(event.command_name, event.command),
+            event.command,
+            request_label.get()
+        )
+
+    def succeeded(self, event: monitoring.CommandSucceededEvent) -> None:
+        self._finished(event, failed=False)
+
+    def failed(self, event: monitoring.CommandFailedEvent) -> None:
+        self._finished(event, failed=True)
+
+    def _finished(self, event, failed: bool) -> None:
+        started = self._started.pop((event.connection_id, event.request_id), None)
+        if started is None:
+            return
+        try:
+            collection, command, label = started
+            duration = event.duration_micros / 1e6
+            MONGO_COMMAND_DURATION.labels(event.command_name, collection).observe(duration)
+            if failed:
+                MONGO_COMMAND_FAILURES.labels(event.command_name, collection).inc()
+            if duration * 1000 >= self.slow_ms:
+                self._slow(event.command_name, collection, command, label, duration)
+        except:
+            logger.error(f"{traceback.format_exc()}")
+
+    def _slow(self, command_name: str, collection: str, command: dict,
+              label: str | None, duration: float) -> None:
+        MONGO_SLOW_COMMANDS.labels(command_name, collection).inc()
+        shape = json.dumps(command_shape(command_name, command), default=str)
+        logger.warning(f"Slow {command_name} on {collection}: {duration * 1000:.1f} ms"
+                       f" ({label or 'no request'}) {shape}")
+        if command_name in EXPLAINED_FIELDS and self._should_explain(collection, shape):
+            explained = {field: command[field] for field in EXPLAINED_FIELDS[command_name]
+                         if field in command}
+            asyncio.run_coroutine_threadsafe(self._explain(collection, shape, explained),
+                                             self._loop)
+
+    def _should_explain(self, collection: str, shape: str) -> bool:
+        if self._loop is None or self._loop.is_closed():
+            return False
+        if random.random() >= self.explain_sample_rate:
+            return False
+        # One explain per shape and interval
+        now = time.monotonic()
+        key = (collection, shape)
+        if now - self._explained_at.get(key, -self.explain_interval) < self.explain_interval:
+            return False
+        self._explained_at[key] = now
+        return True
+
+    async def _explain(self, collection: str, shape: str, command: dict) -> None:
+        try:
+            explain = await self._db.command({"explain": command, "verbosity": "queryPlanner"})
+            logger.warning(f"Plan of the slow command on {collection} {shape}: {plan_summary(explain)}")
+        except:
+            logger.error(f"{traceback.format_exc()}")
+
+
+command_monitor = CommandMonitor(slow_ms=settings.MONGO_SLOW_COMMAND_MS,
+                                 explain_sample_rate=settings.MONGO_EXPLAIN_SAMPLE_RATE,
+                                 explain_interval=settings.MONGO_EXPLAIN_INTERVAL)
@@ -0,0 +1,71 @@
+"""
+Writes returning the written document in one round trip, instead of
+reading it back with find_one after the insert or the update.
+"""
+from pymongo import ReturnDocument
+from motor.motor_asyncio import AsyncIOMotorClientSession, AsyncIOMotorCollection
+from app.utils.cache_backend import encode_value, decode_value
+
+
+def stored_document(document: dict) -> dict:
+    """
+    A document as it is read back from the database: BSON round trip of
+    the client codec (naive UTC datetimes truncated to milliseconds,
+    tuples as lists, ...), computed locally
+    :param document: dict
+    :return: dict
+    """
+    return decode_value(encode_value(document))
+
+
+async def insert_document(collection: AsyncIOMotorCollection,
+                          document: dict,
+                          session: AsyncIOMotorClientSession | None = None
+                          ) -> dict:
+    """
+    Insert a document
+    :param collection: AsyncIOMotorCollection
+    :param document: dict
+    :param session: AsyncIOMotorClientSession
+    :return: dict, the inserted document, with its _id
+    """
+    result = await collection.insert_one(document, session=session)
+    return stored_document({"_id": result.inserted_id, **document})
+
+
+async def insert_documents(collection: AsyncIOMotorCollection,
+                           documents: list[dict],
+                           session: AsyncIOMotorClientSession | None = None
+                           ) -> list[dict]:
+    """
+    Insert documents (ordered)
+    :param collection: AsyncIOMotorCollection
+    :param documents: list[dict]
+    :param session: AsyncIOMotorClientSession
+    :return: list[dict], the inserted documents, with their _id
+    """
+    result = await collection.insert_many(documents, session=session)
+    return [stored_document({"_id": id, **document})
+            for id, document in zip(result.inserted_ids, documents)]
+
+
+async def update_document(collection: AsyncIOMotorCollection,
+                          filter: dict,
+                          update: dict | list,
+                          session: AsyncIOMotorClientSession | None = None,
+                          **kwargs
+                          ) -> dict | None:
+    """
+    Update a document and return it after the update
+    :param collection: AsyncIOMotorCollection
+    :param filter: dict
+    :param update: dict | list (pipeline)
+    :param session: AsyncIOMotorClientSession
+    :param kwargs: projection, upsert, ... of find_one_and_update
+    :return: dict, None when no document matches
+    """
+    return await collection.find_one_and_update(filter,
+                                                update,
+                                                return_document=ReturnDocument.AFTER,
+                                                session=session,
+                                                **kwargs)
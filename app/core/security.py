@@ -1,3 +1,5 @@
+import time
+import hashlib
 import jwt
 from jwt.exceptions import (
     ExpiredSignatureError, 
@@ -6,8 +8,10 @@ from jwt.exceptions import (
 )
 from fastapi import Depends, HTTPException, status
 from fastapi.security import HTTPBearer
+from cryptography.hazmat.primitives.serialization import load_pem_public_key
 from app.core.config import settings
 from app.api.v1.controllers.user import retrieve_user
+from app.utils.cache import TTLCache, MISSING, CACHE_REQUESTS
 
 
 if settings.ENV_TYPE == "development":
@@ -38,13 +42,46 @@ else:
     raise ValueError("Invalid ENV_TYPE")
 
 ALGORITHM = "RS256"
+# Parse the PEM once, jwt.decode would do it on every call with a str key
+PUBLIC_KEY_OBJECT = load_pem_public_key(PUBLIC_KEY.encode())
 oauth2_scheme = HTTPBearer()
 
+# sha256(token) -> verified payload, kept until the token expires
+verified_tokens = TTLCache("jwt",
+                           maxsize=settings.JWT_CACHE_SIZE,
+                           ttl=settings.JWT_CACHE_MAX_TTL)
+
+
+def decode_token(token: str) -> dict:
+    """
+    Verify a token, a token already verified is not checked again
+    (no RSA verification) as long as it is inside its exp/nbf window
+    :param token: str
+    :return: dict, the payload
+    """
+    digest = hashlib.sha256(token.encode()).digest()
+    payload = verified_tokens.get(digest)
+    now = time.time()
+    if (payload is not MISSING
+    and payload.get("nbf", 0) <= now
+    and ("exp" not in payload or now < payload["exp"])):
+        CACHE_REQUESTS.labels("jwt", "hit").inc()
+        return payload
+    CACHE_REQUESTS.labels("jwt", "miss").inc()
+
+    payload = jwt.decode(token, PUBLIC_KEY_OBJECT, algorithms=[ALGORITHM])
+    ttl = settings.JWT_CACHE_MAX_TTL
+    if "exp" in payload:
+        ttl = min(ttl, payload["exp"] - now)
+    if ttl > 0:
+        verified_tokens.set(digest, payload, ttl=ttl)
+    return payload
+
 
 async def is_authenticated(oauth2_scheme: HTTPBearer = Depends(oauth2_scheme)):
     try:
         token = oauth2_scheme.credentials
-        payload = jwt.decode(token, PUBLIC_KEY, algorithms=[ALGORITHM])
+        payload = decode_token(token)
         clerk_user_id: str = payload.get("sub")
         return clerk_user_id
     
@@ -67,13 +104,20 @@ async def is_authenticated(oauth2_scheme: HTTPBearer = Depends(oauth2_scheme)):
             headers={"WWW-Authenticate": "Bearer"},
         )
 
-async def is_admin(clerk_user_id: str = Depends(is_authenticated)):
+async def get_current_user(clerk_user_id: str = Depends(is_authenticated)) -> dict:
+    """
+    The user of the request, loaded once: FastAPI caches a dependency for
+    the whole request, so is_admin/is_aio and the route handler share it.
+    """
     user_info = await retrieve_user(clerk_user_id)
     if isinstance(user_info, Exception):
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail=str(user_info)
         )
+    return user_info
+
+async def is_admin(user_info: dict = Depends(get_current_user)):
     if user_info["role"] != "admin":
         raise HTTPException(
             status_code=status.HTTP_403_FORBIDDEN,
@@ -81,13 +125,7 @@ async def is_admin(clerk_user_id: str = Depends(is_authenticated)):
         )
     return user_info
 
-async def is_aio(clerk_user_id: str = Depends(is_authenticated)):
-    user_info = await retrieve_user(clerk_user_id)
-    if isinstance(user_info, Exception):
-        raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND,
-            detail=str(user_info)
-        )
+async def is_aio(user_info: dict = Depends(get_current_user)):
     if user_info["role"] not in ["admin", "aio"]:
         raise HTTPException(
             status_code=status.HTTP_403_FORBIDDEN,
@@ -0,0 +1,130 @@
+"""
+Transactions retried on transient errors.
+
+`run_transaction` runs a callback in a transaction the way
+ClientSession.with_transaction does. The whole transaction is retried on
+TransientTransactionError (write conflicts with the live exam traffic,
+elections). The commit alone is retried on UnknownTransactionCommitResult.
+Both retry within MONGO_TRANSACTION_MAX_ATTEMPTS and
+MONGO_TRANSACTION_TIMEOUT seconds, with a jittered exponential backoff.
+Errors raised by the callback itself (MessageException, ...) abort the
+transaction and are not retried.
+
+With atomic=False the callback runs without a transaction and is retried
+as a whole on the same errors. This is for writes which are idempotent and
+ordered so that stopping between two of them leaves consistent data.
+"""
+import time
+import random
+import asyncio
+from typing import Any, Awaitable, Callable
+from prometheus_client import Counter
+from pymongo.errors import ConnectionFailure, PyMongoError
+from motor.motor_asyncio import AsyncIOMotorClientSession
+from app.core.config import settings
+from app.core.database import mongo_client
+from app.utils.logger import Logger
+
+logger = Logger("core/transactions", log_file="database.log")
+
+MONGO_TRANSACTIONS = Counter(
+    "app_mongo_transactions_total",
+    "Transactions run, by outcome (committed, aborted, failed)",
+    ["name", "outcome"]
+)
+MONGO_TRANSACTION_RETRIES = Counter(
+    "app_mongo_transaction_retries_total",
+    "Transactions (or their commit) retried after a transient error",
+    ["name", "stage"]
+)
+
+# Backoff between two attempts, seconds
+BACKOFF_BASE = 0.05
+BACKOFF_MAX = 1
+
+
+def is_transient(error: Exception) -> bool:
+    if isinstance(error, ConnectionFailure):
+        return True
+    return isinstance(error, PyMongoError) and (
+        error.has_error_label("TransientTransactionError")
+        or error.has_error_label("RetryableWriteError")
+    )
+
+
+def backoff(attempt: int) -> float:
+    return min(BACKOFF_MAX, BACKOFF_BASE * 2 ** (attempt - 1)) * random.uniform(0.5, 1)
+
+
+class _Retry:
+    def __init__(self, name: str) -> None:
+        self.name = name
+        self.attempt = 1
+        self.deadline = time.monotonic() + settings.MONGO_TRANSACTION_TIMEOUT
+
+    async def wait(self, error: Exception, stage: str) -> bool:
+        """
+        :return: bool, True to try again (after the backoff)
+        """
+        if (self.attempt >= settings.MONGO_TRANSACTION_MAX_ATTEMPTS
+                or time.monotonic() >= self.deadline):
+            return False
+        MONGO_TRANSACTION_RETRIES.labels(self.name, stage).inc()
+        logger.warning(f"Retry the {stage} of {self.name} "
+                       f"(attempt {self.attempt}): {error}")
+        await asyncio.sleep(backoff(self.attempt))
+        self.attempt += 1
+        return True
+
+
+async def _commit(session: AsyncIOMotorClientSession, retry: _Retry) -> None:
+    while True:
+        try:
+            await session.commit_transaction()
+            return
+        except PyMongoError as e:
+            # Committing again is safe, the outcome of the first one is unknown
+            if (e.has_error_label("UnknownTransactionCommitResult")
+                    and await retry.wait(e, "commit")):
+                continue
+            raise
+
+
+async def run_transaction(name: str,
+                          callback: Callable[[AsyncIOMotorClientSession | None], Awaitable[Any]],
+                          atomic: bool = True
+                          ) -> Any:
+    """
+    Run the writes of callback in a transaction, retried on transient errors
+    :param name: str, label of the metrics, e.g. "delete_submission"
+    :param callback: async function of the session (None when not atomic),
+        may run several times
+    :param atomic: bool, False to run without a transaction
+    :return: the result of the callback
+    """
+    retry = _Retry(name)
+    async with await mongo_client.start_session() as session:
+        while True:
+            # Counted once per run, when it is not retried
+            outcome = "failed"
+            try:
+                if not atomic:
+                    result = await callback(None)
+                    MONGO_TRANSACTIONS.labels(name, "committed").inc()
+                    return result
+                session.start_transaction()
+                try:
+                    result = await callback(session)
+                except:
+                    if session.in_transaction:
+                        await session.abort_transaction()
+                    outcome = "aborted"
+                    raise
+                await _commit(session, retry)
+                MONGO_TRANSACTIONS.labels(name, "committed").inc()
+                return result
+            except Exception as e:
+                if is_transient(e) and await retry.wait(e, "transaction"):
+                    continue
+                MONGO_TRANSACTIONS.labels(name, outcome).inc()
+                raise
@@ -6,4 +6,5 @@ inngest_functions = [
     create_pseudo_submission,
     timeout_submit,
     remove_draft_submission,
+    delete_cascade_in_background,
 ]
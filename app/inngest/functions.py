@@ -28,10 +28,8 @@ from app.api.v1.controllers.submission import (
     retrieve_draft_submission,
     delete_draft_submission
 )
-from app.api.v1.controllers.certificate import (
-    retrieve_certificate_by_validation_id
-)
 from app.api.v1.controllers.contest import submission_result
+from app.core.cascade import delete_cascade
 logger = Logger("inngest/functions", log_file="inngest.log")
 
 
@@ -58,6 +56,8 @@ async def create_certificate(ctx: inngest.Context, step: inngest.Step) -> dict:
     )
     if created_certificate.get("status_code") == status.HTTP_500_INTERNAL_SERVER_ERROR:
         return "Error when create certificate"
+    # The validation_id stored, another one when the proposed one was taken
+    certificate_info["validation_id"] = created_certificate["validation_id"]
     
     await step.send_event(
         "notify-certificate",
@@ -203,7 +203,8 @@ async def timeout_submit(ctx: inngest.Context, step: inngest.Step) -> dict:
         "step-update-submission",
         lambda: update_submission(
             pseudo_submission["id"],
-            upsert_submission_data
+            upsert_submission_data,
+            contest_id=ctx.event.data["contest_info"]["id"]
         )
     )
     if "message" in upsert_submission:
@@ -216,13 +217,8 @@ async def timeout_submit(ctx: inngest.Context, step: inngest.Step) -> dict:
     if (contest_info["certificate_template"] is not None 
     and exam_results["max_score"] > 0 
     and exam_results["total_score"] / exam_results["max_score"] >= 0.5):
+        # A taken validation_id is replaced when the certificate is inserted
         validation_id = generate_id()
-        # Check if validation_id is exist
-        start_time = datetime.now(UTC)
-        while await retrieve_certificate_by_validation_id(validation_id):
-            validation_id = generate_id()
-        end_time = datetime.now(UTC)
-        logger.info(f"Generate validation_id in {end_time - start_time}")
 
         # Create a new certificate
         certificate_data = CertificateDB(
@@ -238,7 +234,7 @@ async def timeout_submit(ctx: inngest.Context, step: inngest.Step) -> dict:
         await inngest_client.send(
             inngest.Event(
                 name="contest/certificate",
-                id=f"certificate-{validation_id}",
+                id=f"certificate-{pseudo_submission['id']}",
                 data={
                     "user_info": {
                         "fullname": user_info["fullname"],
@@ -286,3 +282,24 @@ async def remove_draft_submission(ctx: inngest.Context, step: inngest.Step) -> d
         return delete_draft.get("message")
     
     return delete_draft
+
+
+@inngest_client.create_function(
+    fn_id="delete-cascade",
+    retries=3,
+    trigger=inngest.TriggerEvent(event="cascade/delete"),
+)
+async def delete_cascade_in_background(ctx: inngest.Context, step: inngest.Step) -> dict:
+    collection_name = ctx.event.data["collection_name"]
+    ids = ctx.event.data["ids"]
+    # One bounded step at a time, a failed step resumes where it stopped
+    deleted, done, step_number = 0, False, 0
+    while not done:
+        step_deleted, done = await step.run(
+            f"step-delete-cascade-{step_number}",
+            lambda: delete_cascade(collection_name, ids, limit=settings.CASCADE_SYNC_LIMIT)
+        )
+        deleted += step_deleted
+        step_number += 1
+    logger.info(f"Cascade of {collection_name} {ids} done ({deleted} documents deleted)")
+    return {"deleted": deleted}
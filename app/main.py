@@ -1,3 +1,5 @@
+import asyncio
+import traceback
 from contextlib import asynccontextmanager
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
@@ -8,14 +10,57 @@ from prometheus_fastapi_instrumentator import Instrumentator
 import inngest.fast_api
 from app.inngest.client import inngest_client
 from app.inngest import inngest_functions
+from app.api.v1.controllers.draft_buffer import draft_buffer
+from app.core.cache import watch_changes, cache_backend, warm_content_caches
+from app.core.indexes import ensure_indexes, check_unique_indexes
+from app.core.database import mongo_db, connect_database, close_database
+from app.core.cohort_index import contest_index, meeting_index
+from app.core.monitoring import command_monitor
+from app.utils.logger import Logger
+
+logger = Logger("main", log_file="database.log")
+
+
+async def warm_up() -> None:
+    """
+    Load the caches read by most requests before accepting traffic,
+    a failure is logged and left to the first requests
+    """
+    for index in (contest_index, meeting_index):
+        try:
+            await index.ensure_loaded()
+        except:
+            logger.error(f"{traceback.format_exc()}")
+    try:
+        contests = await warm_content_caches()
+        logger.info(f"Loaded the content caches ({contests} active contests)")
+    except:
+        logger.error(f"{traceback.format_exc()}")
 
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
-    # Load something
+    command_monitor.start(mongo_db)
+    await connect_database()
+    if settings.ENSURE_INDEXES:
+        await ensure_indexes()
+    # Several writes rely on the unique indexes alone
+    await check_unique_indexes()
+    # Started first, the warm up fills the shared backend too
+    await cache_backend.start()
+    await warm_up()
+    draft_buffer.start()
+    cache_watcher = None
+    if settings.CACHE_CHANGE_STREAM:
+        cache_watcher = asyncio.create_task(watch_changes())
     yield
-    # Clean up
-    pass
+    if cache_watcher is not None:
+        cache_watcher.cancel()
+    # Write the buffered drafts before shutting down
+    await draft_buffer.stop()
+    await cache_backend.close()
+    command_monitor.stop()
+    close_database()
 
 
 def create_application() -> FastAPI:
@@ -32,8 +32,14 @@ class SubmissionSchema(BaseModel):
 class SubmittedResult(SubmittedProblem):
     title: str
     description: str
+    # Detail results are stored in "submission_testcases", 
+    # only the verdict counts are kept in the submission document
     public_testcases_results: list | None = None
     private_testcases_results: list | None = None
+    public_testcases_passed: int | None = None
+    public_testcases_total: int | None = None
+    private_testcases_passed: int | None = None
+    private_testcases_total: int | None = None
     choice_results: list | None = None
     is_pass_problem: bool = False
 
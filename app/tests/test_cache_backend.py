@@ -0,0 +1,219 @@
+import time
+import asyncio
+import fnmatch
+from datetime import datetime
+from bson.objectid import ObjectId
+from app.utils.cache import MISSING
+from app.utils.cache_backend import InMemoryCacheBackend, RedisCacheBackend
+from app.core.cache import ReadThroughCache
+
+
+class FakeRedisServer:
+    """
+    Just enough of the Redis protocol (RESP2) for the cache backend:
+    GET, MGET, SET (PX), DEL, SCAN, PUBLISH and SUBSCRIBE
+    """
+    def __init__(self) -> None:
+        self.entries = {}
+        self.subscribers = {}
+        self.server = None
+
+    async def start(self) -> str:
+        self.server = await asyncio.start_server(self.handle, "127.0.0.1", 0)
+        port = self.server.sockets[0].getsockname()[1]
+        return f"redis://127.0.0.1:{port}/0"
+
+    async def stop(self) -> None:
+        self.server.close()
+        for writers in self.subscribers.values():
+            for writer in writers:
+                writer.close()
+
+    async def read_command(self, reader: asyncio.StreamReader) -> list | None:
+        line = await reader.readline()
+        if not line:
+            return None
+        args = []
+        for _ in range(int(line[1:])):
+            length = int((await reader.readline())[1:])
+            args.append((await reader.readexactly(length + 2))[:-2])
+        return args
+
+    def encode(self, value) -> bytes:
+        if value is None:
+            return b"$-1\r\n"
+        if isinstance(value, int):
+            return b":%d\r\n" % value
+        if isinstance(value, list):
+            return b"*%d\r\n" % len(value) + b"".join(self.encode(item) for item in value)
+        if isinstance(value, str):
+            value = value.encode()
+        return b"$%d\r\n%s\r\n" % (len(value), value)
+
+    def get(self, key: bytes):
+        entry = self.entries.get(key)
+        if entry is None:
+            return None
+        value, expires_at = entry
+        if expires_at is not None and expires_at <= time.monotonic():
+            self.entries.pop(key, None)
+            return None
+        return value
+
+    async def handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        while True:
+            args = await self.read_command(reader)
+            if args is None:
+                break
+            command = args[0].decode().upper()
+            if command == "GET":
+                reply = self.encode(self.get(args[1]))
+            elif command == "MGET":
+                reply = self.encode([self.get(key) for key in args[1:]])
+            elif command == "SET":
+                expires_at = None
+                if len(args) > 3 and args[3].upper() == b"PX":
+                    expires_at = time.monotonic() + int(args[4]) / 1000
+                self.entries[args[1]] = (args[2], expires_at)
+                reply = b"+OK\r\n"
+            elif command == "DEL":
+                reply = self.encode(sum(self.entries.pop(key, None) is not None for key in args[1:]))
+            elif command == "SCAN":
+                pattern = args[args.index(b"MATCH") + 1].decode() if b"MATCH" in args else "*"
+                keys = [key for key in self.entries if fnmatch.fnmatchcase(key.decode(), pattern)]
+                reply = self.encode([b"0", keys])
+            elif command == "PUBLISH":
+                writers = self.subscribers.get(args[1], [])
+                for subscriber in writers:
+                    subscriber.write(self.encode([b"message", args[1], args[2]]))
+                reply = self.encode(len(writers))
+            elif command == "SUBSCRIBE":
+                for channel in args[1:]:
+                    self.subscribers.setdefault(channel, []).append(writer)
+                    writer.write(self.encode([b"subscribe", channel, 1]))
+                await writer.drain()
+                continue
+            elif command == "PING":
+                reply = b"+PONG\r\n"
+            else:
+                reply = b"-ERR unknown command\r\n"
+            writer.write(reply)
+            await writer.drain()
+        for writers in self.subscribers.values():
+            if writer in writers:
+                writers.remove(writer)
+        writer.close()
+
+
+def test_in_memory_backend():
+    async def main():
+        backend = InMemoryCacheBackend()
+        document = {"_id": ObjectId(), "title": "A", "created_at": datetime(2024, 1, 1)}
+        await backend.set("problem", "1", document, ttl=60)
+        await backend.set("problem", "2", {"title": "B"}, ttl=0.01)
+
+        value = await backend.get("problem", "1")
+        assert value == document
+        value["title"] = "changed"
+        assert (await backend.get("problem", "1"))["title"] == "A"
+
+        await asyncio.sleep(0.02)
+        assert await backend.get("problem", "2") is MISSING
+        assert await backend.get_many("problem", ["1", "2"]) == {"1": document}
+
+        received = []
+        backend.subscribe("problem", received.append)
+        await backend.invalidate("problem", None)
+        assert await backend.get("problem", "1") is MISSING
+        assert received == [None]
+
+    asyncio.run(main())
+
+
+def test_redis_backend():
+    async def main():
+        server = FakeRedisServer()
+        url = await server.start()
+        backend = RedisCacheBackend(url)
+        try:
+            document = {"_id": ObjectId(), "cohorts": [2024], "created_at": datetime(2024, 1, 1)}
+            await backend.set("contest", "1", document, ttl=60)
+            await backend.set_many("contest", {"2": {"title": "B"}, "3": {"title": "C"}}, ttl=60)
+
+            assert await backend.get("contest", "1") == document
+            assert await backend.get("contest", "4") is MISSING
+            assert await backend.get_many("contest", ["1", "3", "4"]) == {
+                "1": document,
+                "3": {"title": "C"}
+            }
+
+            await backend.delete("contest", "1")
+            assert await backend.get("contest", "1") is MISSING
+            await backend.delete("contest", None)
+            assert await backend.get_many("contest", ["2", "3"]) == {}
+        finally:
+            await backend.close()
+            await server.stop()
+
+    asyncio.run(main())
+
+
+def test_invalidation_fan_out():
+    async def main():
+        server = FakeRedisServer()
+        url = await server.start()
+        # Two workers, each with its own caches
+        backends = [RedisCacheBackend(url), RedisCacheBackend(url)]
+        caches = [ReadThroughCache("contest", maxsize=10, ttl=60, backend=backend)
+                  for backend in backends]
+        database = {"1": {"title": "A"}}
+        loads = []
+
+        async def loader():
+            loads.append(1)
+            return dict(database["1"])
+
+        try:
+            for backend in backends:
+                await backend.start()
+                await backend.wait_subscribed(timeout=5)
+
+            assert (await caches[0].get("1", loader))["title"] == "A"
+            # Read from the shared backend by the other worker
+            assert (await caches[1].get("1", loader))["title"] == "A"
+            assert len(loads) == 1
+
+            database["1"]["title"] = "B"
+            caches[0].invalidate("1")
+            for _ in range(100):
+                await asyncio.sleep(0.01)
+                if await backends[0].get("contest", "1") is MISSING:
+                    break
+            await asyncio.sleep(0.05)
+
+            # Both workers dropped their entry
+            assert (await caches[1].get("1", loader))["title"] == "B"
+            assert (await caches[0].get("1", loader))["title"] == "B"
+            assert len(loads) == 2
+        finally:
+            for backend in backends:
+                await backend.close()
+            await server.stop()
+
+    asyncio.run(main())
+
+
+def test_backend_down():
+    async def main():
+        server = FakeRedisServer()
+        url = await server.start()
+        await server.stop()
+        cache = ReadThroughCache("exam", maxsize=10, ttl=60, backend=RedisCacheBackend(url))
+
+        async def loader():
+            return {"title": "A"}
+
+        # The database is still read when the shared backend is unreachable
+        assert await cache.get("1", loader) == {"title": "A"}
+
+    asyncio.run(main())
@@ -0,0 +1,172 @@
+import asyncio
+import pytest
+from prometheus_client import REGISTRY
+from pymongo.errors import OperationFailure
+from app.core import transactions
+from app.core.config import settings
+from app.core.transactions import run_transaction
+from app.utils.exception import MessageException
+
+
+class FakeSession:
+    """
+    Just enough of AsyncIOMotorClientSession for run_transaction, the commit
+    raises the errors of commit_errors in order
+    """
+    def __init__(self, commit_errors: list[Exception] | None = None) -> None:
+        self.commit_errors = list(commit_errors or [])
+        self.in_transaction = False
+        self.started = 0
+        self.commits = 0
+        self.aborts = 0
+
+    async def __aenter__(self) -> "FakeSession":
+        return self
+
+    async def __aexit__(self, *args) -> None:
+        pass
+
+    def start_transaction(self) -> None:
+        self.in_transaction = True
+        self.started += 1
+
+    async def commit_transaction(self) -> None:
+        self.commits += 1
+        if self.commit_errors:
+            raise self.commit_errors.pop(0)
+        self.in_transaction = False
+
+    async def abort_transaction(self) -> None:
+        self.aborts += 1
+        self.in_transaction = False
+
+
+class FakeClient:
+    def __init__(self, session: FakeSession) -> None:
+        self.session = session
+
+    async def start_session(self) -> FakeSession:
+        return self.session
+
+
+def labelled_error(label: str) -> OperationFailure:
+    return OperationFailure("WriteConflict", code=112,
+                            details={"errorLabels": [label]})
+
+
+def count(name: str, outcome: str) -> float:
+    return REGISTRY.get_sample_value("app_mongo_transactions_total",
+                                     {"name": name, "outcome": outcome}) or 0
+
+
+@pytest.fixture
+def session(monkeypatch):
+    session = FakeSession()
+    monkeypatch.setattr(transactions, "mongo_client", FakeClient(session))
+    monkeypatch.setattr(transactions, "BACKOFF_BASE", 0)
+    monkeypatch.setattr(settings, "MONGO_TRANSACTION_MAX_ATTEMPTS", 5)
+    monkeypatch.setattr(settings, "MONGO_TRANSACTION_TIMEOUT", 30)
+    return session
+
+
+def test_transient_error_retried(session):
+    calls = []
+
+    async def callback(s):
+        calls.append(s)
+        if len(calls) < 3:
+            raise labelled_error("TransientTransactionError")
+        return "done"
+
+    assert asyncio.run(run_transaction("test_transient", callback)) == "done"
+    assert calls == [session] * 3
+    assert session.started == 3
+    assert session.aborts == 2
+    assert session.commits == 1
+    # One run, counted once
+    assert count("test_transient", "committed") == 1
+    assert count("test_transient", "aborted") == 0
+
+
+def test_unknown_commit_result_retries_commit_only(session):
+    session.commit_errors = [labelled_error("UnknownTransactionCommitResult")] * 2
+    calls = []
+
+    async def callback(s):
+        calls.append(s)
+
+    asyncio.run(run_transaction("test_commit", callback))
+    assert len(calls) == 1
+    assert session.started == 1
+    assert session.commits == 3
+    assert count("test_commit", "committed") == 1
+
+
+def test_callback_error_not_retried(session):
+    calls = []
+
+    async def callback(s):
+        calls.append(s)
+        raise MessageException("Submission not found", 404)
+
+    with pytest.raises(MessageException):
+        asyncio.run(run_transaction("test_callback_error", callback))
+    assert len(calls) == 1
+    assert session.aborts == 1
+    assert session.commits == 0
+    assert count("test_callback_error", "aborted") == 1
+    assert count("test_callback_error", "failed") == 0
+
+
+def test_attempts_bound(session, monkeypatch):
+    monkeypatch.setattr(settings, "MONGO_TRANSACTION_MAX_ATTEMPTS", 3)
+    calls = []
+
+    async def callback(s):
+        calls.append(s)
+        raise labelled_error("TransientTransactionError")
+
+    with pytest.raises(OperationFailure):
+        asyncio.run(run_transaction("test_attempts", callback))
+    assert len(calls) == 3
+    assert count("test_attempts", "aborted") == 1
+
+
+def test_attempts_shared_with_commit(session, monkeypatch):
+    monkeypatch.setattr(settings, "MONGO_TRANSACTION_MAX_ATTEMPTS", 3)
+    session.commit_errors = [labelled_error("UnknownTransactionCommitResult")] * 5
+
+    async def callback(s):
+        pass
+
+    with pytest.raises(OperationFailure):
+        asyncio.run(run_transaction("test_commit_attempts", callback))
+    assert session.commits == 3
+    assert count("test_commit_attempts", "failed") == 1
+
+
+def test_deadline_bound(session, monkeypatch):
+    monkeypatch.setattr(settings, "MONGO_TRANSACTION_TIMEOUT", 0)
+    calls = []
+
+    async def callback(s):
+        calls.append(s)
+        raise labelled_error("TransientTransactionError")
+
+    with pytest.raises(OperationFailure):
+        asyncio.run(run_transaction("test_deadline", callback))
+    assert len(calls) == 1
+
+
+def test_not_atomic_retried_without_session(session):
+    calls = []
+
+    async def callback(s):
+        calls.append(s)
+        if len(calls) < 2:
+            raise labelled_error("RetryableWriteError")
+        return len(calls)
+
+    assert asyncio.run(run_transaction("test_not_atomic", callback, atomic=False)) == 2
+    assert calls == [None, None]
+    assert session.started == 0
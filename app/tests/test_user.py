@@ -45,6 +45,11 @@ async def double_email():
 
 
 
+async def main():
+    # One event loop, the database client is bound to it
+    await missing_field()
+    await double_email()
+
+
 if __name__ == '__main__':
-    asyncio.run(missing_field())
-    asyncio.run(double_email())
+    asyncio.run(main())
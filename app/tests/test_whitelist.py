@@ -51,6 +51,11 @@ async def check_role_of_whitelist():
             if user['email'] == email and user['role'] != "aio":
                 print(email, user['role'])
 
+async def main():
+    # One event loop, the database client is bound to it
+    await check_whitelist()
+    await check_role_of_whitelist()
+
+
 if __name__ == '__main__':
-    asyncio.run(check_whitelist())
-    asyncio.run(check_role_of_whitelist())
+    asyncio.run(main())
@@ -0,0 +1,170 @@
+import asyncio
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Hashable
+from prometheus_client import Counter
+
+CACHE_REQUESTS = Counter(
+    "app_cache_requests_total",
+    "Lookups in the in-process caches",
+    ["cache", "result"]
+)
+CACHE_INVALIDATIONS = Counter(
+    "app_cache_invalidations_total",
+    "Entries dropped from the in-process caches by an invalidation",
+    ["cache"]
+)
+
+SINGLEFLIGHT_CALLS = Counter(
+    "app_singleflight_calls_total",
+    "Calls through a single-flight group, coalesced ones shared an in-flight call",
+    ["flight", "result"]
+)
+
+MISSING = object()
+
+
+class SingleFlight:
+    """
+    Coalesce concurrent calls with the same key: the first caller runs
+    the function, the others wait for it and get the same result (or
+    exception). Nothing is kept once the call is over.
+
+    The function runs in its own task, which every caller awaits through
+    a shield: a caller being cancelled (e.g. its client disconnected),
+    the first one included, does not cancel the call of the others.
+    """
+    def __init__(self, name: str) -> None:
+        self.name = name
+        self._calls = {}
+
+    def __len__(self) -> int:
+        return len(self._calls)
+
+    def forget(self, key: Hashable) -> None:
+        """
+        Let the next call of a key run again even if one is in flight,
+        used when the data it reads just changed
+        :param key: Hashable
+        """
+        self._calls.pop(key, None)
+
+    def clear(self) -> None:
+        self._calls.clear()
+
+    def _done(self, key: Hashable, task: asyncio.Task) -> None:
+        if self._calls.get(key) is task:
+            self._calls.pop(key, None)
+        # Retrieved even when every caller was cancelled
+        if not task.cancelled():
+            task.exception()
+
+    async def do(self, key: Hashable, fn: Callable[[], Awaitable[Any]]) -> Any:
+        """
+        Run fn, or wait for the in-flight call of the same key
+        :param key: Hashable
+        :param fn: async callable
+        """
+        task = self._calls.get(key)
+        if task is not None:
+            SINGLEFLIGHT_CALLS.labels(self.name, "coalesced").inc()
+        else:
+            SINGLEFLIGHT_CALLS.labels(self.name, "executed").inc()
+            task = asyncio.ensure_future(fn())
+            self._calls[key] = task
+            task.add_done_callback(lambda task: self._done(key, task))
+        return await asyncio.shield(task)
+
+
+class TTLCache:
+    """
+    Bounded in-process cache: least recently used entries are evicted
+    once `maxsize` is reached and every entry expires after `ttl` seconds.
+
+    `get_or_load` protects against stampedes: concurrent misses of the
+    same key wait for a single call of the loader (see SingleFlight).
+    """
+    def __init__(self, name: str, maxsize: int = 1024, ttl: float = 60) -> None:
+        self.name = name
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._flight = SingleFlight(name)
+        # Bumped by every invalidation, a load started before is not cached
+        self._epoch = 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(self, key: Hashable) -> Any:
+        """
+        Return the cached value, or MISSING when absent or expired
+        :param key: Hashable
+        """
+        entry = self._entries.get(key)
+        if entry is None:
+            return MISSING
+        expires_at, value = entry
+        if expires_at <= time.monotonic():
+            self._entries.pop(key, None)
+            return MISSING
+        self._entries.move_to_end(key)
+        return value
+
+    def set(self, key: Hashable, value: Any, ttl: float | None = None) -> None:
+        """
+        :param ttl: float, lifetime of this entry, defaults to the cache TTL
+        """
+        ttl = self.ttl if ttl is None else ttl
+        self._entries[key] = (time.monotonic() + ttl, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
+
+    def invalidate(self, key: Hashable) -> None:
+        self._epoch += 1
+        self._flight.forget(key)
+        if self._entries.pop(key, None) is not None:
+            CACHE_INVALIDATIONS.labels(self.name).inc()
+
+    def invalidate_where(self, predicate: Callable[[Hashable, Any], bool]) -> None:
+        """
+        Drop every entry matching predicate(key, value)
+        :param predicate: Callable
+        """
+        # In-flight loads may return a matching value too
+        self._epoch += 1
+        for key in [key for key, (_, value) in self._entries.items() if predicate(key, value)]:
+            self.invalidate(key)
+
+    def clear(self) -> None:
+        self._epoch += 1
+        self._entries.clear()
+        self._flight.clear()
+
+    async def get_or_load(self,
+                          key: Hashable,
+                          loader: Callable[[], Awaitable[Any]],
+                          cache_if: Callable[[Any], bool] = lambda value: True
+                          ) -> Any:
+        """
+        Return the cached value or load it, only one loader runs per key
+        :param key: Hashable
+        :param loader: async callable returning the value
+        :param cache_if: values rejected by this predicate are returned but not cached
+        """
+        value = self.get(key)
+        if value is not MISSING:
+            CACHE_REQUESTS.labels(self.name, "hit").inc()
+            return value
+        CACHE_REQUESTS.labels(self.name, "miss").inc()
+
+        epoch = self._epoch
+
+        async def load() -> Any:
+            value = await loader()
+            if epoch == self._epoch and cache_if(value):
+                self.set(key, value)
+            return value
+
+        return await self._flight.do(key, load)
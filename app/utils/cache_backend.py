@@ -0,0 +1,261 @@
+import time
+import json
+import uuid
+import asyncio
+import traceback
+from abc import ABC, abstractmethod
+from typing import Any, Callable
+import bson
+from bson.codec_options import CodecOptions
+from bson.binary import UuidRepresentation
+import redis.asyncio as redis
+from app.utils.cache import MISSING
+from app.utils.logger import Logger
+
+logger = Logger("utils/cache_backend", log_file="cache.log")
+
+# Same representation as the Mongo client, values round-trip unchanged
+CODEC_OPTIONS = CodecOptions(uuid_representation=UuidRepresentation.STANDARD)
+
+
+def encode_value(value: Any) -> bytes:
+    return bson.encode({"value": value}, codec_options=CODEC_OPTIONS)
+
+
+def decode_value(data: bytes) -> Any:
+    return bson.decode(data, codec_options=CODEC_OPTIONS)["value"]
+
+
+class CacheBackend(ABC):
+    """
+    Storage shared by the caches of every worker, and the fan-out of
+    their invalidations.
+
+    Keys are "<namespace>:<key>", values are stored as BSON (documents
+    with ObjectId and datetime round-trip). `publish(namespace, key)` calls
+    the callbacks subscribed to the namespace in every worker, this one
+    included; a key None means "everything in the namespace".
+
+    `shared` tells whether the storage is shared by the workers: an
+    in-process backend would only duplicate the caches of the worker.
+    """
+    shared = False
+
+    def __init__(self) -> None:
+        self._subscribers = {}
+
+    def subscribe(self, namespace: str, callback: Callable[[str | None], None]) -> None:
+        self._subscribers.setdefault(namespace, []).append(callback)
+
+    def dispatch(self, namespace: str, key: str | None) -> None:
+        for callback in self._subscribers.get(namespace, []):
+            try:
+                callback(key)
+            except:
+                logger.error(f"{traceback.format_exc()}")
+
+    def dispatch_all(self) -> None:
+        for namespace in list(self._subscribers):
+            self.dispatch(namespace, None)
+
+    async def start(self) -> None:
+        pass
+
+    async def close(self) -> None:
+        pass
+
+    @abstractmethod
+    async def get(self, namespace: str, key: str) -> Any:
+        """
+        :return: the value, or MISSING
+        """
+
+    @abstractmethod
+    async def get_many(self, namespace: str, keys: list) -> dict:
+        """
+        :return: dict, key -> value of the keys found
+        """
+
+    @abstractmethod
+    async def set(self, namespace: str, key: str, value: Any, ttl: float) -> None:
+        pass
+
+    @abstractmethod
+    async def set_many(self, namespace: str, values: dict, ttl: float) -> None:
+        pass
+
+    @abstractmethod
+    async def delete(self, namespace: str, key: str | None) -> None:
+        """
+        Delete a key, or every key of the namespace when key is None
+        """
+
+    @abstractmethod
+    async def publish(self, namespace: str, key: str | None) -> None:
+        pass
+
+    async def invalidate(self, namespace: str, key: str | None) -> None:
+        """
+        Delete a key from the shared storage, then tell every worker
+        """
+        await self.delete(namespace, key)
+        await self.publish(namespace, key)
+
+
+class InMemoryCacheBackend(CacheBackend):
+    """
+    Backend of a single process (one worker, development, tests)
+    """
+    def __init__(self) -> None:
+        super().__init__()
+        self._entries = {}
+
+    def _get(self, namespace: str, key: str) -> Any:
+        entry = self._entries.get(f"{namespace}:{key}")
+        if entry is None:
+            return MISSING
+        expires_at, data = entry
+        if expires_at <= time.monotonic():
+            self._entries.pop(f"{namespace}:{key}", None)
+            return MISSING
+        return decode_value(data)
+
+    async def get(self, namespace: str, key: str) -> Any:
+        return self._get(namespace, key)
+
+    async def get_many(self, namespace: str, keys: list) -> dict:
+        values = {}
+        for key in keys:
+            value = self._get(namespace, key)
+            if value is not MISSING:
+                values[key] = value
+        return values
+
+    async def set(self, namespace: str, key: str, value: Any, ttl: float) -> None:
+        self._entries[f"{namespace}:{key}"] = (time.monotonic() + ttl, encode_value(value))
+
+    async def set_many(self, namespace: str, values: dict, ttl: float) -> None:
+        for key, value in values.items():
+            await self.set(namespace, key, value, ttl)
+
+    async def delete(self, namespace: str, key: str | None) -> None:
+        if key is not None:
+            self._entries.pop(f"{namespace}:{key}", None)
+        else:
+            for entry_key in [k for k in self._entries if k.startswith(f"{namespace}:")]:
+                self._entries.pop(entry_key, None)
+
+    async def publish(self, namespace: str, key: str | None) -> None:
+        self.dispatch(namespace, key)
+
+
+class RedisCacheBackend(CacheBackend):
+    """
+    Backend shared by the workers through a Redis server. Invalidations
+    are published on a channel every worker subscribes to.
+    """
+    shared = True
+
+    def __init__(self,
+                 url: str,
+                 prefix: str = "aivn:cache:",
+                 channel: str = "aivn:cache:invalidation",
+                 reconnect_delay: float = 1
+                 ) -> None:
+        super().__init__()
+        self.prefix = prefix
+        self.channel = channel
+        self.reconnect_delay = reconnect_delay
+        # Messages published by this worker are dispatched when published
+        self.origin = uuid.uuid4().hex
+        self._redis = redis.from_url(url)
+        self._task = None
+        self._subscribed = asyncio.Event()
+
+    def _key(self, namespace: str, key: str) -> str:
+        return f"{self.prefix}{namespace}:{key}"
+
+    async def start(self) -> None:
+        if self._task is None:
+            self._task = asyncio.create_task(self._listen())
+
+    async def close(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        await self._redis.aclose()
+
+    async def wait_subscribed(self, timeout: float | None = None) -> None:
+        await asyncio.wait_for(self._subscribed.wait(), timeout)
+
+    async def get(self, namespace: str, key: str) -> Any:
+        data = await self._redis.get(self._key(namespace, key))
+        if data is None:
+            return MISSING
+        return decode_value(data)
+
+    async def get_many(self, namespace: str, keys: list) -> dict:
+        if not keys:
+            return {}
+        data = await self._redis.mget([self._key(namespace, key) for key in keys])
+        return {key: decode_value(value) for key, value in zip(keys, data) if value is not None}
+
+    async def set(self, namespace: str, key: str, value: Any, ttl: float) -> None:
+        await self._redis.set(self._key(namespace, key), encode_value(value),
+                              px=max(int(ttl * 1000), 1))
+
+    async def set_many(self, namespace: str, values: dict, ttl: float) -> None:
+        if not values:
+            return
+        async with self._redis.pipeline(transaction=False) as pipe:
+            for key, value in values.items():
+                pipe.set(self._key(namespace, key), encode_value(value),
+                         px=max(int(ttl * 1000), 1))
+            await pipe.execute()
+
+    async def delete(self, namespace: str, key: str | None) -> None:
+        if key is not None:
+            await self._redis.delete(self._key(namespace, key))
+            return
+        keys = [k async for k in self._redis.scan_iter(match=self._key(namespace, "*"))]
+        if keys:
+            await self._redis.delete(*keys)
+
+    async def publish(self, namespace: str, key: str | None) -> None:
+        self.dispatch(namespace, key)
+        message = json.dumps({"origin": self.origin, "namespace": namespace, "key": key})
+        await self._redis.publish(self.channel, message)
+
+    async def _listen(self) -> None:
+        missed = False
+        while True:
+            pubsub = self._redis.pubsub()
+            try:
+                await pubsub.subscribe(self.channel)
+                # Invalidations may have been missed while disconnected
+                if missed:
+                    self.dispatch_all()
+                    missed = False
+                self._subscribed.set()
+                logger.info(f"Listening to the cache invalidations on {self.channel}")
+                async for message in pubsub.listen():
+                    if message["type"] != "message":
+                        continue
+                    data = json.loads(message["data"])
+                    if data["origin"] != self.origin:
+                        self.dispatch(data["namespace"], data["key"])
+            except asyncio.CancelledError:
+                raise
+            except:
+                logger.error(f"{traceback.format_exc()}")
+                missed = True
+                await asyncio.sleep(self.reconnect_delay)
+            finally:
+                try:
+                    await pubsub.aclose()
+                except:
+                    pass
@@ -9,3 +9,25 @@ class MessageException(Exception):
 
     def __str__(self):
         return self.message
+
+
+def is_duplicate_key(error: Exception, *fields: str) -> bool:
+    """
+    Check if a write failed on a unique index over the given fields
+    :param error: Exception, DuplicateKeyError or a write error of a BulkWriteError
+    :param fields: str, any unique index when no field is given
+    :return: bool
+    """
+    if isinstance(error, dict):
+        details, code = error, error.get("code")
+    else:
+        details, code = getattr(error, "details", None) or {}, getattr(error, "code", None)
+    if code != 11000:
+        return False
+    if not fields:
+        return True
+    key_pattern = details.get("keyPattern")
+    if key_pattern is None:
+        # Servers before 4.4 only name the index in the message
+        return all(field in details.get("errmsg", "") for field in fields)
+    return set(fields) <= set(key_pattern)
@@ -1,24 +1,21 @@
-import os
-import random
-import time
+import secrets
 from bson import ObjectId
 
 def generate_id(length=8):
-    """Generates a unique ID string using integers only.
+    """Generates a random ID string using integers only.
+
+    The digits come from the OS cryptographic RNG: concurrent calls are
+    independent, uniqueness is left to a unique index (see add_certificate).
 
     Args:
-        length (int, optional): The desired length of the ID string. Defaults to 10.
+        length (int, optional): The desired length of the ID string. Defaults to 8.
 
     Returns:
         str: The generated ID string.
     """
 
-    # Generate a random integer seed based on current time and process ID
-    seed = int(time.time() * 1000) + os.getpid()
-    random.seed(seed)
-
-    # Generate a random integer within the desired range
-    id_int = random.randint(10 ** (length - 1), 10 ** length - 1)
+    # Random integer within [10 ** (length - 1), 10 ** length - 1]
+    id_int = 10 ** (length - 1) + secrets.randbelow(9 * 10 ** (length - 1))
 
     # Convert the integer to a string and return it
     return str(id_int)
@@ -48,6 +45,16 @@ def convert_id_to_id(data):
         return data
     
 
+def nested_projection(projection: dict, path: str) -> dict:
+    """
+    Projection of an embedded document, e.g. the result of a $lookup
+    :param projection: dict
+    :param path: str, e.g. "contest_info"
+    :return: dict
+    """
+    return {f"{path}.{field}": value for field, value in projection.items()}
+
+
 def is_cohort_permission(user_cohort: int,
                          feasible_cohort: list[int] | None,
                          cohorts: list[int] | None,
@@ -73,17 +80,12 @@ def is_cohort_permission(user_cohort: int,
     if user_cohort == 2100:
         return True
 
-    is_permission = False
-
     # Public resources
     if cohorts is None:
-        is_permission =  True
-    
+        return True
+
     if feasible_cohort is None:
-        is_permission = False
-    
+        return False
+
     # Intersection
-    if (set(feasible_cohort) & set(cohorts)):
-        is_permission = True
-    
-    return is_permission
+    return any(cohort in cohorts for cohort in feasible_cohort)
@@ -0,0 +1,38 @@
+import sys
+import asyncio
+import argparse
+from app.core.indexes import INDEXES, diff_indexes, ensure_indexes
+
+
+async def main(args):
+    if args.apply or args.replace:
+        ensured = await ensure_indexes(replace=args.replace)
+        for collection_name, names in ensured.items():
+            print(f"{collection_name}: {', '.join(names)}")
+
+    diff = await diff_indexes(args.collections or None)
+    in_sync = True
+    for collection_name, result in diff.items():
+        for name in result["missing"]:
+            print(f"missing  {collection_name}.{name}")
+            in_sync = False
+        for name, live_name in result["changed"].items():
+            print(f"changed  {collection_name}.{name} (live: {live_name})")
+            in_sync = False
+        # Not declared, left untouched
+        for name in result["extra"]:
+            print(f"extra    {collection_name}.{name}")
+    print("Indexes in sync" if in_sync else "Indexes out of sync")
+    return 0 if in_sync else 1
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Compare the indexes of app/core/indexes.py with the database")
+    parser.add_argument("collections", nargs="*",
+                        help=f"Collections to compare, all by default: {', '.join(INDEXES)}")
+    parser.add_argument("--apply", action="store_true",
+                        help="Create the missing indexes")
+    parser.add_argument("--replace", action="store_true",
+                        help="Create the missing indexes, rebuild the changed ones")
+    sys.exit(asyncio.run(main(parser.parse_args())))
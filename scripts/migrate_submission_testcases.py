@@ -0,0 +1,51 @@
+from app.core.database import mongo_db
+import asyncio
+from tqdm.asyncio import tqdm
+from pymongo import UpdateOne
+from app.api.v1.controllers.submission import (
+    split_testcase_results,
+    upsert_testcase_results
+)
+
+try:
+    submission_collection = mongo_db["submissions"]
+except Exception as e:
+    exit(1)
+
+BATCH_SIZE = 500
+
+
+async def split_submission_testcases():
+    """
+    Move the embedded testcase results of the submissions to "submission_testcases"
+    and keep the compact verdict in the submission document.
+    Can be re-run safely, the compacted submissions are skipped.
+    """
+    query = {
+        "$or": [
+            {"submitted_problems.public_testcases_results": {"$type": "array"}},
+            {"submitted_problems.private_testcases_results": {"$type": "array"}},
+        ]
+    }
+    total = await submission_collection.count_documents(query)
+    operators = []
+    with tqdm(total=total) as pbar:
+        async for submission in submission_collection.find(query, {"submitted_problems": 1}):
+            submitted_problems, testcase_results = split_testcase_results(submission["submitted_problems"])
+            await upsert_testcase_results(submission["_id"], testcase_results,
+                                          complete=len(testcase_results) == len(submitted_problems))
+            operators.append(UpdateOne(
+                {"_id": submission["_id"]},
+                {"$set": {"submitted_problems": submitted_problems}}
+            ))
+            if len(operators) >= BATCH_SIZE:
+                await submission_collection.bulk_write(operators, ordered=False)
+                operators = []
+            pbar.update(1)
+    if operators:
+        await submission_collection.bulk_write(operators, ordered=False)
+
+    print("Done")
+
+if __name__ == "__main__":
+    asyncio.run(split_submission_testcases())
@@ -1,42 +1,40 @@
 from app.core.database import mongo_db
 import asyncio
 from tqdm.asyncio import tqdm
-from app.utils import generate_id
+from pymongo import UpdateOne
+from app.api.v1.controllers.certificate import allocate_validation_ids
 
-try:
-    certificate_collection = mongo_db["certificate"]
-except Exception as e:
-    exit(1)
+certificate_collection = mongo_db["certificate"]
+
+# Certificates updated per bulk write
+BATCH_SIZE = 500
 
 
 async def main():
-    certificate = []
-    async for cert in certificate_collection.find():
-        certificate.append(cert)
-    
-    with tqdm(total=len(certificate)) as pbar:
-        for cert in certificate:
-            new_id = generate_id()
-            while await certificate_collection.find_one({"validation_id": new_id}):
-                new_id = generate_id()
-            updated_cert = await certificate_collection.update_one(
-                {"_id": cert["_id"]}, 
-                {"$set": {
-                    "validation_id": new_id
-                }}
-            )
-            if updated_cert.modified_count == 0:
-                print("Failed to update certificate with ID: ", cert["_id"])
-            pbar.update(1)
-    print("Done")
+    certificate_ids = [cert["_id"] async for cert in certificate_collection.find({}, {"_id": 1})]
 
-    certificate = []
-    async for cert in certificate_collection.find():
-        certificate.append(cert)
+    # Distinct from each other and from every current validation_id
+    new_ids = await allocate_validation_ids(len(certificate_ids))
+    if isinstance(new_ids, Exception):
+        print("Failed to allocate validation ids: ", new_ids)
+        return
+
+    with tqdm(total=len(certificate_ids)) as pbar:
+        for start in range(0, len(certificate_ids), BATCH_SIZE):
+            operations = [
+                UpdateOne({"_id": id}, {"$set": {"validation_id": new_id}})
+                for id, new_id in zip(certificate_ids[start:start + BATCH_SIZE],
+                                      new_ids[start:start + BATCH_SIZE])
+            ]
+            result = await certificate_collection.bulk_write(operations, ordered=False)
+            if result.matched_count != len(operations):
+                print("Failed to update some certificates of the batch starting at ", start)
+            pbar.update(len(operations))
+    print("Done")
 
-    certificate = [cer["validation_id"] for cer in certificate]
+    certificate = await certificate_collection.distinct("validation_id")
     # Check duplicates
-    if len(certificate) != len(set(certificate)):
+    if len(certificate) != len(certificate_ids):
         print("Duplicates found")
     else:
         print("No duplicates found")